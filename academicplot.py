@@ -2,20 +2,22 @@
 """
 AcademicPlot Pro - Main Entry Point
 A web application for beautifying academic plots with AI-powered translation and styling.
+
+Usage:
+    python academicplot.py                   # start the web server
+    python academicplot.py convert DIR ...   # convert a directory tree from the command line
 """
 
 import sys
 import os
 import logging
 from pathlib import Path
-from waitress import serve
 
 
 # Add the src directory to Python path
 src_path = Path(__file__).parent / 'src'
 sys.path.insert(0, str(src_path))
 
-from web.app import app
 def setup_logging():
     """Sets up the application logging for production."""
     logging.basicConfig(
@@ -30,8 +32,12 @@ def setup_logging():
     console.setFormatter(formatter)
     logging.getLogger('').addHandler(console)
 
-def main():
-    """Main function to start the production web application"""
+def serve_app():
+    """Start the production web application"""
+    # Imported here so the command-line converter does not need Flask or waitress
+    from waitress import serve
+    from web.app import app
+
     setup_logging()
 
     logging.info("AcademicPlot Pro - Starting Production Server with Waitress")
@@ -47,5 +53,14 @@ def main():
     # use waitress.serve to run application
     serve(app, host='127.0.0.1', port=5000)
 
+def main(argv=None):
+    """Dispatch to the batch converter for `convert`, otherwise start the web server"""
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == 'convert':
+        from core.cli import main as convert_main
+        return convert_main(argv[1:])
+    serve_app()
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+文本提取器对比基准：单次遍历的 extract_translatable_spans 与旧实现。
+
+旧实现（下方 legacy_extract_spans，即改用显式栈遍历之前基于 tokenize 的版本，不是最初的逐行扫描器）
+对 TARGET_PLOT_FUNCTIONS 做 ast.walk，再逐个 COMMENT 记号扫描整行注释；新实现用显式栈做一次 ast 遍历，
+跳过数值叶子节点，再加一次 tokenize 扫描，
+额外覆盖 annotate、刻度标签、label= 关键字参数、colorbar 标签、f-string 和行尾注释。
+输出每种语料规模下两者的中位耗时和提取到的文本数。
+
+用法:
+    python benchmarks/bench_extract.py
+    python benchmarks/bench_extract.py --presets large,mixed --repeat 50 --output extract.json
+"""
+
+import argparse
+import ast
+import io
+import json
+import platform
+import re
+import sys
+import time
+import tokenize
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from bench_stages import time_stage  # noqa: E402
+from core.rewrite import SourceIndex, TextSpan, extract_translatable_spans  # noqa: E402
+from corpus import PRESETS, generate_script  # noqa: E402
+
+LEGACY_TARGET_FUNCTIONS = {
+    'title', 'xlabel', 'ylabel', 'suptitle',
+    'set_title', 'set_xlabel', 'set_ylabel', 'text', 'legend'
+}
+_HAS_LETTER_RE = re.compile('[a-zA-Z]')
+
+
+def legacy_extract_spans(source: str, tree: ast.AST) -> List[TextSpan]:
+    """替换前的提取逻辑，仅用于对比。"""
+    index = SourceIndex(source)
+    spans: List[TextSpan] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and hasattr(node.func, 'attr') and node.func.attr in LEGACY_TARGET_FUNCTIONS:
+            for value in list(node.args) + [kw.value for kw in node.keywords]:
+                if isinstance(value, ast.Constant) and isinstance(value.value, str) and value.value.strip():
+                    start, end = index.node_span(value)
+                    spans.append(TextSpan(start, end, value.value, 'string'))
+    for token in tokenize.generate_tokens(io.StringIO(source).readline):
+        if token.type != tokenize.COMMENT or token.line[:token.start[1]].strip():
+            continue
+        comment_text = token.string[1:].strip()
+        if comment_text and _HAS_LETTER_RE.search(comment_text):
+            text_start = index.char_offset(*token.start) + token.string.index(comment_text, 1)
+            spans.append(TextSpan(text_start, text_start + len(comment_text), comment_text, 'comment'))
+    spans.sort(key=lambda span: span.start)
+    return spans
+
+
+def count_kinds(spans: List[TextSpan]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for span in spans:
+        counts[span.kind] = counts.get(span.kind, 0) + 1
+    return counts
+
+
+def run(presets: List[str], repeat: int, seed: int) -> Dict[str, Any]:
+    results = {}
+    for preset in presets:
+        code = generate_script(PRESETS[preset], seed)
+        tree = ast.parse(code)
+        legacy = legacy_extract_spans(code, tree)
+        current = extract_translatable_spans(code, tree)
+        results[preset] = {
+            'size_bytes': len(code.encode('utf-8')),
+            'legacy': dict(time_stage(lambda: legacy_extract_spans(code, tree), repeat), spans=count_kinds(legacy)),
+            'current': dict(time_stage(lambda: extract_translatable_spans(code, tree), repeat),
+                            spans=count_kinds(current)),
+        }
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'repeat': repeat,
+            'seed': seed,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='文本提取器对比基准')
+    parser.add_argument('--presets', default=','.join(PRESETS), help='逗号分隔的语料规模，默认全部')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    presets = [name.strip() for name in args.presets.split(',') if name.strip()]
+    unknown = [name for name in presets if name not in PRESETS]
+    if unknown:
+        parser.error(f"未知的语料规模: {', '.join(unknown)}")
+
+    report = run(presets, args.repeat, args.seed)
+    for preset, result in report['results'].items():
+        print(f"\n[{preset}] {result['size_bytes']} bytes")
+        for name in ('legacy', 'current'):
+            timing = result[name]
+            total = sum(timing['spans'].values())
+            print(f"  {name:<8} median {timing['median_ms']:9.3f} ms   min {timing['min_ms']:9.3f} ms   "
+                  f"{total:5d} spans {json.dumps(timing['spans'])}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已写入 {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+流水线各本地阶段的微基准测试。
+
+用 corpus.py 生成不同规模的合成绘图脚本，分别计时 AST 提取、译文重建、
+inject_chinese_font_support、create_academic_style_code_block、inject_savefig_before_show 等阶段，
+并以桩函数代替 DeepSeek 调用跑一遍完整流水线。结果输出为 JSON，可与基线文件对比，
+任一阶段的中位耗时超出基线一定比例时以非零状态退出。
+
+用法:
+    python benchmarks/bench_stages.py --output bench.json
+    python benchmarks/bench_stages.py --baseline bench.json --threshold 0.25
+"""
+
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# 基准测试不读写本地缓存，也不访问网络；环境变量需在导入核心模块之前设置
+os.environ['TRANSLATION_CACHE_ENABLED'] = '0'
+os.environ['RESULT_CACHE_ENABLED'] = '0'
+os.environ.setdefault('DEEPSEEK_API_KEY', 'benchmark-stub')
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from core import enhanced_agent  # noqa: E402
+from core.elision import elide_literals  # noqa: E402
+from core.rewrite import apply_translations, extract_translatable_spans  # noqa: E402
+from corpus import PRESETS, generate_script  # noqa: E402
+
+ACADEMIC_OPTIONS = {
+    'enabled': True,
+    'paper_format': 'nature',
+    'layout': 'single',
+    'vector_format': 'pdf',
+    'dpi': 300,
+}
+
+
+# --- DeepSeek 桩函数 ---
+
+def stub_call_deepseek_api(prompt: str, is_json_mode: bool = False) -> Optional[str]:
+    """翻译请求：原样返回输入 JSON，每个值加上前缀，模拟译文。"""
+    if is_json_mode:
+        payload = json.loads(prompt[prompt.index('{'):prompt.rindex('}') + 1])
+        return json.dumps({key: f"译{value}" for key, value in payload.items()}, ensure_ascii=False)
+    return stub_refactor(prompt)
+
+
+def stub_refactor(prompt: str) -> str:
+    """重构请求：返回提示词中附带的原始脚本。"""
+    return prompt.rsplit('```python', 1)[1].rsplit('```', 1)[0].strip() + '\n'
+
+
+def stub_call_deepseek_api_streaming(prompt: str):
+    code = stub_refactor(prompt)
+    for i in range(0, len(code), 64):
+        yield code[i:i + 64]
+    return code
+
+
+def install_stub_llm() -> None:
+    enhanced_agent.call_deepseek_api = stub_call_deepseek_api
+    enhanced_agent.call_deepseek_api_streaming = stub_call_deepseek_api_streaming
+
+
+# --- 计时 ---
+
+def time_stage(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {'median_ms': statistics.median(samples), 'min_ms': min(samples)}
+
+
+def drain(generator) -> Any:
+    while True:
+        try:
+            next(generator)
+        except StopIteration as stop:
+            return stop.value
+
+
+def benchmark_script(code: str, repeat: int) -> Dict[str, Dict[str, float]]:
+    tree = ast.parse(code)
+    spans = extract_translatable_spans(code, tree)
+    translation_map = {span.text: f"译{span.text}" for span in spans}
+    code_lines = code.split('\n')
+
+    stages = {
+        'parse': lambda: ast.parse(code),
+        'extract': lambda: extract_translatable_spans(code, ast.parse(code)),
+        'rebuild': lambda: apply_translations(code, spans, translation_map),
+        'inject_chinese_font_support': lambda: enhanced_agent.inject_chinese_font_support(list(code_lines)),
+        'create_academic_style_code_block': lambda: enhanced_agent.create_academic_style_code_block(ACADEMIC_OPTIONS),
+        'inject_savefig_before_show': lambda: enhanced_agent.inject_savefig_before_show(
+            list(code_lines), 'pdf', 'bench.py', 300),
+        'style_engine': lambda: enhanced_agent.apply_local_academic_style(code, ACADEMIC_OPTIONS, 'bench.py'),
+        'elide_literals': lambda: elide_literals(code),
+        'pipeline_stub_llm': lambda: drain(enhanced_agent.process_code_streaming(
+            code, 'bench.py', beautify=True, academic_options=dict(ACADEMIC_OPTIONS))),
+    }
+    return {name: time_stage(func, repeat) for name, func in stages.items()}
+
+
+def run_benchmarks(presets: List[str], repeat: int, seed: int) -> Dict[str, Any]:
+    install_stub_llm()
+    results = {}
+    for preset in presets:
+        code = generate_script(PRESETS[preset], seed)
+        results[preset] = {
+            'spec': PRESETS[preset]._asdict(),
+            'size_bytes': len(code.encode('utf-8')),
+            'stages': benchmark_script(code, repeat),
+        }
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat,
+            'seed': seed,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float, min_delta_ms: float) -> List[str]:
+    """返回超出基线的阶段描述；变化小于 min_delta_ms 的阶段视为计时噪声忽略。"""
+    regressions = []
+    for preset, result in current['results'].items():
+        base_stages = baseline.get('results', {}).get(preset, {}).get('stages', {})
+        for stage, timing in result['stages'].items():
+            base = base_stages.get(stage)
+            if not base:
+                continue
+            now, before = timing['median_ms'], base['median_ms']
+            if now - before > min_delta_ms and now > before * (1 + threshold):
+                regressions.append(f"{preset}/{stage}: {before:.3f} ms -> {now:.3f} ms (+{(now / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def print_table(report: Dict[str, Any]) -> None:
+    for preset, result in report['results'].items():
+        print(f"\n[{preset}] {result['size_bytes']} bytes")
+        for stage, timing in result['stages'].items():
+            print(f"  {stage:<34} median {timing['median_ms']:9.3f} ms   min {timing['min_ms']:9.3f} ms")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='流水线本地阶段微基准测试')
+    parser.add_argument('--presets', default=','.join(PRESETS), help='逗号分隔的语料规模，默认全部')
+    parser.add_argument('--repeat', type=int, default=20, help='每个阶段的重复次数')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='把结果写入 JSON 文件')
+    parser.add_argument('--baseline', help='与该 JSON 结果对比，出现退化时以状态码 1 退出')
+    parser.add_argument('--threshold', type=float, default=0.25, help='允许的中位耗时增幅比例')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help='小于该差值的变化视为噪声')
+    args = parser.parse_args()
+
+    presets = [name.strip() for name in args.presets.split(',') if name.strip()]
+    unknown = [name for name in presets if name not in PRESETS]
+    if unknown:
+        parser.error(f"未知的语料规模: {', '.join(unknown)}")
+
+    # 流水线内部的进度输出会干扰结果表格
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            report = run_benchmarks(presets, args.repeat, args.seed)
+        finally:
+            sys.stdout = stdout
+    print_table(report)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\n结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print(f"\n以下阶段比基线慢 {args.threshold * 100:.0f}% 以上:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("\n未发现超出阈值的性能退化。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
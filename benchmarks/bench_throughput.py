@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+流水线吞吐量与并发基准测试。
+
+并发处理若干合成脚本，经过真实的 DeepSeekClient（连接池、重试、流式解析），
+后端可以是本地桩服务器（--stub，默认）或录像回放（DEEPSEEK_TRANSPORT=replay）。
+输出每秒处理文件数以及单个文件耗时的分位数，结果可写入 JSON。
+
+用法:
+    python benchmarks/bench_throughput.py --files 40 --workers 8 --stub-latency 0.2
+    DEEPSEEK_TRANSPORT=record DEEPSEEK_API_KEY=sk-... python benchmarks/bench_throughput.py --no-stub --files 5
+    DEEPSEEK_TRANSPORT=replay DEEPSEEK_REPLAY_LATENCY=0.3 python benchmarks/bench_throughput.py --no-stub --files 5
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
+sys.path.insert(0, str(Path(__file__).parent))
+
+from corpus import PRESETS, generate_script  # noqa: E402
+from deepseek_stub import start_stub_server  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='流水线吞吐量基准测试')
+    parser.add_argument('--files', type=int, default=20, help='处理的脚本数量')
+    parser.add_argument('--workers', type=int, default=4, help='并发处理的脚本数')
+    parser.add_argument('--preset', default='small', choices=sorted(PRESETS))
+    parser.add_argument('--no-stub', action='store_true', help='不启动桩服务器，使用当前环境配置的传输层')
+    parser.add_argument('--stub-latency', type=float, default=0.1, help='桩服务器每个请求的首字节延迟（秒）')
+    parser.add_argument('--stub-tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--stub-error-rate', type=float, default=0.0)
+    parser.add_argument('--output', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    stub = None
+    if not args.no_stub:
+        stub = start_stub_server(latency=args.stub_latency, tokens_per_second=args.stub_tokens_per_second,
+                                 error_rate=args.stub_error_rate)
+        os.environ['DEEPSEEK_API_URL'] = stub.url
+        os.environ['DEEPSEEK_API_KEY'] = 'benchmark-stub'
+        os.environ['DEEPSEEK_TRANSPORT'] = 'live'
+    # 每个脚本内容不同，但仍关闭缓存，保证每次运行都真实经过传输层
+    os.environ['TRANSLATION_CACHE_ENABLED'] = '0'
+    os.environ['RESULT_CACHE_ENABLED'] = '0'
+
+    from core.enhanced_agent import process_code_streaming  # 环境变量需在导入之前设置
+
+    scripts = [generate_script(PRESETS[args.preset], seed) for seed in range(args.files)]
+    options = {'enabled': True, 'paper_format': 'nature', 'layout': 'single', 'vector_format': 'pdf'}
+
+    def run(code):
+        started = time.perf_counter()
+        stream = process_code_streaming(code, 'bench.py', beautify=True, academic_options=dict(options))
+        while True:
+            try:
+                next(stream)
+            except StopIteration as stop:
+                return time.perf_counter() - started, stop.value is not None
+
+    with open(os.devnull, 'w') as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                outcomes = list(executor.map(run, scripts))
+            elapsed = time.perf_counter() - started
+        finally:
+            sys.stdout = stdout
+
+    latencies = [latency for latency, _ in outcomes]
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'preset': args.preset,
+            'files': args.files,
+            'workers': args.workers,
+            'transport': 'stub' if stub else os.getenv('DEEPSEEK_TRANSPORT', 'live'),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'elapsed_seconds': elapsed,
+        'files_per_second': args.files / elapsed if elapsed else 0.0,
+        'succeeded': sum(1 for _, ok in outcomes if ok),
+        'latency_seconds': {
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 0.95),
+            'max': max(latencies),
+        },
+        'api_requests': stub.requests if stub else None,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    if stub:
+        stub.shutdown()
+    return 0 if report['succeeded'] == args.files else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
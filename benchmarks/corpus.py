@@ -0,0 +1,124 @@
+"""
+合成 matplotlib 绘图脚本语料，用于基准测试。
+
+脚本规模由子图数量、每个子图的文本标签数、注释行数和内联数据点数控制，子图可以画在同一幅图中，也可以各自成图；
+同样的参数与随机种子总是生成同样的脚本，方便对比不同版本的测试结果。
+"""
+
+import math
+import random
+from typing import Dict, NamedTuple
+
+_WORDS = [
+    'training', 'validation', 'loss', 'accuracy', 'epoch', 'learning', 'rate', 'signal',
+    'response', 'temperature', 'pressure', 'baseline', 'proposed', 'method', 'error',
+    'frequency', 'amplitude', 'time', 'distribution', 'sample', 'model', 'dataset',
+]
+
+
+class CorpusSpec(NamedTuple):
+    subplots: int
+    labels: int       # 每个子图的文本标签数（标题、坐标轴、文字注记、图例）
+    comments: int     # 整行注释总数
+    data_points: int  # 内联数据字面量中的数值总数
+    # 额外生成 annotate、刻度标签、f-string 标题、colorbar 标签和行尾注释
+    rich_text: bool = False
+    # 每个子图单独成图（各自 plt.subplots ... plt.show()），模拟产出多幅图的长分析脚本
+    separate_figures: bool = False
+
+
+PRESETS: Dict[str, CorpusSpec] = {
+    'small': CorpusSpec(subplots=1, labels=4, comments=5, data_points=100),
+    'medium': CorpusSpec(subplots=4, labels=8, comments=30, data_points=2000),
+    'large': CorpusSpec(subplots=16, labels=12, comments=120, data_points=20000),
+    'mixed': CorpusSpec(subplots=16, labels=12, comments=120, data_points=20000, rich_text=True),
+    'figures': CorpusSpec(subplots=12, labels=6, comments=60, data_points=6000, separate_figures=True),
+}
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    text = ' '.join(rng.choice(_WORDS) for _ in range(words))
+    return text[0].upper() + text[1:]
+
+
+def generate_script(spec: CorpusSpec, seed: int = 0) -> str:
+    """生成一个符合 spec 规模的绘图脚本。"""
+    rng = random.Random(seed)
+    cols = math.ceil(math.sqrt(spec.subplots))
+    rows = math.ceil(spec.subplots / cols)
+    lines = [
+        'import numpy as np',
+        'import matplotlib.pyplot as plt',
+        '',
+    ]
+
+    # 注释均匀分布在各子图的代码之间
+    comments_left = spec.comments
+    comment_slots = spec.subplots + 1
+
+    def add_comments(slot: int) -> None:
+        nonlocal comments_left
+        count = comments_left // (comment_slots - slot)
+        for _ in range(count):
+            lines.append(f'# {_phrase(rng, rng.randint(3, 8))}')
+        comments_left -= count
+
+    add_comments(0)
+    per_series = max(1, spec.data_points // spec.subplots)
+    for i in range(spec.subplots):
+        values = ', '.join(f'{rng.uniform(-100, 100):.4f}' for _ in range(per_series))
+        lines.append(f'DATA_{i} = [{values}]')
+    if not spec.separate_figures:
+        lines.append('')
+        lines.append(f'fig, axes = plt.subplots({rows}, {cols}, figsize=(8, 6))')
+        lines.append('axes = np.atleast_1d(axes).ravel()')
+
+    for i in range(spec.subplots):
+        lines.append('')
+        add_comments(i + 1)
+        if spec.separate_figures:
+            lines.append('fig, ax = plt.subplots(figsize=(6, 4))')
+            lines.append('axes = {%d: ax}' % i)
+        lines.append(f"axes[{i}].plot(DATA_{i}, label='{_phrase(rng, 3)}')")
+        if spec.rich_text:
+            lines.extend([
+                f"points = axes[{i}].scatter(DATA_{i}, DATA_{i}, c=DATA_{i}, label='{_phrase(rng, 2)}')"
+                f"  # {_phrase(rng, rng.randint(2, 5))}",
+                f"fig.colorbar(points, ax=axes[{i}], label='{_phrase(rng, 2)}')",
+                f"axes[{i}].annotate('{_phrase(rng, 3)}', xy=(0.5, 0.5), xytext=(0.6, 0.7))",
+                f"axes[{i}].set_xticklabels(['{_phrase(rng, 1)}', '{_phrase(rng, 1)}', '{_phrase(rng, 1)}'])",
+                f"axes[{i}].set_title(f'{_phrase(rng, 2)} {{len(DATA_{i})}} {_phrase(rng, 1).lower()}')",
+            ])
+        setters = ['set_title', 'set_xlabel', 'set_ylabel']
+        for j in range(spec.labels):
+            if j < len(setters):
+                lines.append(f"axes[{i}].{setters[j]}('{_phrase(rng, rng.randint(2, 5))}')")
+            elif j == spec.labels - 1:
+                lines.append(f"axes[{i}].legend(['{_phrase(rng, 2)}'])")
+            else:
+                x, y = rng.uniform(0, 1), rng.uniform(0, 1)
+                lines.append(f"axes[{i}].text({x:.2f}, {y:.2f}, '{_phrase(rng, rng.randint(2, 6))}')")
+        if spec.separate_figures:
+            lines.extend(['plt.tight_layout()', 'plt.show()'])
+
+    if spec.separate_figures:
+        lines.append('')
+        return '\n'.join(lines)
+    lines.extend([
+        '',
+        f"plt.suptitle('{_phrase(rng, 4)}')",
+        'plt.tight_layout()',
+        'plt.show()',
+        '',
+    ])
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='输出一个合成的绘图脚本')
+    parser.add_argument('preset', nargs='?', default='small', choices=sorted(PRESETS))
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    print(generate_script(PRESETS[args.preset], args.seed))
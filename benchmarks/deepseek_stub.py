@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容的 DeepSeek 桩服务器，用于离线压测与基准测试。
+
+- JSON 模式（翻译请求）：解析提示词中的 JSON 对象，给每个值加上 "译" 前缀后返回；
+- 普通请求（重构请求）：返回提示词中 ```python 代码块里的原始脚本；
+- 支持 stream=true 的 SSE 流式输出，可按 token 速率分段发送，并在末尾附带 usage；
+- 可配置首字节延迟和随机 503 错误率（带 Retry-After），用于观察重试与并发行为。
+
+用法:
+    python benchmarks/deepseek_stub.py --port 18080 --latency 0.5 --tokens-per-second 200
+    DEEPSEEK_API_URL=http://127.0.0.1:18080/chat/completions DEEPSEEK_API_KEY=stub python academicplot.py
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Tuple
+
+
+def build_reply(request: Dict[str, Any]) -> str:
+    prompt = (request.get('messages') or [{}])[-1].get('content', '')
+    if (request.get('response_format') or {}).get('type') == 'json_object':
+        try:
+            payload = json.loads(prompt[prompt.index('{'):prompt.rindex('}') + 1])
+        except ValueError:
+            payload = {}
+        return json.dumps({key: f"译{value}" for key, value in payload.items()}, ensure_ascii=False)
+    if '```python' in prompt:
+        return prompt.rsplit('```python', 1)[1].rsplit('```', 1)[0].strip() + '\n'
+    return prompt
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'StubServer'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Tuple[Tuple[str, str], ...] = ()) -> None:
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'invalid JSON body'}})
+            return
+
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and server.rng_random() < server.error_rate:
+            self._send_json(503, {'error': {'message': 'stub overloaded'}}, (('Retry-After', '1'),))
+            return
+
+        reply = build_reply(request)
+        prompt_text = json.dumps(request.get('messages'), ensure_ascii=False)
+        usage = {'prompt_tokens': estimate_tokens(prompt_text), 'completion_tokens': estimate_tokens(reply)}
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+
+        if not request.get('stream'):
+            self._send_json(200, {
+                'id': 'stub', 'object': 'chat.completion', 'model': request.get('model'),
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+                'usage': usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        # 每个分块约 4 个字符（一个 token），按 tokens_per_second 控制输出速度
+        chunk_chars = 4 * server.tokens_per_chunk
+        delay = server.tokens_per_chunk / server.tokens_per_second if server.tokens_per_second else 0
+        for i in range(0, len(reply), chunk_chars):
+            chunk = {'choices': [{'index': 0, 'delta': {'content': reply[i:i + chunk_chars]}}]}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            if delay:
+                time.sleep(delay)
+        if (request.get('stream_options') or {}).get('include_usage'):
+            self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode('utf-8'))
+        self._write_chunk(b'data: [DONE]\n\n')
+        self.wfile.write(b'0\r\n\r\n')
+        self.wfile.flush()
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, tokens_per_second: float = 0.0,
+                 tokens_per_chunk: int = 4, error_rate: float = 0.0, seed: int = 0, verbose: bool = False):
+        super().__init__(address, StubHandler)
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.tokens_per_chunk = max(1, tokens_per_chunk)
+        self.error_rate = error_rate
+        self.verbose = verbose
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def rng_random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/chat/completions"
+
+
+def start_stub_server(host: str = '127.0.0.1', port: int = 0, **options) -> StubServer:
+    """在后台线程中启动桩服务器；port=0 时自动选择空闲端口，地址见 server.url。"""
+    server = StubServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name='deepseek-stub', daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='本地 OpenAI 兼容的 DeepSeek 桩服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的首字节延迟（秒）')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0, help='流式输出速率，0 表示不限速')
+    parser.add_argument('--tokens-per-chunk', type=int, default=4, help='每个流式分块包含的 token 数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='随机返回 503 的概率')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = StubServer((args.host, args.port), latency=args.latency, tokens_per_second=args.tokens_per_second,
+                        tokens_per_chunk=args.tokens_per_chunk, error_rate=args.error_rate, seed=args.seed,
+                        verbose=args.verbose)
+    print(f"DeepSeek 桩服务器已启动: {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
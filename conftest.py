@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# 源码位于 src/ 下，以 core.* / web.* 的形式导入
+sys.path.insert(0, str(Path(__file__).parent / 'src'))
@@ -0,0 +1,139 @@
+import copy
+import os
+import queue
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Generator, List, Optional, Set, Tuple
+
+from core.enhanced_agent import PARTIAL_PREFIX, process_python_file_streaming
+from core.status import status_sink
+
+# --- 配置区 ---
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+BATCH_MAX_FILES = int(os.getenv('BATCH_MAX_FILES', '100'))
+BATCH_MAX_UNCOMPRESSED_BYTES = int(os.getenv('BATCH_MAX_UNCOMPRESSED_BYTES', str(64 * 1024 * 1024)))
+
+_DONE = object()
+
+
+class BatchError(ValueError):
+    """批量上传内容不合法（文件过多、压缩包损坏或解压后过大）。"""
+
+
+def unique_filename(name: str, used_names: Set[str]) -> str:
+    """返回不与 used_names 重复的文件名（plot.py 已存在时依次尝试 plot_2.py、plot_3.py ...），并登记到 used_names。"""
+    stem, ext = os.path.splitext(name)
+    candidate = name
+    number = 2
+    while candidate in used_names:
+        candidate = f"{stem}_{number}{ext}"
+        number += 1
+    used_names.add(candidate)
+    return candidate
+
+
+def extract_python_files_from_zip(zip_path: str, dest_folder: str, safe_name,
+                                  used_names: Optional[Set[str]] = None,
+                                  renamed: Optional[List[Tuple[str, str]]] = None) -> List[str]:
+    """
+    从 zip 中解压所有 .py 脚本和 .ipynb 笔记本到 dest_folder（目录结构压平为文件名），返回解压后的路径。
+    safe_name 用于清理文件名（例如 werkzeug 的 secure_filename）。
+    压平后与 used_names（同一批次中已有的文件名）重名的文件加上数字后缀，(压缩包内路径, 新文件名) 记入 renamed。
+    """
+    used_names = set() if used_names is None else used_names
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile as e:
+        raise BatchError(f"无法读取压缩包: {e}")
+
+    extracted = []
+    with archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(('.py', '.ipynb'))
+            and not info.filename.startswith('__MACOSX/')
+        ]
+        if len(members) > BATCH_MAX_FILES:
+            raise BatchError(f"压缩包中的 Python 文件和笔记本超过上限 {BATCH_MAX_FILES} 个")
+        if sum(info.file_size for info in members) > BATCH_MAX_UNCOMPRESSED_BYTES:
+            raise BatchError("压缩包解压后体积过大")
+
+        for info in members:
+            # 子目录中的同名文件压平后用路径区分，例如 fig1/plot.py -> fig1_plot.py
+            flattened = safe_name(info.filename.replace('/', '_').replace('\\', '_'))
+            if not flattened:
+                continue
+            name = unique_filename(flattened, used_names)
+            if name != flattened and renamed is not None:
+                renamed.append((info.filename, name))
+            path = os.path.join(dest_folder, name)
+            with archive.open(info) as src, open(path, 'wb') as dst:
+                dst.write(src.read())
+            extracted.append(path)
+    return extracted
+
+
+def process_batch_streaming(filepaths: List[str], output_folder: str, beautify: bool = False,
+                            academic_options: Optional[Dict[str, Any]] = None,
+                            max_workers: int = BATCH_MAX_WORKERS,
+                            finished: Optional[threading.Event] = None) -> Generator[Tuple[str, str], None, Dict[str, Optional[str]]]:
+    """
+    在有界线程池中并发处理多个文件，逐条产出 (文件名, 状态)。
+    生成器的返回值为 {文件名: 输出文件名}，处理失败的文件对应 None。
+    生成器结束或被关闭后，尚未开始的文件被取消；给出 finished 时，正在处理的文件全部结束后将其置位，
+    调用方据此判断何时可以删除输入文件。
+    """
+    events: "queue.Queue" = queue.Queue()
+    results: Dict[str, Optional[str]] = {os.path.basename(path): None for path in filepaths}
+
+    def run(path: str) -> None:
+        name = os.path.basename(path)
+        try:
+            # 每个文件使用独立的选项副本，避免线程间互相修改
+            with status_sink(lambda message: events.put((name, message))):
+                for status in process_python_file_streaming(path, output_folder, beautify, copy.deepcopy(academic_options)):
+                    # 批量模式下不转发模型的逐段输出，只保留进度状态
+                    if not status.startswith(PARTIAL_PREFIX):
+                        events.put((name, status))
+        except Exception as e:
+            events.put((name, f"处理失败: {e}"))
+        finally:
+            events.put((name, _DONE))
+
+    if not filepaths:
+        if finished is not None:
+            finished.set()
+        return results
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(filepaths))))
+    try:
+        for path in filepaths:
+            executor.submit(run, path)
+        remaining = len(filepaths)
+        while remaining:
+            name, status = events.get()
+            if status is _DONE:
+                remaining -= 1
+                continue
+            if status.startswith("SUCCESS:"):
+                results[name] = status.split(":", 1)[1].strip()
+            yield name, status
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if finished is not None:
+            # 已经开始的文件无法取消，在后台等它们结束，不阻塞生成器的关闭
+            threading.Thread(target=_set_when_idle, args=(executor, finished), name='batch-drain', daemon=True).start()
+    return results
+
+
+def _set_when_idle(executor: ThreadPoolExecutor, finished: threading.Event) -> None:
+    executor.shutdown(wait=True)
+    finished.set()
+
+
+def build_output_zip(output_folder: str, output_filenames: List[str], zip_path: str) -> None:
+    """把所有输出文件打包为一个 zip。"""
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename in output_filenames:
+            archive.write(os.path.join(output_folder, filename), arcname=filename)
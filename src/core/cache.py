@@ -0,0 +1,299 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+# --- 配置区 ---
+CACHE_DIR = os.getenv('ACADEMICPLOT_CACHE_DIR', str(Path(__file__).parent.parent.parent / 'uploads' / 'cache'))
+TRANSLATION_CACHE_ENABLED = os.getenv('TRANSLATION_CACHE_ENABLED', '1') != '0'
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv('TRANSLATION_CACHE_MAX_ENTRIES', '50000'))
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', '1') != '0'
+RESULT_CACHE_TTL_SECONDS = float(os.getenv('RESULT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+
+def normalize_source_text(text: str) -> str:
+    """规范化待翻译原文：去除首尾空白并合并连续空白，作为缓存键。"""
+    return ' '.join(text.split())
+
+
+def normalize_style_options(style_options: Dict[str, Any]) -> Dict[str, Any]:
+    """提取影响重构结果的选项并补全默认值，使等价的选项得到相同的缓存键。"""
+    custom_mode = bool(style_options.get('custom_mode'))
+    return {
+        'enabled': bool(style_options.get('enabled')),
+        'beautify_layout': bool(style_options.get('beautify_layout')),
+        'fast_mode': bool(style_options.get('fast_mode')),
+        'paper_format': style_options.get('paper_format') or 'nature',
+        'layout': style_options.get('layout') or 'single',
+        'vector_format': style_options.get('vector_format') or None,
+        'dpi': style_options.get('dpi') or 300,
+        'custom_mode': custom_mode,
+        'custom_params': dict(sorted((style_options.get('custom_params') or {}).items())) if custom_mode else {},
+        'output_filename_base': style_options.get('output_filename_base', 'figure'),
+    }
+
+
+def style_options_key(style_options: Dict[str, Any]) -> str:
+    """规范化选项的哈希；选项等价时相同。"""
+    return hashlib.sha256(json.dumps(normalize_style_options(style_options), sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def result_cache_key(code: str, style_options: Dict[str, Any]) -> str:
+    """由代码内容哈希与规范化后的选项生成内容寻址的缓存键。"""
+    payload = {
+        'code': hashlib.sha256(code.encode('utf-8')).hexdigest(),
+        'options': normalize_style_options(style_options),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class _SQLiteCache:
+    """SQLite 缓存的公共部分：自动提交连接、WAL 模式和线程锁。"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+
+class TranslationCache(_SQLiteCache):
+    """
+    基于 SQLite 的逐条译文缓存，键为 (规范化原文, 目标语言)。
+    超过 max_entries 时按最近使用时间淘汰（LRU），可在多个线程间共享。
+    """
+
+    def __init__(self, db_path: str, max_entries: int = TRANSLATION_CACHE_MAX_ENTRIES):
+        super().__init__(db_path)
+        self.max_entries = max_entries
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            " source TEXT NOT NULL,"
+            " lang TEXT NOT NULL,"
+            " translation TEXT NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " PRIMARY KEY (source, lang))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations (last_used)")
+
+    def get_many(self, texts: Iterable[str], lang: str) -> Dict[str, str]:
+        """批量查询译文，返回 {原文: 译文}，只包含命中的条目。"""
+        keys = {}
+        for text in texts:
+            keys.setdefault(normalize_source_text(text), []).append(text)
+        if not keys:
+            return {}
+
+        found = {}
+        now = time.time()
+        with self._lock:
+            normalized = list(keys)
+            # SQLite 单条语句的参数数量有限，分批查询
+            for start in range(0, len(normalized), 500):
+                batch = normalized[start:start + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT source, translation FROM translations WHERE lang = ? AND source IN ({placeholders})",
+                    [lang, *batch]
+                ).fetchall()
+                for source, translation in rows:
+                    found[source] = translation
+            if found:
+                self._conn.executemany(
+                    "UPDATE translations SET last_used = ? WHERE source = ? AND lang = ?",
+                    [(now, source, lang) for source in found]
+                )
+            self.hits += sum(len(keys[source]) for source in found)
+            self.misses += sum(len(originals) for source, originals in keys.items() if source not in found)
+
+        return {text: found[source] for source, originals in keys.items() if source in found for text in originals}
+
+    def put_many(self, translations: Dict[str, str], lang: str) -> None:
+        """写入 {原文: 译文}，必要时按 LRU 淘汰旧条目。"""
+        rows = [
+            (normalize_source_text(source), lang, translation, time.time())
+            for source, translation in translations.items()
+            if normalize_source_text(source) and isinstance(translation, str) and translation.strip()
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO translations (source, lang, translation, last_used) VALUES (?, ?, ?, ?)",
+                    rows
+                )
+                self._evict_locked()
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict_locked(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM translations WHERE rowid IN "
+                "(SELECT rowid FROM translations ORDER BY last_used LIMIT ?)",
+                (overflow,)
+            )
+            self.evictions += overflow
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中、未命中、淘汰次数以及当前条目数。"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM translations")
+
+
+class ResultCache(_SQLiteCache):
+    """
+    重构结果缓存，键为 result_cache_key()。
+    条目超过 ttl_seconds 即失效；总字节数超过 max_bytes 时按最近使用时间淘汰。
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+                 max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        super().__init__(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_used ON results (last_used)")
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, value: str) -> None:
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO results (key, value, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now)
+                )
+                self._evict_locked(now)
+                self._conn.execute("COMMIT")
+            except sqlite3.Error:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _evict_locked(self, now: float) -> None:
+        expired = self._conn.execute("DELETE FROM results WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+        self.evictions += max(expired, 0)
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in self._conn.execute("SELECT key, size FROM results ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM results WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def stats(self) -> Dict[str, float]:
+        """返回命中、未命中、淘汰次数以及当前条目数和字节数。"""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                'entries': entries,
+                'bytes': total,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+
+
+_translation_cache: Optional[TranslationCache] = None
+_translation_cache_lock = threading.Lock()
+
+
+def get_translation_cache() -> Optional[TranslationCache]:
+    """返回进程内共享的译文缓存；禁用或无法创建时返回 None。"""
+    global _translation_cache
+    if not TRANSLATION_CACHE_ENABLED:
+        return None
+    with _translation_cache_lock:
+        if _translation_cache is None:
+            try:
+                _translation_cache = TranslationCache(os.path.join(CACHE_DIR, 'translations.sqlite3'))
+            except (sqlite3.Error, OSError) as e:
+                print(f"无法创建翻译缓存，已禁用缓存: {e}")
+                return None
+        return _translation_cache
+
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """返回进程内共享的重构结果缓存；禁用或无法创建时返回 None。"""
+    global _result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            try:
+                _result_cache = ResultCache(os.path.join(CACHE_DIR, 'results.sqlite3'))
+            except (sqlite3.Error, OSError) as e:
+                print(f"无法创建结果缓存，已禁用缓存: {e}")
+                return None
+        return _result_cache
@@ -0,0 +1,230 @@
+import argparse
+import copy
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.batch import BATCH_MAX_WORKERS
+from core.enhanced_agent import PAPER_FORMATS, PARTIAL_PREFIX, process_python_file_streaming
+from core.status import status_sink
+
+# --- 配置区 ---
+SOURCE_EXTENSIONS = ('.py', '.ipynb')
+OUTPUT_SUFFIX = '_zh_revision'
+SUMMARY_FILENAME = 'academicplot_summary.json'
+# 遍历目录时跳过的子目录
+SKIP_DIRS = {'__pycache__', '.git', '.hg', '.svn', '.ipynb_checkpoints', '.venv', 'venv', 'node_modules'}
+
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+CANCELLED = 'cancelled'
+
+
+def output_name(source_path: str) -> str:
+    base, ext = os.path.splitext(os.path.basename(source_path))
+    return f"{base}{OUTPUT_SUFFIX}{ext}"
+
+
+def find_sources(root: str) -> List[str]:
+    """递归查找 root 下的 .py 脚本和 .ipynb 笔记本（按路径排序），跳过隐藏目录和已生成的 _zh_revision 输出。"""
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in SKIP_DIRS and not d.startswith('.'))
+        for filename in sorted(filenames):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() in SOURCE_EXTENSIONS and not stem.endswith(OUTPUT_SUFFIX):
+                sources.append(os.path.join(dirpath, filename))
+    return sources
+
+
+def output_folder_for(source_path: str, root: str, output_dir: Optional[str]) -> str:
+    """输出目录：未指定 output_dir 时与源文件相同，否则在 output_dir 下保持相对 root 的目录结构。"""
+    if not output_dir:
+        return os.path.dirname(source_path)
+    relative = os.path.relpath(os.path.dirname(source_path), root)
+    return os.path.normpath(os.path.join(output_dir, relative))
+
+
+def is_up_to_date(source_path: str, output_path: str) -> bool:
+    """输出文件存在且不早于源文件时视为最新。"""
+    try:
+        return os.path.getmtime(output_path) >= os.path.getmtime(source_path)
+    except OSError:
+        return False
+
+
+def build_options(args: argparse.Namespace) -> Tuple[bool, Dict[str, Any]]:
+    """由命令行参数构建 (beautify, academic_options)，与网页表单的选项一致。"""
+    if args.translate_only:
+        return False, {'enabled': False}
+    academic_options = {
+        'enabled': True,
+        'paper_format': args.format,
+        'layout': args.layout,
+        'vector_format': args.vector,
+        'dpi': args.dpi,
+        'fast_mode': args.fast,
+        'custom_mode': False,
+        'custom_params': {},
+    }
+    return not args.no_beautify, academic_options
+
+
+def convert_file(source_path: str, output_folder: str, beautify: bool, academic_options: Dict[str, Any],
+                 on_status=None) -> Dict[str, Any]:
+    """处理单个文件，返回 {'status', 'output', 'seconds', 'error'}。"""
+    started = time.monotonic()
+    last_status = None
+    output = None
+
+    def note(message: str) -> None:
+        nonlocal last_status
+        last_status = message
+        if on_status:
+            on_status(message)
+
+    try:
+        os.makedirs(output_folder, exist_ok=True)
+        # 每个文件使用独立的选项副本，避免线程间互相修改
+        with status_sink(note):
+            for status in process_python_file_streaming(source_path, output_folder, beautify,
+                                                        copy.deepcopy(academic_options)):
+                if status.startswith("SUCCESS:"):
+                    output = os.path.join(output_folder, status.split(":", 1)[1].strip())
+                elif not status.startswith(PARTIAL_PREFIX):
+                    note(status)
+    except Exception as e:
+        last_status = f"处理失败: {e}"
+    return {
+        'status': SUCCEEDED if output else FAILED,
+        'output': output,
+        'seconds': round(time.monotonic() - started, 3),
+        'error': None if output else (last_status or "未生成输出文件"),
+    }
+
+
+def convert_directory(root: str, beautify: bool, academic_options: Dict[str, Any], jobs: int = BATCH_MAX_WORKERS,
+                      output_dir: Optional[str] = None, force: bool = False, verbose: bool = False) -> Dict[str, Any]:
+    """
+    转换目录树中的所有脚本和笔记本：输出不早于源文件的跳过，其余在线程池中并发处理。
+    各线程共用同一进程内的译文缓存、结果缓存和 DeepSeek 限流器。逐个打印完成进度，返回汇总字典。
+    """
+    started_at = time.time()
+    started = time.monotonic()
+    records: Dict[str, Dict[str, Any]] = {}
+    pending = []
+    for source in find_sources(root):
+        relative = os.path.relpath(source, root)
+        folder = output_folder_for(source, root, output_dir)
+        output_path = os.path.join(folder, output_name(source))
+        if not force and is_up_to_date(source, output_path):
+            records[relative] = {'status': SKIPPED, 'output': output_path, 'seconds': 0.0, 'error': None}
+        else:
+            records[relative] = {'status': CANCELLED, 'output': None, 'seconds': 0.0, 'error': None}
+            pending.append((relative, source, folder))
+
+    total = len(pending)
+    print(f"共找到 {len(records)} 个文件，{len(records) - total} 个已是最新，{total} 个需要处理（并发 {jobs}）")
+    print_lock = threading.Lock()
+
+    def on_status(relative: str):
+        if not verbose:
+            return None
+        def emit(message: str) -> None:
+            with print_lock:
+                print(f"  {relative}: {message}")
+        return emit
+
+    interrupted = False
+    if pending:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(jobs, total)))
+        try:
+            futures = {
+                executor.submit(convert_file, source, folder, beautify, academic_options, on_status(relative)): relative
+                for relative, source, folder in pending
+            }
+            done = failed = 0
+            for future in as_completed(futures):
+                relative = futures[future]
+                record = future.result()
+                records[relative] = record
+                done += 1
+                failed += record['status'] == FAILED
+                mark = '成功' if record['status'] == SUCCEEDED else f"失败: {record['error']}"
+                with print_lock:
+                    print(f"[{done}/{total}] {relative} {record['seconds']:.1f}s {mark}"
+                          f"（失败 {failed} 个，已用 {time.monotonic() - started:.0f}s）")
+        except KeyboardInterrupt:
+            interrupted = True
+            print("已中断，正在取消尚未开始的文件...")
+        finally:
+            executor.shutdown(wait=not interrupted, cancel_futures=True)
+
+    counts = {state: 0 for state in (SUCCEEDED, FAILED, SKIPPED, CANCELLED)}
+    for record in records.values():
+        counts[record['status']] += 1
+    return {
+        'root': os.path.abspath(root),
+        'output_dir': os.path.abspath(output_dir) if output_dir else None,
+        'beautify': beautify,
+        'academic_options': academic_options,
+        'jobs': jobs,
+        'started_at': started_at,
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+        'interrupted': interrupted,
+        'total': len(records),
+        'counts': counts,
+        'files': [dict(record, source=relative) for relative, record in sorted(records.items())],
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog='academicplot convert',
+                                     description='批量翻译并美化目录中的 matplotlib 脚本和 Jupyter 笔记本')
+    parser.add_argument('directory', help='要处理的目录（递归查找 .py 和 .ipynb）')
+    parser.add_argument('--format', choices=sorted(PAPER_FORMATS), default='nature', help='论文格式')
+    parser.add_argument('--layout', choices=['single', 'double'], default='single', help='单栏或双栏')
+    parser.add_argument('--vector', choices=['pdf', 'svg', 'eps'], default=None, help='矢量图格式（默认不保存）')
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--fast', action='store_true', help='快速模式：只用本地 AST 规则应用学术风格，不调用 AI 重构')
+    parser.add_argument('--no-beautify', action='store_true', help='不进行 AI 布局美化')
+    parser.add_argument('--translate-only', action='store_true', help='只翻译，不应用学术风格')
+    parser.add_argument('--jobs', '-j', type=int, default=BATCH_MAX_WORKERS, help='并发处理的文件数')
+    parser.add_argument('--output-dir', help='输出目录（默认写在源文件旁边），保持原有目录结构')
+    parser.add_argument('--force', action='store_true', help='忽略已是最新的输出，全部重新处理')
+    parser.add_argument('--summary', help=f'JSON 汇总文件路径（默认为输出目录下的 {SUMMARY_FILENAME}）')
+    parser.add_argument('--verbose', '-v', action='store_true', help='打印每个文件的处理进度')
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口；全部成功时返回 0，有文件失败或被中断时返回 1。"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.directory):
+        parser.error(f"目录不存在: {args.directory}")
+    if args.jobs < 1:
+        parser.error("--jobs 至少为 1")
+
+    beautify, academic_options = build_options(args)
+    summary = convert_directory(args.directory, beautify, academic_options, jobs=args.jobs,
+                                output_dir=args.output_dir, force=args.force, verbose=args.verbose)
+
+    summary_path = args.summary or os.path.join(args.output_dir or args.directory, SUMMARY_FILENAME)
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+    counts = summary['counts']
+    print(f"完成：成功 {counts[SUCCEEDED]} 个，失败 {counts[FAILED]} 个，跳过 {counts[SKIPPED]} 个，"
+          f"取消 {counts[CANCELLED]} 个，耗时 {summary['elapsed_seconds']:.1f}s。汇总已写入 {summary_path}")
+    return 1 if counts[FAILED] or summary['interrupted'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
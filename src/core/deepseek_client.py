@@ -0,0 +1,318 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.metrics import (DEEPSEEK_ERRORS, DEEPSEEK_FIRST_TOKEN, DEEPSEEK_LATENCY, DEEPSEEK_REQUESTS,
+                          DEEPSEEK_RETRIES, record_token_usage)
+from core.rate_limit import Permit, estimate_tokens, get_rate_governor
+from core.tracing import current_trace, record_span, span
+from core.transport import create_transport
+
+# --- 配置区 ---
+DEEPSEEK_CONNECT_TIMEOUT = float(os.getenv('DEEPSEEK_CONNECT_TIMEOUT', '10'))
+DEEPSEEK_READ_TIMEOUT = float(os.getenv('DEEPSEEK_READ_TIMEOUT', '180'))
+DEEPSEEK_POOL_SIZE = int(os.getenv('DEEPSEEK_POOL_SIZE', '10'))
+DEEPSEEK_MAX_RETRIES = int(os.getenv('DEEPSEEK_MAX_RETRIES', '3'))
+DEEPSEEK_BACKOFF_BASE = float(os.getenv('DEEPSEEK_BACKOFF_BASE', '1.0'))
+DEEPSEEK_BACKOFF_MAX = float(os.getenv('DEEPSEEK_BACKOFF_MAX', '30'))
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_EXCEPTIONS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+)
+
+
+class DeepSeekAPIError(Exception):
+    """DeepSeek API 调用失败；retryable 表示该错误是否值得重试。"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, response_text: str = '',
+                 retryable: bool = False, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response_text = response_text
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 头（秒数形式），无法解析时返回 None。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+def _total_tokens(usage: Any) -> Optional[int]:
+    """响应 usage 字段中的总 token 数，没有时返回 None。"""
+    if not isinstance(usage, dict):
+        return None
+    total = usage.get('total_tokens')
+    if isinstance(total, (int, float)):
+        return int(total)
+    parts = [usage.get('prompt_tokens'), usage.get('completion_tokens')]
+    return int(sum(part for part in parts if isinstance(part, (int, float)))) or None
+
+
+def _usage_args(usage: Any) -> Dict[str, int]:
+    """追踪区间中记录的 token 用量。"""
+    if not isinstance(usage, dict):
+        return {}
+    return {kind: int(usage[kind]) for kind in ('prompt_tokens', 'completion_tokens')
+            if isinstance(usage.get(kind), (int, float))}
+
+
+def _request_args(payload: Dict[str, Any]) -> Dict[str, int]:
+    """追踪区间中记录的请求体大小；没有进行中的追踪时不做序列化。"""
+    if current_trace() is None:
+        return {}
+    return {'request_bytes': len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))}
+
+
+class DeepSeekClient:
+    """
+    基于 requests.Session 的 DeepSeek 客户端。
+    复用有上限的 keep-alive 连接池，对可重试错误做带抖动的指数退避重试，
+    并统计每次调用的耗时与重试次数。可在多个线程间共享。
+    """
+
+    def __init__(self, api_url: str, api_key: str,
+                 connect_timeout: float = DEEPSEEK_CONNECT_TIMEOUT,
+                 read_timeout: float = DEEPSEEK_READ_TIMEOUT,
+                 pool_size: int = DEEPSEEK_POOL_SIZE,
+                 max_retries: int = DEEPSEEK_MAX_RETRIES,
+                 backoff_base: float = DEEPSEEK_BACKOFF_BASE,
+                 backoff_max: float = DEEPSEEK_BACKOFF_MAX,
+                 transport=None, governor=None):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        # pool_block=True: 并发请求超过连接池上限时排队等待，而不是临时新建连接
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {api_key}"
+        })
+        # 传输层可替换为录制/回放（见 core.transport），默认由 DEEPSEEK_TRANSPORT 决定
+        self.transport = transport or create_transport(self.session)
+        # 所有线程和任务共享同一个限流器，超出配额的调用按到达顺序排队
+        self.governor = governor or get_rate_governor()
+
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.total_latency = 0.0
+
+    def _backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """第 attempt 次重试前的等待时间：带抖动的指数退避，服务器给出 Retry-After 时以其为下限。"""
+        cap = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        delay = cap / 2 + random.uniform(0, cap / 2)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def _send(self, payload: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """发送一次请求并检查状态码；失败时抛出 DeepSeekAPIError，并标明是否可重试。"""
+        try:
+            response = self.transport.post(self.api_url, payload, self.timeout, stream=stream)
+        except RETRYABLE_EXCEPTIONS as e:
+            DEEPSEEK_ERRORS.inc(reason='network')
+            raise DeepSeekAPIError(f"网络错误: {e}", retryable=True)
+        except requests.exceptions.RequestException as e:
+            # 地址无效、重定向过多等请求错误重试也不会成功，交给调用方走备用流程
+            DEEPSEEK_ERRORS.inc(reason='request')
+            raise DeepSeekAPIError(f"请求错误: {e}", retryable=False)
+        if response.status_code >= 400:
+            DEEPSEEK_ERRORS.inc(reason=f"http_{response.status_code}")
+            error = DeepSeekAPIError(
+                f"HTTP {response.status_code}", response.status_code, response.text,
+                retryable=response.status_code in RETRYABLE_STATUS_CODES,
+                retry_after=parse_retry_after(response.headers.get('Retry-After'))
+            )
+            response.close()
+            raise error
+        return response
+
+    def _send_with_retries(self, payload: Dict[str, Any], started: float,
+                           stream: bool = False) -> Tuple[requests.Response, int, Permit]:
+        """
+        带退避重试地发送请求，返回 (响应, 重试次数, 限流许可)；调用方读完响应后需释放许可。
+        每次尝试前都向限流器申请配额。重试耗尽后记录失败并抛出 DeepSeekAPIError。
+        """
+        retries = 0
+        tokens = estimate_tokens(payload)
+        while True:
+            permit = self.governor.acquire(tokens)
+            record_span('deepseek.rate_limit_wait', 'deepseek', permit.waited, estimated_tokens=tokens)
+            try:
+                with span('deepseek.attempt', 'deepseek', attempt=retries + 1) as attempt:
+                    try:
+                        response = self._send(payload, stream=stream)
+                    except DeepSeekAPIError as e:
+                        attempt.update(status_code=e.status_code, message=str(e))
+                        raise
+                    attempt['status_code'] = response.status_code
+                return response, retries, permit
+            except DeepSeekAPIError as e:
+                permit.release(0)
+                if not e.retryable or retries >= self.max_retries:
+                    self._record(started, retries, failed=True, stream=stream)
+                    raise
+                delay = self._backoff_delay(retries, e.retry_after)
+                retries += 1
+                DEEPSEEK_RETRIES.inc()
+                print(f"DeepSeek API 请求失败（{e}），{delay:.1f} 秒后进行第 {retries} 次重试...")
+                if e.status_code == 429 or e.retry_after is not None:
+                    # 限流信号对所有调用方生效：暂停整个限流器，由 acquire() 统一等待
+                    self.governor.pause(delay)
+                else:
+                    with span('deepseek.backoff', 'deepseek', retry=retries):
+                        time.sleep(delay)
+            except BaseException:
+                # 传输层抛出的其它异常（如 OSError、KeyboardInterrupt）也必须归还并发名额
+                permit.release(0)
+                self._record(started, retries, failed=True, stream=stream)
+                raise
+
+    def chat(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """发送 chat/completions 请求并返回解析后的 JSON，重试耗尽后抛出 DeepSeekAPIError。"""
+        with span('deepseek.chat', 'deepseek', **_request_args(payload)) as call:
+            started = time.monotonic()
+            response, retries, permit = self._send_with_retries(payload, started)
+            # 限流排队时间单独计入 DEEPSEEK_QUEUE_WAIT，不算作 API 耗时
+            started += permit.waited
+            usage = None
+            try:
+                result = response.json()
+                usage = result.get('usage') if isinstance(result, dict) else None
+            except ValueError:
+                DEEPSEEK_ERRORS.inc(reason='invalid_json')
+                self._record(started, retries, failed=True)
+                raise DeepSeekAPIError("响应不是有效的 JSON", response.status_code, response.text)
+            finally:
+                permit.release(_total_tokens(usage))
+                call.update(retries=retries, response_bytes=len(response.content), **_usage_args(usage))
+            self._record(started, retries, failed=False)
+            record_token_usage(usage)
+            return result
+
+    def chat_stream(self, payload: Dict[str, Any]) -> Iterator[str]:
+        """
+        以 stream=True 发送请求，逐段产出模型生成的文本增量。
+        只在收到首个字节之前重试；传输中途断开时抛出 DeepSeekAPIError。
+        """
+        # include_usage 让服务端在最后一个分块中附带 token 用量
+        stream_payload = dict(payload, stream=True, stream_options={"include_usage": True})
+        with span('deepseek.chat_stream', 'deepseek', **_request_args(stream_payload)) as call:
+            started = time.monotonic()
+            response, retries, permit = self._send_with_retries(stream_payload, started, stream=True)
+            started += permit.waited
+            first_token_latency = None
+            usage = None
+            response_bytes = 0
+            try:
+                with response:
+                    for raw_line in response.iter_lines():
+                        response_bytes += len(raw_line) + 1
+                        # SSE 行格式为 "data: {...}"，以 "data: [DONE]" 结束；按 UTF-8 解码避免中文乱码
+                        line = raw_line.decode('utf-8', errors='replace').strip()
+                        if not line.startswith('data:'):
+                            continue
+                        data = line[5:].strip()
+                        if data == '[DONE]':
+                            break
+                        try:
+                            chunk = json.loads(data)
+                        except ValueError:
+                            continue
+                        if chunk.get('usage'):
+                            usage = chunk['usage']
+                            record_token_usage(usage)
+                        choices = chunk.get('choices') or []
+                        delta = (choices[0].get('delta') or {}).get('content') if choices else None
+                        if delta:
+                            if first_token_latency is None:
+                                first_token_latency = time.monotonic() - started
+                            yield delta
+            except requests.exceptions.RequestException as e:
+                DEEPSEEK_ERRORS.inc(reason='stream_interrupted')
+                self._record(started, retries, failed=True, first_token_latency=first_token_latency, stream=True)
+                raise DeepSeekAPIError(f"流式响应中断: {e}")
+            finally:
+                permit.release(_total_tokens(usage))
+                call.update(retries=retries, response_bytes=response_bytes, **_usage_args(usage))
+                if first_token_latency is not None:
+                    call['first_token_seconds'] = round(first_token_latency, 3)
+            self._record(started, retries, failed=False, first_token_latency=first_token_latency, stream=True)
+
+    def _record(self, started: float, retries: int, failed: bool, first_token_latency: Optional[float] = None,
+                stream: bool = False) -> None:
+        latency = time.monotonic() - started
+        mode = 'stream' if stream else 'chat'
+        DEEPSEEK_REQUESTS.inc(mode=mode, outcome='error' if failed else 'success')
+        DEEPSEEK_LATENCY.observe(latency, mode=mode)
+        if first_token_latency is not None:
+            DEEPSEEK_FIRST_TOKEN.observe(first_token_latency)
+        self._local.last_call = {
+            'latency': latency,
+            'retries': retries,
+            'failed': failed,
+            'first_token_latency': first_token_latency,
+        }
+        with self._stats_lock:
+            self.calls += 1
+            self.retries += retries
+            self.total_latency += latency
+            if failed:
+                self.failures += 1
+
+    def last_call_stats(self) -> Optional[Dict[str, Any]]:
+        """当前线程最近一次调用的耗时与重试次数。"""
+        return getattr(self._local, 'last_call', None)
+
+    def stats(self) -> Dict[str, Any]:
+        """进程内累计的调用次数、失败次数、重试次数与平均耗时。"""
+        with self._stats_lock:
+            return {
+                'calls': self.calls,
+                'failures': self.failures,
+                'retries': self.retries,
+                'total_latency': self.total_latency,
+                'avg_latency': self.total_latency / self.calls if self.calls else 0.0,
+            }
+
+    def close(self) -> None:
+        self.session.close()
+
+
+_client: Optional[DeepSeekClient] = None
+_client_lock = threading.Lock()
+
+
+def get_deepseek_client(api_url: str, api_key: str) -> DeepSeekClient:
+    """返回进程内共享的 DeepSeekClient，地址或密钥变化时重新创建。"""
+    global _client
+    with _client_lock:
+        if _client is None or _client.api_url != api_url or _client.api_key != api_key:
+            if _client is not None:
+                _client.close()
+            _client = DeepSeekClient(api_url, api_key)
+        return _client
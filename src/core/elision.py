@@ -0,0 +1,87 @@
+import ast
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from core.rewrite import SourceIndex, apply_edits
+
+# --- 配置区 ---
+ELIDE_MIN_ELEMENTS = int(os.getenv('ELIDE_MIN_ELEMENTS', '50'))
+ELIDE_MIN_CHARS = int(os.getenv('ELIDE_MIN_CHARS', '400'))
+
+PLACEHOLDER_RE = re.compile(r'__APLOT_DATA_[0-9a-f]{12}__')
+
+_CONTAINER_TYPES = (ast.List, ast.Tuple, ast.Set, ast.Dict)
+
+
+def _is_data_literal(node: ast.AST) -> bool:
+    """只由常量（含正负号）和嵌套容器组成的表达式，可以安全地整体替换。"""
+    if isinstance(node, ast.Constant):
+        return True
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        return isinstance(node.operand, ast.Constant)
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return all(_is_data_literal(elt) for elt in node.elts)
+    if isinstance(node, ast.Dict):
+        return all(key is not None and _is_data_literal(key) for key in node.keys) and \
+            all(_is_data_literal(value) for value in node.values)
+    return False
+
+
+def _element_count(node: ast.AST) -> int:
+    if isinstance(node, ast.Dict):
+        return len(node.keys)
+    return len(getattr(node, 'elts', ()))
+
+
+def _collect_elidable(node: ast.AST, index: SourceIndex, found: List[Tuple[int, int]]) -> None:
+    # f-string 内部的常量片段不能单独替换
+    if isinstance(node, ast.JoinedStr):
+        return
+    is_container = isinstance(node, _CONTAINER_TYPES) and not isinstance(getattr(node, 'ctx', None), (ast.Store, ast.Del))
+    is_long_string = isinstance(node, ast.Constant) and isinstance(node.value, (str, bytes))
+    if is_container or is_long_string:
+        start, end = index.node_span(node)
+        large = end - start >= ELIDE_MIN_CHARS or (is_container and _element_count(node) >= ELIDE_MIN_ELEMENTS)
+        if large and (is_long_string or _is_data_literal(node)):
+            found.append((start, end))
+            return
+    for child in ast.iter_child_nodes(node):
+        _collect_elidable(child, index, found)
+
+
+def elide_literals(code: str) -> Tuple[str, Dict[str, str]]:
+    """
+    把大型数据字面量（列表/元组/集合/字典）和长字符串替换为稳定的占位标识符。
+    返回 (精简后的代码, {占位符: 原始字面量源码})；代码无法解析时原样返回。
+    占位符由字面量内容的哈希生成，同样的数据总是得到同样的占位符。
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return code, {}
+
+    index = SourceIndex(code)
+    spans: List[Tuple[int, int]] = []
+    _collect_elidable(tree, index, spans)
+
+    placeholders: Dict[str, str] = {}
+    edits = []
+    for start, end in spans:
+        literal = code[start:end]
+        placeholder = f"__APLOT_DATA_{hashlib.sha1(literal.encode('utf-8')).hexdigest()[:12]}__"
+        placeholders[placeholder] = literal
+        edits.append((start, end, placeholder))
+    return apply_edits(code, edits), placeholders
+
+
+def restore_literals(code: str, placeholders: Dict[str, str]) -> Optional[str]:
+    """把占位符替换回原始字面量；有占位符丢失时返回 None，表示结果不可信。"""
+    if not placeholders:
+        return code
+    missing = [placeholder for placeholder in placeholders if placeholder not in code]
+    if missing:
+        print(f"AI 返回的代码丢失了 {len(missing)} 个数据占位符，无法还原原始数据: {', '.join(missing[:5])}")
+        return None
+    return PLACEHOLDER_RE.sub(lambda match: placeholders.get(match.group(0), match.group(0)), code)
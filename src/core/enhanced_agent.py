@@ -1,22 +1,42 @@
 import os
 import re
-import requests
 import json
 import ast
-from typing import Dict, Any, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Any, Generator, List, Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# 核心子模块在导入时读取环境变量，需在 load_dotenv() 之后导入
+from core.cache import get_result_cache, get_translation_cache, result_cache_key, style_options_key
+from core.deepseek_client import DeepSeekAPIError, get_deepseek_client
+from core.elision import elide_literals, restore_literals
+from core.glossary import get_glossary
+from core.metrics import GLOSSARY_LOOKUPS, PIPELINE_RUNS, stage_timer
+from core.revisions import current_revision
+from core.rewrite import apply_translations, extract_translatable_spans
+from core.segmenter import (SEGMENT_ENABLED, SEGMENT_MAX_WORKERS, SEGMENT_MIN_BLOCKS, preamble_of, segment_script,
+                            stitch_segments)
+from core.status import merge_streams, report_status, submit_with_context
+from core.style_engine import transform_academic_style
+from core.transport import transport_requires_api_key
+
 # --- 配置区 ---
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
-DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
-
-TARGET_PLOT_FUNCTIONS = {
-    'title', 'xlabel', 'ylabel', 'suptitle',
-    'set_title', 'set_xlabel', 'set_ylabel', 'text', 'legend'
-}
+DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', "https://api.deepseek.com/chat/completions")
+TARGET_LANGUAGE = 'zh'
+TRANSLATION_CHUNK_TOKENS = int(os.getenv('TRANSLATION_CHUNK_TOKENS', '1500'))
+TRANSLATION_MAX_WORKERS = int(os.getenv('TRANSLATION_MAX_WORKERS', '4'))
+TRANSLATION_CHUNK_RETRIES = int(os.getenv('TRANSLATION_CHUNK_RETRIES', '2'))
+STREAM_FLUSH_INTERVAL = float(os.getenv('STREAM_FLUSH_INTERVAL', '0.1'))
+# 需要 AI 重构时，翻译与重构并发执行（0 表示恢复为先翻译后重构的串行流程）
+PARALLEL_TRANSLATE_REFACTOR = os.getenv('PARALLEL_TRANSLATE_REFACTOR', '1') != '0'
+
+# 流式状态中携带模型增量输出的前缀（与 "SUCCESS:" 类似）
+PARTIAL_PREFIX = "PARTIAL:"
 
 # --- 标准论文格式配置 ---
 PAPER_FORMATS = {
@@ -78,11 +98,15 @@ PAPER_FORMATS = {
 }
 
 # --- DeepSeek API 调用封装 ---
-def call_deepseek_api(prompt: str, is_json_mode: bool = False) -> Optional[str]:
-    """调用 DeepSeek API 的通用函数"""
-    if not DEEPSEEK_API_KEY or "xxxxxxxx" in DEEPSEEK_API_KEY:
+def _check_api_key() -> None:
+    # 回放模式只读取本地录像，不需要 API Key
+    if transport_requires_api_key() and (not DEEPSEEK_API_KEY or "xxxxxxxx" in DEEPSEEK_API_KEY):
         raise ValueError("请在 DEEPSEEK_API_KEY 变量中设置你的有效 API Key")
 
+def call_deepseek_api(prompt: str, is_json_mode: bool = False) -> Optional[str]:
+    """调用 DeepSeek API 的通用函数（共享连接池，可重试错误自动退避重试）"""
+    _check_api_key()
+
     payload = {
         "model": "deepseek-chat",
         "messages": [{"role": "user", "content": prompt}],
@@ -90,52 +114,189 @@ def call_deepseek_api(prompt: str, is_json_mode: bool = False) -> Optional[str]:
     if is_json_mode:
         payload["response_format"] = {"type": "json_object"}
 
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
-    }
-
+    client = get_deepseek_client(DEEPSEEK_API_URL, DEEPSEEK_API_KEY or '')
     try:
-        response = requests.post(DEEPSEEK_API_URL, headers=headers, json=payload, timeout=180)
-        response.raise_for_status()
-        result_content = response.json()['choices'][0]['message']['content']
+        response_data = client.chat(payload)
+        result_content = response_data['choices'][0]['message']['content']
         return result_content
-    except requests.exceptions.RequestException as e:
-        print(f"调用 DeepSeek API 时发生网络错误: {e}")
+    except DeepSeekAPIError as e:
+        print(f"调用 DeepSeek API 时发生错误: {e}, 响应内容: {e.response_text[:500]}")
         return None
-    except (KeyError, IndexError) as e:
-        print(f"解析 DeepSeek API 响应时出错: {e}, 响应内容: {response.text}")
+    except (KeyError, IndexError, TypeError) as e:
+        print(f"解析 DeepSeek API 响应时出错: {e}, 响应内容: {response_data}")
         return None
+    finally:
+        call_stats = client.last_call_stats()
+        if call_stats:
+            print(f"DeepSeek API 调用耗时 {call_stats['latency']:.2f} 秒，重试 {call_stats['retries']} 次")
+
+def call_deepseek_api_streaming(prompt: str) -> Generator[str, None, Optional[str]]:
+    """
+    以流式方式调用 DeepSeek API，逐段产出生成的文本。
+    生成器的返回值为完整的回复内容（失败时为 None）。
+    """
+    _check_api_key()
+
+    payload = {
+        "model": "deepseek-chat",
+        "messages": [{"role": "user", "content": prompt}],
+    }
+
+    client = get_deepseek_client(DEEPSEEK_API_URL, DEEPSEEK_API_KEY or '')
+    pieces = []
+    try:
+        for delta in client.chat_stream(payload):
+            pieces.append(delta)
+            yield delta
+    except DeepSeekAPIError as e:
+        print(f"调用 DeepSeek API 时发生错误: {e}, 响应内容: {e.response_text[:500]}")
+        return None
+    finally:
+        call_stats = client.last_call_stats()
+        if call_stats and call_stats.get('first_token_latency') is not None:
+            print(f"DeepSeek API 首个 token 耗时 {call_stats['first_token_latency']:.2f} 秒，"
+                  f"总耗时 {call_stats['latency']:.2f} 秒，重试 {call_stats['retries']} 次")
+    return ''.join(pieces)
 
 # --- 核心功能函数 ---
 
-def translate_texts(texts_to_translate: Dict[str, str]) -> Optional[Dict[str, str]]:
-    """使用 DeepSeek API 批量翻译文本。"""
+def split_translation_chunks(texts: Dict[str, str], token_budget: int = TRANSLATION_CHUNK_TOKENS) -> List[Dict[str, str]]:
+    """按估算的 token 数把待翻译字典切分成若干块，每块不超过 token_budget（单条超长文本独占一块）。"""
+    chunks: List[Dict[str, str]] = []
+    current: Dict[str, str] = {}
+    current_tokens = 0
+    for key, text in texts.items():
+        # 粗略估算：英文约 3~4 个字符一个 token，另加 JSON 结构开销
+        tokens = (len(key) + len(text)) // 3 + 8
+        if current and current_tokens + tokens > token_budget:
+            chunks.append(current)
+            current, current_tokens = {}, 0
+        current[key] = text
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _translate_chunk(chunk: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """翻译一个分块，返回结果字典；请求失败或返回内容无法解析时返回 None。"""
     prompt = f"""
     你是一个精准的翻译引擎。请将以下JSON对象中的英文文本翻译成简洁、专业、地道的中文。
     请确保JSON的key保持不变，只翻译value中的字符串。
+    value中用花括号包围的占位符（f-string 的表达式部分）必须原样保留，不要翻译或改动。
     请以JSON格式返回结果，不要添加任何额外的解释或说明。
 
     输入:
-    {json.dumps(texts_to_translate, indent=2, ensure_ascii=False)}
+    {json.dumps(chunk, indent=2, ensure_ascii=False)}
 
     输出:
     """
     
     translated_json_str = call_deepseek_api(prompt, is_json_mode=True)
-    if translated_json_str:
-        try:
-            return json.loads(translated_json_str)
-        except json.JSONDecodeError as e:
-            print(f"无法解析翻译返回的JSON: {e}")
-            print(f"原始字符串: {translated_json_str}")
-            return None
-    return None
+    if not translated_json_str:
+        return None
+    try:
+        translated = json.loads(translated_json_str)
+    except json.JSONDecodeError as e:
+        print(f"无法解析翻译返回的JSON: {e}")
+        print(f"原始字符串: {translated_json_str}")
+        return None
+    if not isinstance(translated, dict):
+        print(f"翻译返回的JSON不是对象，已忽略: {translated_json_str[:200]}")
+        return None
+    return {key: value for key, value in translated.items() if key in chunk and isinstance(value, str)}
 
-def refactor_and_style_code(code_content: str, style_options: Dict[str, Any]) -> Optional[str]:
+def translate_texts_streaming(texts_to_translate: Dict[str, str]) -> Generator[str, None, Optional[Dict[str, str]]]:
     """
-    使用 DeepSeek API 对代码进行美化、重构和学术风格应用。
-    style_options 是一个包含用户选择的字典。
+    使用 DeepSeek API 批量翻译文本。先查内置术语表和上一版本的译文，再查译文缓存，都未命中的文本才会请求。
+    未命中的文本按 token 预算分块，在有界线程池中并发翻译，只重试解析失败的分块。
+    逐条产出进度状态，生成器的返回值为合并后的翻译字典（全部失败时为 None）。
+    """
+    translation_map = yield from _translate_pending_streaming(texts_to_translate)
+    revision = current_revision()
+    if revision and translation_map:
+        revision.record_translations({texts_to_translate[key]: value for key, value in translation_map.items()})
+    return translation_map
+
+def _translate_pending_streaming(texts_to_translate: Dict[str, str]) -> Generator[str, None, Optional[Dict[str, str]]]:
+    translation_map: Dict[str, str] = {}
+    pending = dict(texts_to_translate)
+    glossary = get_glossary()
+    if glossary and pending:
+        known = glossary.translate_many(pending.values())
+        translation_map = {key: known[text] for key, text in pending.items() if text in known}
+        pending = {key: text for key, text in pending.items() if text not in known}
+        GLOSSARY_LOOKUPS.inc(len(translation_map), result='hit')
+        GLOSSARY_LOOKUPS.inc(len(pending), result='miss')
+        total_texts = len(texts_to_translate)
+        yield f"术语表命中 {len(translation_map)}/{total_texts} 条（{len(translation_map) / total_texts:.0%}）"
+    if not pending:
+        return translation_map
+
+    revision = current_revision()
+    reused = revision.reuse_translations(pending) if revision else {}
+    if reused:
+        translation_map.update(reused)
+        pending = {key: text for key, text in pending.items() if key not in reused}
+        yield f"沿用上一版本的译文 {len(reused)} 条，{len(pending)} 条为新增或改动的文本。"
+    if not pending:
+        return translation_map
+
+    cache = get_translation_cache()
+    cached = cache.get_many(pending.values(), TARGET_LANGUAGE) if cache else {}
+    if cached:
+        cache_hits = {key: cached[text] for key, text in pending.items() if text in cached}
+        translation_map.update(cache_hits)
+        pending = {key: text for key, text in pending.items() if text not in cached}
+        yield f"翻译缓存命中 {len(cache_hits)} 条，{len(pending)} 条需要请求翻译。"
+    if not pending:
+        return translation_map
+
+    chunks = split_translation_chunks(pending)
+    total = len(chunks)
+    if total > 1:
+        yield f"待翻译文本已拆分为 {total} 个分块，并发请求翻译..."
+
+    completed = 0
+    for round_index in range(TRANSLATION_CHUNK_RETRIES + 1):
+        failed_chunks = []
+        with ThreadPoolExecutor(max_workers=min(TRANSLATION_MAX_WORKERS, len(chunks))) as executor:
+            futures = {submit_with_context(executor, _translate_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                translated = future.result()
+                if translated is None:
+                    failed_chunks.append(chunk)
+                    continue
+                if cache:
+                    cache.put_many({chunk[key]: value for key, value in translated.items()}, TARGET_LANGUAGE)
+                translation_map.update(translated)
+                completed += 1
+                yield f"翻译分块 {completed}/{total} 完成（{len(chunk)} 条）"
+        if not failed_chunks:
+            break
+        chunks = failed_chunks
+        if round_index < TRANSLATION_CHUNK_RETRIES:
+            yield f"{len(failed_chunks)} 个翻译分块失败，正在重试（第 {round_index + 1} 次）..."
+        else:
+            yield f"{len(failed_chunks)} 个翻译分块多次重试后仍失败，这部分文本将保留原文。"
+
+    return translation_map or None
+
+def translate_texts(texts_to_translate: Dict[str, str]) -> Optional[Dict[str, str]]:
+    """translate_texts_streaming 的非流式版本：打印进度并返回翻译字典。"""
+    translation_stream = translate_texts_streaming(texts_to_translate)
+    try:
+        while True:
+            print(next(translation_stream))
+    except StopIteration as stop:
+        return stop.value
+
+def build_refactor_prompt(code_content: str, style_options: Dict[str, Any], has_placeholders: bool = False,
+                          context_code: Optional[str] = None) -> Optional[str]:
+    """
+    根据用户选项构建代码重构与风格美化的 Prompt。
+    style_options 是一个包含用户选择的字典；没有任何需要执行的指令时返回 None。
+    给出 context_code 时，code_content 只是脚本中的一个图形块，context_code 为其前面的公共代码，仅作参考。
     """
     
     # --- 根据用户选项动态构建 Prompt 的一部分 ---
@@ -207,21 +368,40 @@ def refactor_and_style_code(code_content: str, style_options: Dict[str, Any]) ->
     # 如果没有任何指令，则直接返回
     if not instructions:
         return None
-        
+
+    instructions_text = "\n".join(instructions)
+    placeholder_rule = (
+        "\n- **保留数据占位符**: 代码中形如 `__APLOT_DATA_xxxxxxxxxxxx__` 的标识符代表被省略的大型数据字面量，"
+        "必须原样保留在原来的位置，不要修改、删除、展开或重新定义它们。"
+    ) if has_placeholders else ""
+    segment_rule = ""
+    context_section = ""
+    if context_code is not None:
+        segment_rule = (
+            "\n- **只输出这一段**: 需要处理的代码只是完整脚本中绘制图表的一段，脚本的公共前置代码（导入、数据加载等）"
+            "会原样保留在它前面。只输出重构后的这一段代码，不要重复前置代码中的导入和数据处理，也不要修改前置代码中定义的变量名。"
+        )
+        context_section = f"""
+**脚本的公共前置代码（仅供参考，不要输出）**:
+
+```python
+{context_code}
+```
+"""
     prompt = f"""
 你是一位顶级的 Python 数据可视化专家，尤其擅长为学术期刊准备符合出版要求的高质量图表。
 
 你的任务是：接收一段 Python 绘图脚本，并根据下面的具体要求对其进行重构和优化。
 
 **核心要求**:
-1. **保留原始意图**: 必须完整保留原始代码的数据处理逻辑、绘图类型（如折线图、柱状图）以及所有中文标签和注释。你的工作是美化和规范化，而不是改变图表的核心内容。
-{"\n".join(instructions)}
+1. **保留原始意图**: 必须完整保留原始代码的数据处理逻辑、绘图类型（如折线图、柱状图）以及所有文本标签和注释。标签、标题、图例等字符串和注释的内容必须一字不改地保留（翻译由单独的步骤完成），不要翻译、改写或删除它们。你的工作是美化和规范化，而不是改变图表的核心内容。
+{instructions_text}
 
 **输出规则**:
 - **纯代码输出**: 你的回复必须且只能是经过重构和优化后的完整 Python 代码。
 - **不要包含任何解释**、前言、结语或任何格式化标记，例如 ```python ... ```。
-- 确保代码可以直接运行。
-
+- 确保代码可以直接运行。{placeholder_rule}{segment_rule}
+{context_section}
 **这是需要你处理的原始 Python 脚本**:
 
 ```python
@@ -229,16 +409,152 @@ def refactor_and_style_code(code_content: str, style_options: Dict[str, Any]) ->
 ```
 """
     
-    print("正在请求 AI 进行代码重构与风格美化...")
-    refactored_code = call_deepseek_api(prompt)
-    
+    return prompt
+
+def _validate_refactored_code(refactored_code: Optional[str]) -> Optional[str]:
     # 基本的验证，防止 API 返回非代码内容
     if refactored_code and ('import' in refactored_code or 'plt' in refactored_code):
         return refactored_code
     else:
-        print(f"AI 返回内容似乎不是有效的代码，已忽略。返回内容: {refactored_code[:200]}...")
+        print(f"AI 返回内容似乎不是有效的代码，已忽略。返回内容: {(refactored_code or '')[:200]}...")
+        return None
+
+def _elide_for_prompt(code_content: str) -> Tuple[str, Dict[str, str]]:
+    """发送给模型前省略大型数据字面量，以缩小 Prompt。"""
+    slim_code, placeholders = elide_literals(code_content)
+    if placeholders:
+        print(f"已省略 {len(placeholders)} 个大型数据字面量，发送的代码由 {len(code_content)} 字符缩减为 {len(slim_code)} 字符")
+    return slim_code, placeholders
+
+def _refactor_block(block_code: str, context_code: str, style_options: Dict[str, Any],
+                    has_placeholders: bool) -> Optional[str]:
+    """重构单个图形块；结果无效或无法单独解析时返回 None。"""
+    prompt = build_refactor_prompt(block_code, style_options, has_placeholders, context_code=context_code)
+    refactored = _validate_refactored_code(call_deepseek_api(prompt)) if prompt else None
+    if not refactored:
+        return None
+    try:
+        ast.parse(refactored)
+    except SyntaxError as e:
+        print(f"AI 返回的图形块无法解析，已忽略: {e}")
+        return None
+    return refactored
+
+def refactor_segments(slim_code: str, style_options: Dict[str, Any], has_placeholders: bool) -> Optional[str]:
+    """
+    按图形块分段重构：公共前置代码作为只读上下文，各图形块并发请求，按原顺序拼接。
+    图形块少于 SEGMENT_MIN_BLOCKS、任一块失败或拼接结果无法解析时返回 None，由调用方整文件重构。
+    """
+    try:
+        segments = segment_script(slim_code)
+    except SyntaxError:
+        return None
+    figure_indexes = [i for i, segment in enumerate(segments) if segment.kind == 'figure']
+    if len(figure_indexes) < SEGMENT_MIN_BLOCKS:
+        return None
+
+    context_code = preamble_of(segments)
+    base = style_options.get('output_filename_base', 'figure')
+    revision = current_revision()
+    replacements: List[Optional[str]] = [None] * len(segments)
+    block_options: Dict[int, Dict[str, Any]] = {}
+    for number, index in enumerate(figure_indexes, 1):
+        # 每个图形块保存为单独的矢量图文件，避免互相覆盖
+        block_options[index] = dict(style_options, output_filename_base=f"{base}_{number}")
+        if revision:
+            replacements[index] = revision.reuse_block(segments[index].code, style_options_key(block_options[index]))
+    changed = [index for index in figure_indexes if replacements[index] is None]
+    total = len(changed)
+    if total < len(figure_indexes):
+        report_status(f"{len(figure_indexes) - total} 个图形块未改动或只改动了文本，沿用上一版本的重构结果")
+    if total:
+        report_status(f"脚本包含 {len(figure_indexes)} 个图形块，正在分段并发重构其中 {total} 个...")
+    # 不使用 with 语句：它在退出时等待所有请求结束，一个块失败后要等其余块的请求都返回才能开始整文件重构
+    executor = ThreadPoolExecutor(max_workers=max(1, min(SEGMENT_MAX_WORKERS, total)))
+    try:
+        futures = {}
+        for index in changed:
+            future = submit_with_context(executor, _refactor_block, segments[index].code, context_code,
+                                         block_options[index], has_placeholders)
+            futures[future] = index
+        completed = 0
+        for future in as_completed(futures):
+            refactored = future.result()
+            if refactored is None:
+                report_status("有图形块重构失败，改为整文件重构...")
+                return None
+            replacements[futures[future]] = refactored
+            completed += 1
+            report_status(f"图形块重构 {completed}/{total} 完成")
+    finally:
+        # 取消尚未开始的块；已经发出的请求在后台结束，结果被丢弃
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    stitched = stitch_segments(segments, replacements)
+    try:
+        ast.parse(stitched)
+    except SyntaxError as e:
+        report_status(f"分段重构的拼接结果无法解析（{e}），改为整文件重构...")
+        return None
+    if revision:
+        for index in figure_indexes:
+            revision.record_block(segments[index].code, style_options_key(block_options[index]), replacements[index])
+    return stitched
+
+def _reuse_whole_file(slim_code: str, style_options: Dict[str, Any]) -> Optional[str]:
+    """整文件重构前查找上一版本：选项未改动、代码未改动或只改动了文本时直接沿用其重构结果。"""
+    revision = current_revision()
+    refactored = revision.reuse_block(slim_code, style_options_key(style_options)) if revision else None
+    if refactored is not None:
+        report_status("代码未改动或只改动了文本，沿用上一版本的重构结果")
+    return refactored
+
+def _record_whole_file(slim_code: str, style_options: Dict[str, Any], refactored: Optional[str]) -> None:
+    revision = current_revision()
+    if revision and refactored:
+        revision.record_block(slim_code, style_options_key(style_options), refactored)
+
+def refactor_and_style_code(code_content: str, style_options: Dict[str, Any]) -> Optional[str]:
+    """
+    使用 DeepSeek API 对代码进行美化、重构和学术风格应用。
+    style_options 是一个包含用户选择的字典。包含多幅图的脚本先尝试按图形块分段重构。
+    """
+    slim_code, placeholders = _elide_for_prompt(code_content)
+    prompt = build_refactor_prompt(slim_code, style_options, has_placeholders=bool(placeholders))
+    if prompt is None:
         return None
 
+    print("正在请求 AI 进行代码重构与风格美化...")
+    refactored_code = refactor_segments(slim_code, style_options, bool(placeholders)) if SEGMENT_ENABLED else None
+    if refactored_code is None:
+        refactored_code = _reuse_whole_file(slim_code, style_options)
+    if refactored_code is None:
+        refactored_code = _validate_refactored_code(call_deepseek_api(prompt))
+        _record_whole_file(slim_code, style_options, refactored_code)
+    return restore_literals(refactored_code, placeholders) if refactored_code else None
+
+def refactor_and_style_code_streaming(code_content: str, style_options: Dict[str, Any]) -> Generator[str, None, Optional[str]]:
+    """
+    refactor_and_style_code 的流式版本：逐段产出模型正在生成的代码（大型数据仍以占位符显示），
+    生成器的返回值为校验并还原数据后的完整代码（失败时为 None）。
+    分段重构时各块并发生成，拼接完成后一次性产出整段代码。
+    """
+    slim_code, placeholders = _elide_for_prompt(code_content)
+    prompt = build_refactor_prompt(slim_code, style_options, has_placeholders=bool(placeholders))
+    if prompt is None:
+        return None
+
+    print("正在请求 AI 进行代码重构与风格美化...")
+    refactored_code = refactor_segments(slim_code, style_options, bool(placeholders)) if SEGMENT_ENABLED else None
+    if refactored_code is None:
+        refactored_code = _reuse_whole_file(slim_code, style_options)
+    if refactored_code is not None:
+        yield refactored_code
+    else:
+        refactored_code = _validate_refactored_code((yield from call_deepseek_api_streaming(prompt)))
+        _record_whole_file(slim_code, style_options, refactored_code)
+    return restore_literals(refactored_code, placeholders) if refactored_code else None
+
 def inject_chinese_font_support(code_lines: List[str]) -> List[str]:
     """在代码中注入 Matplotlib 中文支持的设置。"""
     matplotlib_import_index = -1
@@ -340,248 +656,288 @@ def inject_savefig_before_show(code_lines: List[str], vector_format: Optional[st
         print(f"已注入保存矢量图的代码，将保存至相对路径: {output_filename}")
     else:
         print("警告：未找到 'plt.show()'，无法自动注入保存矢量图的代码。")
-        
+
     return code_lines
 
-def process_python_file(filepath: str, beautify: bool = False, academic_options: Optional[Dict[str, Any]] = None) -> None:
+def apply_local_academic_style(code: str, academic_options: Dict[str, Any], source_filename: str) -> Tuple[str, List[str]]:
     """
-    处理单个Python文件：翻译、风格化，并应用备用注入方案。
+    不调用 AI，直接按 PAPER_FORMATS 规则在 AST 层面改写代码（见 core.style_engine）。
+    自定义模式下的尺寸、字号和 DPI 覆盖期刊默认值。返回 (新代码, 处理说明)。
     """
-    print(f"--- 开始处理文件: {filepath} ---")
+    format_config = PAPER_FORMATS.get(academic_options.get('paper_format', 'nature'), PAPER_FORMATS['nature'])
+    layout_key = 'single_column' if academic_options.get('layout', 'single') == 'single' else 'double_column'
+    width, height = format_config[layout_key]
+    dpi = academic_options.get('dpi', 300)
+
+    style_block = create_academic_style_code_block(academic_options)
+    custom_params = (academic_options.get('custom_params') or {}) if academic_options.get('custom_mode') else {}
+    width = custom_params.get('fig_width', width)
+    height = custom_params.get('fig_height', height)
+    dpi = custom_params.get('dpi', dpi)
+    overrides = {
+        'font.size': custom_params.get('font_size'),
+        'axes.titlesize': custom_params.get('title_size'),
+        'figure.dpi': custom_params.get('dpi'),
+        'figure.figsize': (width, height) if 'fig_width' in custom_params or 'fig_height' in custom_params else None,
+    }
+    overrides = {key: value for key, value in overrides.items() if value is not None}
+    if overrides:
+        style_block = style_block.rstrip('\n') + f"\n# 自定义样式\nplt.rcParams.update({overrides!r})\n"
+
+    base, _ = os.path.splitext(os.path.basename(source_filename))
+    return transform_academic_style(code, style_block, (width, height), academic_options.get('vector_format'),
+                                    f"{base}_figure", dpi)
+
+def _apply_style_by_lines(code: str, academic_options: Dict[str, Any], source_filename: str) -> Tuple[str, List[str]]:
+    """旧的按行插入方案，仅在代码无法被解析时使用。"""
+    notes = []
+    code_lines = code.split('\n')
+    matplotlib_import_index = -1
+    for i, line in enumerate(code_lines):
+        if re.search(r'import\s+matplotlib\.pyplot\s+as\s+plt', line):
+            matplotlib_import_index = i
+            break
+
+    if matplotlib_import_index != -1:
+        code_lines.insert(matplotlib_import_index + 1, create_academic_style_code_block(academic_options))
+        notes.append("已注入字体、字号和尺寸设置。")
+    else:
+        notes.append("警告：未找到 matplotlib 导入语句，无法注入样式代码。")
 
+    vector_format = academic_options.get('vector_format')
+    dpi = academic_options.get('dpi', 300)
+    code_lines = inject_savefig_before_show(code_lines, vector_format, source_filename, dpi)
+    return '\n'.join(code_lines), notes
+
+def _stream_partial_code(code_stream: Generator[str, None, Optional[str]]) -> Generator[str, None, Optional[str]]:
+    """
+    把模型的增量输出转换为 PARTIAL: 状态。首段立即发送以缩短首字节时间，
+    之后按 STREAM_FLUSH_INTERVAL 合并发送，避免每个 token 都产生一条事件。
+    """
+    buffer = []
+    last_flush = None
+    while True:
+        try:
+            delta = next(code_stream)
+        except StopIteration as stop:
+            if buffer:
+                yield PARTIAL_PREFIX + ''.join(buffer)
+            return stop.value
+        buffer.append(delta)
+        now = time.monotonic()
+        if last_flush is None or now - last_flush >= STREAM_FLUSH_INTERVAL:
+            yield PARTIAL_PREFIX + ''.join(buffer)
+            buffer = []
+            last_flush = now
+
+def _with_font_support(code: str) -> Tuple[str, bool]:
+    """代码中还没有中文字体设置时注入，返回 (代码, 是否注入)。"""
+    code_lines = code.split('\n')
+    if any("plt.rcParams['font.sans-serif']" in line for line in code_lines):
+        return code, False
+    line_count = len(code_lines)
+    inject_chinese_font_support(code_lines)
+    return '\n'.join(code_lines), len(code_lines) != line_count
+
+def _timed_stream(stage: str, stream: Generator[str, None, Any]) -> Generator[str, None, Any]:
+    """在 stage_timer 中驱动一个状态生成器，并透传它的返回值。"""
+    with stage_timer(stage):
+        return (yield from stream)
+
+def _translate_refactored_code(refactored_code: str, original_spans: List[Any],
+                               translation_map: Dict[str, str]) -> Generator[str, None, Optional[str]]:
+    """
+    把并发得到的译文写回重构后的代码：在重构结果上重新提取文本位置，按原文匹配译文。
+    原代码中的字符串在重构结果里找不到（被模型改写或删除）时返回 None，由调用方改走串行流程；
+    注释允许被模型删除。重构新增的英文文本会补充翻译。
+    """
+    try:
+        tree = ast.parse(refactored_code)
+    except SyntaxError:
+        return None
+    spans = extract_translatable_spans(refactored_code, tree)
+    located = {span.text for span in spans}
+    if any(span.kind != 'comment' and span.text not in located for span in original_spans):
+        return None
+
+    added = {span.text: span.text for span in spans if span.text not in translation_map}
+    if added:
+        yield f"重构结果中新增了 {len(added)} 条英文文本，正在补充翻译..."
+        extra = yield from translate_texts_streaming(added)
+        if extra:
+            translation_map = {**translation_map, **extra}
+    return apply_translations(refactored_code, spans, translation_map)
+
+def build_style_options(source_filename: str, beautify: bool, academic_options: Dict[str, Any]) -> Dict[str, Any]:
+    """根据用户选项构建传给 refactor_and_style_code 的 style_options（不修改原字典）。"""
+    base, _ = os.path.splitext(os.path.basename(source_filename))
+    style_options = dict(academic_options)
+    style_options['beautify_layout'] = beautify
+    style_options['output_filename_base'] = f"{base}_figure"  # 传递给 AI 用于生成保存文件名
+    return style_options
+
+def needs_ai_refactor(beautify: bool, academic_options: Dict[str, Any]) -> bool:
+    """是否需要请求 AI 重构；快速模式只使用本地 AST 规则。"""
+    fast_mode = bool(academic_options.get('enabled') and academic_options.get('fast_mode'))
+    return bool(beautify or academic_options.get('enabled')) and not fast_mode
+
+def processing_key(original_code: str, source_filename: str, beautify: bool = False,
+                   academic_options: Optional[Dict[str, Any]] = None) -> str:
+    """同一份代码在同一组选项（含输出文件名）下的处理结果相同，用作进行中请求的合并键。"""
+    return result_cache_key(original_code, build_style_options(source_filename, beautify, academic_options or {'enabled': False}))
+
+def process_code_streaming(original_code: str, source_filename: str, beautify: bool = False, academic_options: Optional[Dict[str, Any]] = None) -> Generator[str, None, Optional[str]]:
+    """
+    对代码字符串执行翻译、风格化，并应用备用注入方案。
+    逐条产出处理状态，生成器的返回值为最终代码（无法处理时为 None）。
+    """
     if academic_options is None:
         academic_options = {'enabled': False}
 
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            original_code = f.read()
-    except Exception as e:
-        print(f"读取文件失败: {e}")
-        return
+    fast_mode = bool(academic_options.get('enabled') and academic_options.get('fast_mode'))
+    needs_refactor = needs_ai_refactor(beautify, academic_options)
+    style_options = build_style_options(source_filename, beautify, academic_options)
+    result_cache = get_result_cache()
+    cache_key = result_cache_key(original_code, style_options) if result_cache else None
+    if result_cache:
+        cached_code = result_cache.get(cache_key)
+        if cached_code is not None:
+            PIPELINE_RUNS.inc(outcome='cache_hit')
+            yield "命中结果缓存，跳过翻译与AI重构" if needs_refactor else "命中结果缓存，跳过翻译"
+            return cached_code
 
     try:
-        tree = ast.parse(original_code)
+        with stage_timer('parse'):
+            tree = ast.parse(original_code)
     except SyntaxError as e:
-        print(f"Python 代码语法错误，无法解析: {e}")
-        return
+        PIPELINE_RUNS.inc(outcome='syntax_error')
+        yield f"Python 代码语法错误，无法解析: {e}"
+        return None
 
-    texts_to_translate = {}
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Call) and hasattr(node.func, 'attr') and node.func.attr in TARGET_PLOT_FUNCTIONS:
-            for arg in node.args:
-                if isinstance(arg, ast.Constant) and isinstance(arg.value, str) and arg.value.strip():
-                    texts_to_translate[arg.value] = arg.value
-            for kw in node.keywords:
-                if isinstance(kw.value, ast.Constant) and isinstance(kw.value.value, str) and kw.value.value.strip():
-                    texts_to_translate[kw.value.value] = kw.value.value
-    code_lines = original_code.split('\n')
-    for line in code_lines:
-        line_stripped = line.strip()
-        if line_stripped.startswith('#'):
-            comment_text = line_stripped[1:].strip()
-            if comment_text and re.search('[a-zA-Z]', comment_text):
-                texts_to_translate[comment_text] = comment_text
-    
-    translated_code = original_code
-    if texts_to_translate:
-        print(f"找到 {len(texts_to_translate)} 条需要翻译的文本，正在请求翻译...")
-        translation_map = translate_texts(texts_to_translate)
+    with stage_timer('extract'):
+        spans = extract_translatable_spans(original_code, tree)
+        texts_to_translate = {span.text: span.text for span in spans}
+
+    translation_map = None
+    refactored_result = None
+    refactor_attempted = False
+    parallel = bool(texts_to_translate and needs_refactor and PARALLEL_TRANSLATE_REFACTOR)
+    if parallel:
+        # 重构提示词要求原样保留文本，因此翻译与重构可以同时进行，再把译文写回重构结果
+        code_with_font_support, font_injected = _with_font_support(original_code)
+        if font_injected:
+            yield "已注入中文字体支持"
+        yield f"找到 {len(texts_to_translate)} 条需要翻译的文本，开始并发执行翻译与AI代码重构..."
+        translation_map, refactored_code = yield from merge_streams([
+            _timed_stream('translate', translate_texts_streaming(texts_to_translate)),
+            _timed_stream('refactor', _stream_partial_code(
+                refactor_and_style_code_streaming(code_with_font_support, style_options))),
+        ])
         if not translation_map:
-            print("翻译失败，跳过翻译步骤。")
+            yield "翻译失败，跳过翻译步骤。"
+        refactor_attempted = True
+        if refactored_code and translation_map:
+            with stage_timer('rebuild'):
+                refactored_result = yield from _translate_refactored_code(refactored_code, spans, translation_map)
+            if refactored_result is None:
+                yield "部分文本在重构结果中无法定位，改为先翻译、再重构的串行流程..."
+                refactor_attempted = False
         else:
-            print("翻译完成，开始重建代码...")
-            sorted_eng_texts = sorted(translation_map.keys(), key=len, reverse=True)
-            modified_code = original_code
-            for eng_text in sorted_eng_texts:
-                zh_text = translation_map.get(eng_text, eng_text)
-                modified_code = modified_code.replace(f'"{eng_text}"', f'"{zh_text}"')
-                modified_code = modified_code.replace(f"'{eng_text}'", f"'{zh_text}'")
-                temp_lines = []
-                for line in modified_code.split('\n'):
-                    stripped_line = line.strip()
-                    if stripped_line.startswith(f'# {eng_text}') or stripped_line.startswith(f'#{eng_text}'):
-                        temp_lines.append(line.replace(eng_text, zh_text))
-                    else:
-                        temp_lines.append(line)
-                modified_code = '\n'.join(temp_lines)
-            translated_code = modified_code
+            refactored_result = refactored_code
+    elif texts_to_translate:
+        yield f"找到 {len(texts_to_translate)} 条需要翻译的文本，正在请求翻译..."
+        with stage_timer('translate'):
+            translation_map = yield from translate_texts_streaming(texts_to_translate)
+        if not translation_map:
+            yield "翻译失败，跳过翻译步骤。"
+        else:
+            yield "翻译完成，开始重建代码..."
     else:
-        print("未找到需要翻译的英文文本。")
-
-    modified_code_lines = translated_code.split('\n')
-    if not any("plt.rcParams['font.sans-serif']" in line for line in modified_code_lines):
-        inject_chinese_font_support(modified_code_lines)
-    
-    final_code_with_font_support = '\n'.join(modified_code_lines)
-    final_code = final_code_with_font_support
-    
-    refactored_result = None
-    if beautify or (academic_options and academic_options.get('enabled')):
-        base, _ = os.path.splitext(filepath)
-        output_filename_base = f"{base}_figure" # 传递给 AI 用于生成保存文件名
+        yield "未找到需要翻译的英文文本。"
 
-        style_options = academic_options if academic_options else {}
-        style_options['beautify_layout'] = beautify
-        style_options['output_filename_base'] = output_filename_base
-        
-        refactored_result = refactor_and_style_code(final_code_with_font_support, style_options)
-        
+    final_code = refactored_result
+    if not refactored_result:
+        with stage_timer('rebuild'):
+            translated_code = apply_translations(original_code, spans, translation_map) if translation_map else original_code
+            final_code, font_injected = _with_font_support(translated_code)
+        if font_injected and not parallel:
+            yield "已注入中文字体支持"
+
+    if fast_mode and beautify:
+        yield "快速模式下跳过 AI 布局美化。"
+    if needs_refactor and not refactor_attempted:
+        yield "开始AI代码重构与风格美化..."
+        with stage_timer('refactor'):
+            refactored_result = yield from _stream_partial_code(
+                refactor_and_style_code_streaming(final_code, style_options)
+            )
         if refactored_result:
             final_code = refactored_result
-            print("AI 代码重构与风格美化成功。")
-        else:
-            print("AI 代码重构失败或跳过。")
 
-    if not refactored_result and academic_options and academic_options.get('enabled'):
-        print("正在执行备用方案：直接注入学术风格代码...")
-        code_lines = final_code.split('\n')
-        
-        matplotlib_import_index = -1
-        for i, line in enumerate(code_lines):
-            if re.search(r'import\s+matplotlib\.pyplot\s+as\s+plt', line):
-                matplotlib_import_index = i
-                break
-        
-        if matplotlib_import_index != -1:
-            style_code_block = create_academic_style_code_block(academic_options)
-            code_lines.insert(matplotlib_import_index + 1, style_code_block)
-            print("已注入字体、字号和尺寸设置。")
+    if needs_refactor:
+        if refactored_result:
+            yield "AI 代码重构与风格美化成功。"
         else:
-            print("警告：未找到 matplotlib 导入语句，无法注入样式代码。")
+            yield "AI 代码重构失败或跳过。"
 
-        vector_format = academic_options.get('vector_format')
-        dpi = academic_options.get('dpi', 300)
-        code_lines = inject_savefig_before_show(code_lines, vector_format, filepath, dpi)
-        
-        final_code = '\n'.join(code_lines)
+    if not refactored_result and academic_options.get('enabled'):
+        if fast_mode:
+            yield "快速模式：使用本地规则应用学术风格..."
+        else:
+            yield "正在执行备用方案：直接注入学术风格代码..."
+        with stage_timer('fallback'):
+            try:
+                final_code, notes = apply_local_academic_style(final_code, academic_options, source_filename)
+            except SyntaxError:
+                final_code, notes = _apply_style_by_lines(final_code, academic_options, source_filename)
+        for note in notes:
+            yield note
+
+    # 只缓存完整的结果：需要重构时 AI 重构成功，只翻译（或快速模式）时所有文本都已翻译，
+    # 避免把临时失败后的备用结果固定下来
+    translation_complete = all(text in (translation_map or {}) for text in texts_to_translate)
+    if result_cache and (refactored_result if needs_refactor else translation_complete):
+        result_cache.put(cache_key, final_code)
+
+    PIPELINE_RUNS.inc(outcome='ok')
+    return final_code
 
-    base, ext = os.path.splitext(filepath)
-    new_filepath = f"{base}_zh_revision{ext}"
-    
-    try:
-        with open(new_filepath, 'w', encoding='utf-8') as f:
-            f.write(final_code)
-        print(f"--- 处理完成！修改后的文件已保存至: {new_filepath} ---")
-    except Exception as e:
-        print(f"保存文件失败: {e}")
+def process_python_file(filepath: str, beautify: bool = False, academic_options: Optional[Dict[str, Any]] = None) -> None:
+    """
+    处理单个Python文件：翻译、风格化，并应用备用注入方案。
+    结果保存在源文件旁边。
+    """
+    print(f"--- 开始处理文件: {filepath} ---")
+    output_folder = os.path.dirname(os.path.abspath(filepath))
+    for status in process_python_file_streaming(filepath, output_folder, beautify, academic_options):
+        if not status.startswith(("SUCCESS:", PARTIAL_PREFIX)):
+            print(status)
 
 def process_python_file_streaming(filepath: str, output_folder: str, beautify: bool = False, academic_options: Optional[Dict[str, Any]] = None):
     """
     处理单个Python文件：翻译、风格化，并应用备用注入方案。
     返回一个生成器，用于流式传输处理状态。
     """
+    if filepath.lower().endswith('.ipynb'):
+        # 笔记本模块依赖本模块，在这里延迟导入以避免循环导入
+        from core.notebook import process_notebook_streaming
+        yield from process_notebook_streaming(filepath, output_folder, beautify, academic_options)
+        return
+
     yield "开始处理文件..."
-    
-    if academic_options is None:
-        academic_options = {'enabled': False}
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with stage_timer('read'), open(filepath, 'r', encoding='utf-8') as f:
             original_code = f.read()
         yield "文件读取成功"
     except Exception as e:
         yield f"读取文件失败: {e}"
         return
 
-    try:
-        tree = ast.parse(original_code)
-    except SyntaxError as e:
-        yield f"Python 代码语法错误，无法解析: {e}"
+    final_code = yield from process_code_streaming(original_code, filepath, beautify, academic_options)
+    if final_code is None:
         return
 
-    texts_to_translate = {}
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Call) and hasattr(node.func, 'attr') and node.func.attr in TARGET_PLOT_FUNCTIONS:
-            for arg in node.args:
-                if isinstance(arg, ast.Constant) and isinstance(arg.value, str) and arg.value.strip():
-                    texts_to_translate[arg.value] = arg.value
-            for kw in node.keywords:
-                if isinstance(kw.value, ast.Constant) and isinstance(kw.value.value, str) and kw.value.value.strip():
-                    texts_to_translate[kw.value.value] = kw.value.value
-    code_lines = original_code.split('\n')
-    for line in code_lines:
-        line_stripped = line.strip()
-        if line_stripped.startswith('#'):
-            comment_text = line_stripped[1:].strip()
-            if comment_text and re.search('[a-zA-Z]', comment_text):
-                texts_to_translate[comment_text] = comment_text
-    
-    translated_code = original_code
-    if texts_to_translate:
-        yield f"找到 {len(texts_to_translate)} 条需要翻译的文本，正在请求翻译..."
-        translation_map = translate_texts(texts_to_translate)
-        if not translation_map:
-            yield "翻译失败，跳过翻译步骤。"
-        else:
-            yield "翻译完成，开始重建代码..."
-            sorted_eng_texts = sorted(translation_map.keys(), key=len, reverse=True)
-            modified_code = original_code
-            for eng_text in sorted_eng_texts:
-                zh_text = translation_map.get(eng_text, eng_text)
-                modified_code = modified_code.replace(f'"{eng_text}"', f'"{zh_text}"')
-                modified_code = modified_code.replace(f"'{eng_text}'", f"'{zh_text}'")
-                temp_lines = []
-                for line in modified_code.split('\n'):
-                    stripped_line = line.strip()
-                    if stripped_line.startswith(f'# {eng_text}') or stripped_line.startswith(f'#{eng_text}'):
-                        temp_lines.append(line.replace(eng_text, zh_text))
-                    else:
-                        temp_lines.append(line)
-                modified_code = '\n'.join(temp_lines)
-            translated_code = modified_code
-    else:
-        yield "未找到需要翻译的英文文本。"
-
-    modified_code_lines = translated_code.split('\n')
-    if not any("plt.rcParams['font.sans-serif']" in line for line in modified_code_lines):
-        inject_chinese_font_support(modified_code_lines)
-        yield "已注入中文字体支持"
-    
-    final_code_with_font_support = '\n'.join(modified_code_lines)
-    final_code = final_code_with_font_support
-    
-    refactored_result = None
-    if beautify or (academic_options and academic_options.get('enabled')):
-        original_filename = os.path.basename(filepath)
-        base, _ = os.path.splitext(original_filename)
-        output_filename_base = f"{base}_figure"
-
-        style_options = academic_options if academic_options else {}
-        style_options['beautify_layout'] = beautify
-        style_options['output_filename_base'] = output_filename_base
-        
-        yield "开始AI代码重构与风格美化..."
-        refactored_result = refactor_and_style_code(final_code_with_font_support, style_options)
-        
-        if refactored_result:
-            final_code = refactored_result
-            yield "AI 代码重构与风格美化成功。"
-        else:
-            yield "AI 代码重构失败或跳过。"
-
-    if not refactored_result and academic_options and academic_options.get('enabled'):
-        yield "正在执行备用方案：直接注入学术风格代码..."
-        code_lines = final_code.split('\n')
-        
-        matplotlib_import_index = -1
-        for i, line in enumerate(code_lines):
-            if re.search(r'import\s+matplotlib\.pyplot\s+as\s+plt', line):
-                matplotlib_import_index = i
-                break
-        
-        if matplotlib_import_index != -1:
-            style_code_block = create_academic_style_code_block(academic_options)
-            code_lines.insert(matplotlib_import_index + 1, style_code_block)
-            yield "已注入字体、字号和尺寸设置。"
-        else:
-            yield "警告：未找到 matplotlib 导入语句，无法注入样式代码。"
-
-        vector_format = academic_options.get('vector_format')
-        dpi = academic_options.get('dpi', 300)
-        code_lines = inject_savefig_before_show(code_lines, vector_format, filepath, dpi)
-        
-        final_code = '\n'.join(code_lines)
-
     # 使用os.path.basename获取纯文件名，避免路径问题
     original_filename = os.path.basename(filepath)
     base, ext = os.path.splitext(original_filename)
@@ -591,7 +947,7 @@ def process_python_file_streaming(filepath: str, output_folder: str, beautify: b
     new_filepath = os.path.join(output_folder, new_filename)
     
     try:
-        with open(new_filepath, 'w', encoding='utf-8') as f:
+        with stage_timer('write'), open(new_filepath, 'w', encoding='utf-8') as f:
             f.write(final_code)
         yield f"处理完成！修改后的文件已保存至: {new_filepath}"
         yield f"SUCCESS:{new_filename}"
@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+# --- 配置区 ---
+GLOSSARY_ENABLED = os.getenv('GLOSSARY_ENABLED', '1') != '0'
+# 额外的用户术语表（JSON），多个路径用系统路径分隔符隔开；后加载的条目覆盖内置条目
+GLOSSARY_PATHS = [path for path in os.getenv('GLOSSARY_PATHS', '').split(os.pathsep) if path.strip()]
+BUILTIN_GLOSSARY_PATH = str(Path(__file__).parent / 'glossary_zh.json')
+
+# 末尾的单位说明，如 "Time (s)"、"Frequency [Hz]"、"Speed (m/s)"
+_UNIT_SUFFIX_RE = re.compile(r'^(?P<base>.*?\S)\s*(?P<unit>\((?P<inner_paren>[^()]{1,24})\)|\[(?P<inner_bracket>[^\[\]]{1,24})\])$')
+# 符号形式的单位（s、Hz、m/s、%、°C、$\mu$m、a.u.）原样保留；连续四个以上小写字母视为普通单词
+_UNIT_SYMBOL_RE = re.compile(r'^[^\s]{1,12}$')
+_WORD_RE = re.compile(r'[a-z]{4,}')
+_TRAILING_PUNCT = ' :：.'
+
+
+def normalize_term(text: str) -> str:
+    """规范化术语：合并空白、忽略大小写并去掉结尾的冒号和句点。"""
+    return ' '.join(text.split()).rstrip(_TRAILING_PUNCT).casefold()
+
+
+def _is_unit_symbol(unit: str) -> bool:
+    return bool(_UNIT_SYMBOL_RE.match(unit)) and not _WORD_RE.search(unit)
+
+
+class Glossary:
+    """
+    内置的科研绘图常用术语表，在调用 LLM 翻译之前先行查找。
+    只做整条文本的精确匹配（规范化后），末尾括号中的单位按符号原样保留或按术语翻译。
+    """
+
+    def __init__(self, terms: Optional[Dict[str, str]] = None):
+        self._terms: Dict[str, str] = {}
+        if terms:
+            self.update(terms)
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def update(self, terms: Dict[str, str]) -> None:
+        for source, translation in terms.items():
+            if isinstance(source, str) and isinstance(translation, str) and source.strip() and translation.strip():
+                self._terms[normalize_term(source)] = translation.strip()
+
+    def _lookup_exact(self, text: str) -> Optional[str]:
+        return self._terms.get(normalize_term(text))
+
+    def lookup(self, text: str) -> Optional[str]:
+        """返回整条文本的译文（保留结尾的冒号等标点）；不是已知术语时返回 None。"""
+        collapsed = ' '.join(text.split())
+        stem = collapsed.rstrip(_TRAILING_PUNCT)
+        if not stem:
+            return None
+        translation = self._lookup_term(stem)
+        return None if translation is None else translation + collapsed[len(stem):]
+
+    def _lookup_term(self, term: str) -> Optional[str]:
+        translation = self._lookup_exact(term)
+        if translation is not None:
+            return translation
+
+        match = _UNIT_SUFFIX_RE.match(term)
+        if not match:
+            return None
+        base = self._lookup_exact(match.group('base'))
+        if base is None:
+            return None
+        unit = match.group('unit')
+        inner = (match.group('inner_paren') or match.group('inner_bracket')).strip()
+        if not _is_unit_symbol(inner):
+            inner_translation = self._lookup_exact(inner)
+            if inner_translation is None:
+                return None
+            unit = unit[0] + inner_translation + unit[-1]
+        return f"{base} {unit}"
+
+    def translate_many(self, texts: Iterable[str]) -> Dict[str, str]:
+        """批量查找，返回命中的 {原文: 译文}。"""
+        hits: Dict[str, str] = {}
+        for text in texts:
+            if text in hits:
+                continue
+            translation = self.lookup(text)
+            if translation is not None:
+                hits[text] = translation
+        return hits
+
+
+def load_glossary_file(path: str) -> Dict[str, str]:
+    """读取术语表 JSON：既可以是 {"原文": "译文"}，也可以是 {"terms": {...}}。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, dict) and isinstance(data.get('terms'), dict):
+        data = data['terms']
+    if not isinstance(data, dict):
+        raise ValueError(f"术语表格式错误（应为 JSON 对象）: {path}")
+    return data
+
+
+def load_glossary(paths: List[str]) -> Glossary:
+    """依次加载内置术语表和用户术语表；无法读取的用户文件会被跳过并打印原因。"""
+    glossary = Glossary(load_glossary_file(BUILTIN_GLOSSARY_PATH))
+    for path in paths:
+        try:
+            glossary.update(load_glossary_file(path))
+        except (OSError, ValueError) as e:
+            print(f"无法加载术语表 {path}，已跳过: {e}")
+    return glossary
+
+
+_glossary: Optional[Glossary] = None
+_glossary_lock = threading.Lock()
+
+
+def get_glossary() -> Optional[Glossary]:
+    """返回进程内共享的术语表；禁用时返回 None。"""
+    global _glossary
+    if not GLOSSARY_ENABLED:
+        return None
+    with _glossary_lock:
+        if _glossary is None:
+            _glossary = load_glossary(GLOSSARY_PATHS)
+        return _glossary
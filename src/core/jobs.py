@@ -0,0 +1,408 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.metrics import JOBS_COALESCED
+from core.status import status_sink
+from core.tracing import DEBUG_TRACE_ENABLED, TRACE_ENABLED, Trace, span, trace_session
+
+# --- 配置区 ---
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '4'))
+JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', str(Path(__file__).parent.parent.parent / 'uploads' / 'jobs.sqlite3'))
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED_STATES = {SUCCEEDED, FAILED}
+
+# 只含此键的事件是模型输出的增量代码，不逐条持久化，见 JobManager._insert_partial()
+PARTIAL_KEY = 'partial_code'
+
+JobRunner = Callable[[str, Dict[str, Any]], Iterator[Dict[str, Any]]]
+
+
+class JobManager:
+    """
+    后台任务队列：submit() 立即返回任务 ID，由独立的工作线程池执行 runner。
+    任务状态和事件持久化在 SQLite 中，订阅者可以从任意事件序号继续读取（用于 SSE 断线重连）。
+
+    runner(job_id, payload) 逐个产出事件字典；包含 'success' 的事件表示任务成功，
+    包含 'error' 的事件表示失败。runner 结束时若两者都没有出现，任务记为失败。
+    只含 PARTIAL_KEY 的事件是增量代码：每个任务只保存一行累计的代码，重放时合并为一个事件。
+    """
+
+    def __init__(self, db_path: str, runner: JobRunner, num_workers: int = JOB_WORKERS):
+        self.runner = runner
+        self.num_workers = num_workers
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._events_changed = threading.Condition()
+        self._next_seq: Dict[str, int] = {}
+        self._workers: List[threading.Thread] = []
+        self._wait_times: List[float] = []
+        # 合并键 -> 进行中（排队或运行）的任务 ID；相同请求直接附加到该任务上
+        self._inflight: Dict[str, str] = {}
+        self._inflight_keys: Dict[str, str] = {}
+        self._coalesced = 0
+        # 运行中任务的追踪记录；任务结束后写入 job_traces 表
+        self._traces: Dict[str, Trace] = {}
+        # 运行中任务的增量代码：[(事件序号, 该段在累计代码中的起始位置)]，用于断线重连时只补发缺失的部分
+        self._partial_marks: Dict[str, List[Tuple[int, int]]] = {}
+        self._partial_lengths: Dict[str, int] = {}
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            " job_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " data TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (job_id, seq))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_partials ("
+            " job_id TEXT PRIMARY KEY,"
+            " first_seq INTEGER NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " code TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_traces ("
+            " job_id TEXT PRIMARY KEY,"
+            " data TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+
+    # --- 生命周期 ---
+
+    def start(self) -> None:
+        """启动工作线程，并处理上次进程退出时遗留的任务。"""
+        with self._start_lock:
+            if self._workers:
+                return
+            self._recover()
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+                worker.start()
+                self._workers.append(worker)
+
+    def _recover(self) -> None:
+        with self._lock:
+            interrupted = self._conn.execute("SELECT id FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            queued = self._conn.execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)).fetchall()
+            for (job_id,) in interrupted + queued:
+                self._next_seq[job_id] = self._max_seq(job_id) + 1
+        for (job_id,) in interrupted:
+            error = "服务重启，任务被中断，请重新上传"
+            self.append_event(job_id, {"error": error})
+            self._finish(job_id, FAILED, error=error)
+        for (job_id,) in queued:
+            self._queue.put(job_id)
+
+    # --- 提交与查询 ---
+
+    def submit(self, payload: Dict[str, Any]) -> str:
+        """登记任务并放入队列，立即返回任务 ID。"""
+        job_id, _ = self.submit_coalesced(payload, None)
+        return job_id
+
+    def submit_coalesced(self, payload: Dict[str, Any], coalesce_key: Optional[str]) -> Tuple[str, bool]:
+        """
+        与 submit() 相同，但若已有合并键相同且尚未结束的任务，则不新建任务，直接返回该任务的 ID。
+        返回 (任务 ID, 是否附加到了已有任务)；附加的调用方订阅同一个事件流、获得同一份输出。
+        """
+        self.start()
+        with self._lock:
+            existing = self._inflight.get(coalesce_key) if coalesce_key else None
+            if existing is None:
+                job_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO jobs (id, status, payload, created_at) VALUES (?, ?, ?, ?)",
+                    (job_id, QUEUED, json.dumps(payload, ensure_ascii=False), time.time())
+                )
+                self._next_seq[job_id] = 1
+                if coalesce_key:
+                    self._inflight[coalesce_key] = job_id
+                    self._inflight_keys[job_id] = coalesce_key
+            else:
+                self._coalesced += 1
+                # 在锁内写入事件：已有任务此时一定尚未结束，事件不会落在 _finish() 之后
+                self._insert_event(existing, {"status": "又有一个相同的请求（文件内容与选项一致）加入了此任务"})
+        if existing is not None:
+            JOBS_COALESCED.inc()
+            with self._events_changed:
+                self._events_changed.notify_all()
+            return existing, True
+        self.append_event(job_id, {"status": f"任务已进入队列（前方 {self._queue.qsize()} 个任务）"})
+        self._queue.put(job_id)
+        return job_id, False
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, payload, result, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'status', 'payload', 'result', 'error', 'created_at', 'started_at', 'finished_at')
+        job = dict(zip(keys, row))
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def _max_seq(self, job_id: str) -> int:
+        """已用过的最大事件序号（包括增量代码），调用方需持有 self._lock。"""
+        return self._conn.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(seq) FROM job_events WHERE job_id = ?), 0),"
+            " COALESCE((SELECT seq FROM job_partials WHERE job_id = ?), 0))", (job_id, job_id)
+        ).fetchone()[0]
+
+    def _allocate_seq(self, job_id: str) -> int:
+        """分配下一个事件序号，调用方需持有 self._lock。"""
+        seq = self._next_seq.get(job_id)
+        if seq is None:
+            # 已结束的任务不再缓存序号（例如任务结束后才到达的 report_status），从数据库中取下一个
+            return self._max_seq(job_id) + 1
+        self._next_seq[job_id] = seq + 1
+        return seq
+
+    def _insert_event(self, job_id: str, data: Dict[str, Any]) -> int:
+        """写入一条事件，调用方需持有 self._lock。"""
+        seq = self._allocate_seq(job_id)
+        self._conn.execute(
+            "INSERT INTO job_events (job_id, seq, data, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, seq, json.dumps(data, ensure_ascii=False), time.time())
+        )
+        return seq
+
+    def _insert_partial(self, job_id: str, code: str) -> int:
+        """
+        追加一段增量代码，调用方需持有 self._lock。
+        增量代码约每 0.1 秒一段，逐条写入事件表会让事件表随代码长度成倍膨胀；
+        这里只在 job_partials 中维护一行累计的代码，序号更新为最新一段的序号。
+        """
+        seq = self._allocate_seq(job_id)
+        self._conn.execute(
+            "INSERT INTO job_partials (job_id, first_seq, seq, code) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (job_id) DO UPDATE SET seq = excluded.seq, code = code || excluded.code",
+            (job_id, seq, seq, code)
+        )
+        offset = self._partial_lengths.get(job_id, 0)
+        self._partial_marks.setdefault(job_id, []).append((seq, offset))
+        self._partial_lengths[job_id] = offset + len(code)
+        return seq
+
+    def append_event(self, job_id: str, data: Dict[str, Any]) -> int:
+        with self._lock:
+            if set(data) == {PARTIAL_KEY}:
+                seq = self._insert_partial(job_id, data[PARTIAL_KEY])
+            else:
+                seq = self._insert_event(job_id, data)
+        with self._events_changed:
+            self._events_changed.notify_all()
+        return seq
+
+    def events_after(self, job_id: str, after_seq: int = 0) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after_seq)
+            ).fetchall()
+            partial = self._conn.execute(
+                "SELECT first_seq, seq, code FROM job_partials WHERE job_id = ? AND seq > ?", (job_id, after_seq)
+            ).fetchone()
+            marks = list(self._partial_marks.get(job_id, ()))
+        events = [(seq, json.loads(data)) for seq, data in rows]
+        if partial is not None:
+            first_seq, seq, code = partial
+            if after_seq >= first_seq:
+                # 订阅者已收到前面的部分，只补发之后的代码；进程重启后没有分段记录，无法补发
+                offset = next((start for mark_seq, start in marks if mark_seq > after_seq), None)
+                code = code[offset:] if offset is not None else None
+            if code:
+                # 错过的增量代码合并为一个事件，位置取最新一段的序号
+                events.append((seq, {PARTIAL_KEY: code}))
+                events.sort(key=lambda event: event[0])
+        return events
+
+    def active_payloads(self) -> List[Dict[str, Any]]:
+        """排队中和运行中任务的 payload。"""
+        with self._lock:
+            rows = self._conn.execute("SELECT payload FROM jobs WHERE status IN (?, ?)", (QUEUED, RUNNING)).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def prune(self, max_age: float, job_ids: Iterable[str] = ()) -> int:
+        """
+        删除结束超过 max_age 秒的任务，以及 job_ids 中已结束的任务，连同它们的事件与追踪。
+        排队中和运行中的任务不会被删除。返回删除的任务数。
+        """
+        cutoff = time.time() - max_age
+        finished = tuple(FINISHED_STATES)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?", finished + (cutoff,)
+            ).fetchall()
+            ids = {job_id for (job_id,) in rows}
+            for job_id in set(job_ids) - ids:
+                row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row and row[0] in FINISHED_STATES:
+                    ids.add(job_id)
+            for job_id in ids:
+                self._conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM job_partials WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM job_traces WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return len(ids)
+
+    def trace(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """任务的 Chrome trace-event JSON；运行中的任务返回目前为止的记录，没有追踪时返回 None。"""
+        trace = self._traces.get(job_id)
+        if trace is not None:
+            return trace.to_chrome()
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM job_traces WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def wait_for_events(self, job_id: str, after_seq: int, timeout: float) -> Tuple[List[Tuple[int, Dict[str, Any]]], bool]:
+        """
+        返回序号大于 after_seq 的事件；暂无新事件时最多等待 timeout 秒。
+        第二个返回值表示任务是否已经结束。
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            events = self.events_after(job_id, after_seq)
+            job = self.get(job_id)
+            finished = job is None or job['status'] in FINISHED_STATES
+            remaining = deadline - time.monotonic()
+            if events or finished or remaining <= 0:
+                return events, finished
+            with self._events_changed:
+                self._events_changed.wait(min(remaining, 1.0))
+
+    def stats(self) -> Dict[str, Any]:
+        """队列深度、运行中任务数以及最近任务的排队等待时间。"""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest_queued = self._conn.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+            wait_times = list(self._wait_times)
+        return {
+            'workers': self.num_workers,
+            'queue_depth': counts.get(QUEUED, 0),
+            'running': counts.get(RUNNING, 0),
+            'succeeded': counts.get(SUCCEEDED, 0),
+            'failed': counts.get(FAILED, 0),
+            'oldest_queued_seconds': time.time() - oldest_queued if oldest_queued else 0.0,
+            'avg_wait_seconds': sum(wait_times) / len(wait_times) if wait_times else 0.0,
+            'max_wait_seconds': max(wait_times) if wait_times else 0.0,
+            'coalesced': self._coalesced,
+        }
+
+    # --- 执行 ---
+
+    def _worker_loop(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"任务 {job_id} 执行时发生未处理的错误: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str) -> None:
+        job = self.get(job_id)
+        if job is None or job['status'] != QUEUED:
+            return
+        started_at = time.time()
+        wait_seconds = started_at - job['created_at']
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET status = ?, started_at = ? WHERE id = ?", (RUNNING, started_at, job_id))
+            # 只保留最近的等待时间样本用于统计
+            self._wait_times = (self._wait_times + [wait_seconds])[-200:]
+        # 追踪 ID 与任务 ID 相同；开启了 /debug/trace/<id> 时随首个事件发送给前端
+        started_event = {"status": f"开始处理（排队等待 {wait_seconds:.1f} 秒）"}
+        trace = Trace(job_id) if TRACE_ENABLED else None
+        if trace is not None:
+            trace.add_span('queued', 'job', job['created_at'], started_at)
+            self._traces[job_id] = trace
+            if DEBUG_TRACE_ENABLED:
+                started_event['trace_id'] = job_id
+        self.append_event(job_id, started_event)
+
+        result = None
+        error = None
+        last_status = None
+        try:
+            # 深层代码（例如 DeepSeek 限流排队）通过 report_status() 直接写入该任务的事件流
+            with trace_session(trace), span('job', 'job'), \
+                    status_sink(lambda message: self.append_event(job_id, {"status": message})):
+                for event in self.runner(job_id, job['payload']):
+                    self.append_event(job_id, event)
+                    if event.get('success'):
+                        result = event
+                    elif event.get('error'):
+                        error = event['error']
+                    elif event.get('status'):
+                        last_status = event['status']
+        except Exception as e:
+            error = f"An unexpected error occurred in the job: {e}"
+            self.append_event(job_id, {"error": error})
+
+        if trace is not None:
+            self._save_trace(job_id, trace)
+
+        if result is not None:
+            self._finish(job_id, SUCCEEDED, result=result)
+        else:
+            if error is None:
+                # 流水线在出错时只产出普通状态（例如语法错误），把最后一条状态作为失败原因
+                error = last_status or "处理未完成"
+                self.append_event(job_id, {"error": error})
+            self._finish(job_id, FAILED, error=error)
+
+    def _save_trace(self, job_id: str, trace: Trace) -> None:
+        data = json.dumps(trace.to_chrome(), ensure_ascii=False)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO job_traces (job_id, data) VALUES (?, ?)", (job_id, data))
+        self._traces.pop(job_id, None)
+
+    def _finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result else None, error, time.time(), job_id)
+            )
+            self._next_seq.pop(job_id, None)
+            self._partial_marks.pop(job_id, None)
+            self._partial_lengths.pop(job_id, None)
+            # 任务结束后，新的相同请求重新排队（通常会命中结果缓存）
+            coalesce_key = self._inflight_keys.pop(job_id, None)
+            if coalesce_key is not None:
+                self._inflight.pop(coalesce_key, None)
+        with self._events_changed:
+            self._events_changed.notify_all()
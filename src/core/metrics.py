@@ -0,0 +1,245 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from core.tracing import span
+
+# 默认的耗时分桶（秒），覆盖从毫秒级的本地处理到数分钟的模型调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# 上传文件大小分桶（字节）
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """带标签的指标基类；每组标签值对应一份独立的数值，所有更新都在一把锁内完成。"""
+
+    type_name = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels: str) -> Iterator[None]:
+        """在 with 块执行期间把数值加一，用于统计正在处理的请求或任务数。"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        # 每个分桶只记录落在该区间内的次数，输出时再累加，observe 只需一次二分查找
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """记录 with 块的执行耗时（秒）。"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(state[0]), state[1], state[2])) for key, state in self._values.items())
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), bucket_counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, (('le', _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    """进程内的指标注册表，render() 输出 Prometheus 文本格式。同名指标只注册一次。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric_class, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            elif not isinstance(metric, metric_class):
+                raise ValueError(f"指标 {name} 已以其它类型注册")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+# --- 流水线指标 ---
+STAGE_SECONDS = REGISTRY.histogram(
+    'academicplot_stage_seconds', '处理流水线各阶段耗时（秒）', ['stage'])
+PIPELINE_RUNS = REGISTRY.counter(
+    'academicplot_pipeline_runs_total', '流水线运行次数，按结果分类', ['outcome'])
+
+# --- DeepSeek 调用指标 ---
+DEEPSEEK_REQUESTS = REGISTRY.counter(
+    'academicplot_deepseek_requests_total', 'DeepSeek API 调用次数（含重试的一次调用计为一次）', ['mode', 'outcome'])
+DEEPSEEK_LATENCY = REGISTRY.histogram(
+    'academicplot_deepseek_request_seconds', 'DeepSeek API 调用耗时（秒，含重试等待）', ['mode'])
+DEEPSEEK_FIRST_TOKEN = REGISTRY.histogram(
+    'academicplot_deepseek_first_token_seconds', '流式调用收到首个 token 的耗时（秒）')
+DEEPSEEK_ERRORS = REGISTRY.counter(
+    'academicplot_deepseek_errors_total', 'DeepSeek API 请求失败次数（含随后重试成功的失败）', ['reason'])
+DEEPSEEK_RETRIES = REGISTRY.counter(
+    'academicplot_deepseek_retries_total', 'DeepSeek API 重试次数')
+DEEPSEEK_QUEUE_WAIT = REGISTRY.histogram(
+    'academicplot_deepseek_queue_wait_seconds', '调用 DeepSeek 前在限流队列中的等待时间（秒）')
+DEEPSEEK_QUEUE_WAITING = REGISTRY.gauge(
+    'academicplot_deepseek_queue_waiting', '正在限流队列中等待的 DeepSeek 调用数')
+DEEPSEEK_TOKENS = REGISTRY.counter(
+    'academicplot_deepseek_tokens_total', 'DeepSeek 响应 usage 字段报告的 token 数', ['kind'])
+GLOSSARY_LOOKUPS = REGISTRY.counter(
+    'academicplot_glossary_lookups_total', '翻译前查找内置术语表的文本条数，result 为 hit / miss', ['result'])
+
+# --- 预览渲染 ---
+RENDER_SECONDS = REGISTRY.histogram(
+    'academicplot_render_seconds', '渲染预览的耗时（秒），outcome 为 ok / script_error / failed / cached', ['outcome'])
+
+# --- Web 指标 ---
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'academicplot_http_requests_in_flight', '正在处理的 HTTP 请求数', ['endpoint'])
+JOBS_IN_FLIGHT = REGISTRY.gauge(
+    'academicplot_jobs_in_flight', '正在执行的后台任务数')
+JOBS_COALESCED = REGISTRY.counter(
+    'academicplot_jobs_coalesced_total', '附加到进行中的相同任务、未单独执行的请求数')
+JOB_QUEUE_DEPTH = REGISTRY.gauge(
+    'academicplot_job_queue_depth', '排队等待执行的后台任务数（抓取时更新）')
+STORAGE_BYTES = REGISTRY.gauge(
+    'academicplot_storage_bytes', '磁盘占用字节数（每轮存储清理后更新）', ['area'])
+UPLOAD_BYTES = REGISTRY.histogram(
+    'academicplot_upload_bytes', '上传文件大小（字节）', ['endpoint'], buckets=SIZE_BUCKETS)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """记录流水线某一阶段耗时的上下文管理器，例如 with stage_timer('parse'): ...；同时记入当前任务的追踪。"""
+    with STAGE_SECONDS.time(stage=stage), span(stage, 'stage'):
+        yield
+
+
+def record_token_usage(usage) -> None:
+    """累计 OpenAI 兼容响应中 usage 字段的 prompt/completion token 数。"""
+    if not isinstance(usage, dict):
+        return
+    for kind in ('prompt_tokens', 'completion_tokens'):
+        value = usage.get(kind)
+        if isinstance(value, (int, float)) and value > 0:
+            DEEPSEEK_TOKENS.inc(value, kind=kind[:-len('_tokens')])
@@ -0,0 +1,308 @@
+import ast
+import json
+import os
+import re
+from typing import Any, Dict, Generator, List, Optional, Tuple
+
+try:
+    import ijson  # 可选依赖：大型笔记本流式解析
+except ImportError:
+    ijson = None
+
+from core.cache import get_result_cache
+from core.enhanced_agent import PARTIAL_PREFIX, inject_chinese_font_support, process_code_streaming, processing_key
+from core.metrics import stage_timer
+from core.status import merge_streams
+
+# --- 配置区 ---
+NOTEBOOK_MAX_WORKERS = int(os.getenv('NOTEBOOK_MAX_WORKERS', '4'))
+# 安装了 ijson 时，超过该大小的笔记本逐个单元格流式解析，不把整个文档（含输出）载入内存
+NOTEBOOK_STREAM_MIN_BYTES = int(os.getenv('NOTEBOOK_STREAM_MIN_BYTES', str(2 * 1024 * 1024)))
+
+# 出现这些调用的代码单元格才会被处理
+PLOT_CALLS = {
+    'figure', 'subplots', 'subplot', 'subplot_mosaic', 'show', 'savefig',
+    'plot', 'scatter', 'bar', 'barh', 'hist', 'hist2d', 'boxplot', 'violinplot', 'errorbar', 'pie',
+    'imshow', 'pcolormesh', 'contour', 'contourf', 'fill_between', 'stackplot', 'step', 'stem',
+    'title', 'xlabel', 'ylabel', 'suptitle', 'legend', 'set_title', 'set_xlabel', 'set_ylabel',
+    'heatmap', 'lineplot', 'scatterplot', 'histplot', 'barplot', 'kdeplot',
+}
+
+# 行魔法命令（%matplotlib inline）和 shell 命令（!pip install ...）不是合法的 Python
+_MAGIC_LINE_RE = re.compile(r'^([ \t]*)([%!].*)$')
+_MAGIC_PLACEHOLDER_RE = re.compile(r'^([ \t]*)__APLOT_MAGIC_(\d+)__[ \t]*$', re.MULTILINE)
+_PYPLOT_IMPORT_RE = re.compile(r'^\s*import\s+matplotlib\.pyplot\s+as\s+plt', re.MULTILINE)
+FONT_MARKER = "plt.rcParams['font.sans-serif']"
+# 单元格统一以该文件名处理，结果缓存的键只取决于单元格内容和选项，与笔记本名和单元格位置无关；
+# 输出中由它生成的矢量图文件名（notebook_cell_figure.pdf 等）在取得结果后替换为各单元格自己的文件名
+CELL_FILENAME = 'notebook_cell.py'
+
+
+class NotebookError(Exception):
+    """上传的文件不是可处理的 Jupyter 笔记本（nbformat 4）。"""
+
+
+def strip_outputs(cell: Dict[str, Any]) -> None:
+    """清除代码单元格的输出和执行计数。"""
+    if cell.get('cell_type') == 'code':
+        cell['outputs'] = []
+        cell['execution_count'] = None
+
+
+def cell_source(cell: Dict[str, Any]) -> str:
+    source = cell.get('source', '')
+    return ''.join(source) if isinstance(source, list) else source
+
+
+def set_cell_source(cell: Dict[str, Any], code: str) -> None:
+    # nbformat 把多行源码存为逐行（保留换行符）的列表
+    cell['source'] = code.splitlines(keepends=True)
+
+
+def _read_streaming(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """用 ijson 逐个单元格解析，每个单元格读完即清除输出，内存中只保留一个单元格的原始内容。"""
+    header: Dict[str, Any] = {}
+    cells: List[Dict[str, Any]] = []
+    key = None
+    builder = None
+    try:
+        with open(path, 'rb') as f:
+            for prefix, event, value in ijson.parse(f, use_float=True):
+                if prefix == '':
+                    if event == 'map_key':
+                        key = value
+                        builder = None if key == 'cells' else ijson.ObjectBuilder()
+                    continue
+                if key == 'cells':
+                    if prefix == 'cells':
+                        continue
+                    if builder is None:
+                        builder = ijson.ObjectBuilder()
+                    builder.event(event, value)
+                    if prefix == 'cells.item' and event == 'end_map':
+                        strip_outputs(builder.value)
+                        cells.append(builder.value)
+                        builder = None
+                else:
+                    builder.event(event, value)
+                    header[key] = builder.value
+    except ijson.JSONError as e:
+        raise NotebookError(f"笔记本不是有效的 JSON: {e}")
+    if key is None:
+        raise NotebookError("笔记本不是 JSON 对象")
+    return header, cells
+
+
+def read_notebook(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    读取笔记本，返回 (除 cells 外的顶层字段, 已清除输出的单元格列表)。
+    大型笔记本在安装了 ijson 时流式解析。
+    """
+    if ijson is not None and os.path.getsize(path) >= NOTEBOOK_STREAM_MIN_BYTES:
+        header, cells = _read_streaming(path)
+    else:
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+        except ValueError as e:
+            raise NotebookError(f"笔记本不是有效的 JSON: {e}")
+        if not isinstance(header, dict):
+            raise NotebookError("笔记本不是 JSON 对象")
+        cells = header.pop('cells', None)
+        if isinstance(cells, list):
+            for cell in cells:
+                if isinstance(cell, dict):
+                    strip_outputs(cell)
+
+    if header.get('nbformat') != 4:
+        raise NotebookError(f"只支持 nbformat 4 格式的笔记本（当前为 {header.get('nbformat')}）")
+    if not isinstance(cells, list) or not all(isinstance(cell, dict) for cell in cells):
+        raise NotebookError("笔记本缺少有效的 cells 列表")
+    return header, cells
+
+
+def write_notebook(path: str, header: Dict[str, Any], cells: List[Dict[str, Any]]) -> None:
+    """逐个单元格写出笔记本（与 nbformat 相同的 indent=1、键排序格式），不拼接整个文档。"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n "cells": [')
+        for i, cell in enumerate(cells):
+            # JSON 文本中的换行只出现在结构之间（字符串内的换行已转义），可以直接整体缩进
+            f.write((',\n  ' if i else '\n  ') +
+                    json.dumps(cell, ensure_ascii=False, indent=1, sort_keys=True).replace('\n', '\n  '))
+        f.write('\n ]' if cells else ']')
+        for key in sorted(header):
+            value = json.dumps(header[key], ensure_ascii=False, indent=1, sort_keys=True).replace('\n', '\n ')
+            f.write(f',\n {json.dumps(key)}: {value}')
+        f.write('\n}\n')
+
+
+def mask_magics(code: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    把行魔法命令和 shell 命令替换为同样缩进的占位标识符，使单元格可以按 Python 解析。
+    单元格魔法（%%time、%%bash 等）整个单元格都不是 Python，返回 None。
+    """
+    if code.lstrip().startswith('%%'):
+        return None
+    magics: List[str] = []
+    lines = code.split('\n')
+    for i, line in enumerate(lines):
+        match = _MAGIC_LINE_RE.match(line)
+        if match:
+            lines[i] = f"{match.group(1)}__APLOT_MAGIC_{len(magics)}__"
+            magics.append(match.group(2))
+    return '\n'.join(lines), magics
+
+
+def unmask_magics(code: str, magics: List[str]) -> Optional[str]:
+    """还原魔法命令；有占位符丢失时返回 None，表示结果不可信。"""
+    restored = set()
+
+    def replace(match: re.Match) -> str:
+        index = int(match.group(2))
+        if index >= len(magics):
+            return match.group(0)
+        restored.add(index)
+        return match.group(1) + magics[index]
+
+    code = _MAGIC_PLACEHOLDER_RE.sub(replace, code)
+    return code if len(restored) == len(magics) else None
+
+
+def is_plotting_cell(tree: ast.AST) -> bool:
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            func = node.func
+            name = func.attr if isinstance(func, ast.Attribute) else getattr(func, 'id', None)
+            if name in PLOT_CALLS:
+                return True
+    return False
+
+
+def notebook_to_script(path: str) -> str:
+    """把笔记本的代码单元格拼接为一个脚本（用于渲染预览），魔法命令改为注释。"""
+    _, cells = read_notebook(path)
+    parts = []
+    for cell in cells:
+        if cell.get('cell_type') != 'code':
+            continue
+        code = cell_source(cell)
+        cell_magic = code.lstrip().startswith('%%')
+        lines = code.split('\n')
+        for i, line in enumerate(lines):
+            if cell_magic:
+                lines[i] = f"# {line}"
+            else:
+                match = _MAGIC_LINE_RE.match(line)
+                if match:
+                    # 用 pass 占位，魔法命令位于缩进块中时脚本仍然可以解析
+                    lines[i] = f"{match.group(1)}pass  # {match.group(2)}"
+        parts.append('\n'.join(lines))
+    return '\n\n'.join(parts) + '\n'
+
+
+def _cell_stream(index: int, code: str, cell_filename: str, beautify: bool,
+                 academic_options: Dict[str, Any]) -> Generator[str, None, Optional[str]]:
+    """处理单个单元格，状态加上单元格编号；模型的增量代码不转发。"""
+    prefix = f"[单元格 {index + 1}] "
+    stream = process_code_streaming(code, cell_filename, beautify, dict(academic_options))
+    while True:
+        try:
+            status = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        if not status.startswith(PARTIAL_PREFIX):
+            yield prefix + status
+
+
+def _with_cell_filename(output: str, cell_filename: str) -> str:
+    """把处理结果中以 CELL_FILENAME 命名的输出文件改为该单元格的文件名。"""
+    placeholder = os.path.splitext(CELL_FILENAME)[0] + '_figure'
+    return output.replace(placeholder, os.path.splitext(cell_filename)[0] + '_figure')
+
+
+def process_notebook_streaming(filepath: str, output_folder: str, beautify: bool = False,
+                               academic_options: Optional[Dict[str, Any]] = None):
+    """
+    处理 Jupyter 笔记本：只处理包含绘图调用的代码单元格，各单元格并发执行翻译与风格化，
+    结果按单元格内容缓存；写回的笔记本清除了所有输出。状态协议与 process_python_file_streaming 相同。
+    """
+    if academic_options is None:
+        academic_options = {'enabled': False}
+    yield "开始处理笔记本..."
+
+    try:
+        with stage_timer('read'):
+            header, cells = read_notebook(filepath)
+    except (OSError, UnicodeDecodeError, NotebookError) as e:
+        yield f"读取笔记本失败: {e}"
+        return
+    yield f"笔记本读取成功，共 {len(cells)} 个单元格"
+
+    base, ext = os.path.splitext(os.path.basename(filepath))
+    targets = []
+    for index, cell in enumerate(cells):
+        if cell.get('cell_type') != 'code':
+            continue
+        masked = mask_magics(cell_source(cell))
+        if masked is None:
+            continue
+        code, magics = masked
+        try:
+            tree = ast.parse(code)
+        except SyntaxError:
+            continue
+        if is_plotting_cell(tree):
+            targets.append((index, code, magics))
+
+    if not targets:
+        yield "笔记本中没有包含绘图调用的代码单元格，只清除了输出。"
+    else:
+        yield f"{len(targets)} 个代码单元格包含绘图调用，正在并发处理..."
+        # 单元格的处理结果（包括只翻译时的译文）以 (单元格代码, 选项) 为键存入结果缓存，
+        # 只修改、插入或移动了一个单元格时只重新处理该单元格
+        result_cache = get_result_cache()
+        results: Dict[int, Optional[str]] = {}
+        pending = []
+        for index, code, _ in targets:
+            cached = result_cache.get(processing_key(code, CELL_FILENAME, beautify, academic_options)) \
+                if result_cache else None
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, _cell_stream(index, code, CELL_FILENAME, beautify, academic_options)))
+        if results:
+            yield f"{len(results)} 个单元格命中结果缓存，{len(pending)} 个单元格需要处理"
+
+        outputs = yield from merge_streams([stream for _, stream in pending], NOTEBOOK_MAX_WORKERS)
+        results.update((index, output) for (index, _), output in zip(pending, outputs))
+
+        for index, _, magics in targets:
+            output = results.get(index)
+            if output is not None:
+                # 每个单元格使用不同的文件名，使各自保存的矢量图不会互相覆盖
+                output = _with_cell_filename(output, f"{base}_cell{index + 1}.py")
+            restored = unmask_magics(output, magics) if output is not None else None
+            if restored is None:
+                yield f"单元格 {index + 1} 处理失败，保留原代码"
+                continue
+            set_cell_source(cells[index], restored)
+
+    # 导入 pyplot 的单元格通常不含绘图调用、不会经过流水线，中文字体设置在这里补上
+    code_cells = [cell for cell in cells if cell.get('cell_type') == 'code']
+    if targets and not any(FONT_MARKER in cell_source(cell) for cell in code_cells):
+        for cell in code_cells:
+            code = cell_source(cell)
+            if _PYPLOT_IMPORT_RE.search(code):
+                set_cell_source(cell, '\n'.join(inject_chinese_font_support(code.split('\n'))))
+                yield "已注入中文字体支持"
+                break
+
+    new_filename = f"{base}_zh_revision{ext}"
+    new_filepath = os.path.join(output_folder, new_filename)
+    try:
+        with stage_timer('write'):
+            write_notebook(new_filepath, header, cells)
+        yield f"处理完成！修改后的笔记本已保存至: {new_filepath}"
+        yield f"SUCCESS:{new_filename}"
+    except OSError as e:
+        yield f"保存文件失败: {e}"
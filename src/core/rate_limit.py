@@ -0,0 +1,204 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from core.metrics import DEEPSEEK_QUEUE_WAIT, DEEPSEEK_QUEUE_WAITING
+from core.status import report_status
+
+# --- 配置区 ---（0 表示不限制）
+DEEPSEEK_REQUESTS_PER_MINUTE = int(os.getenv('DEEPSEEK_REQUESTS_PER_MINUTE', '120'))
+DEEPSEEK_TOKENS_PER_MINUTE = int(os.getenv('DEEPSEEK_TOKENS_PER_MINUTE', '0'))
+DEEPSEEK_MAX_IN_FLIGHT = int(os.getenv('DEEPSEEK_MAX_IN_FLIGHT', os.getenv('DEEPSEEK_POOL_SIZE', '10')))
+# 排队时向用户报告等待状态的间隔（秒）
+RATE_LIMIT_REPORT_INTERVAL = float(os.getenv('RATE_LIMIT_REPORT_INTERVAL', '5'))
+
+
+class Permit:
+    """一次已放行的调用；调用结束后必须 release()，并可用实际 token 用量修正预估值。"""
+
+    def __init__(self, governor: 'RateGovernor', estimated_tokens: int, waited: float):
+        self.governor = governor
+        self.estimated_tokens = estimated_tokens
+        self.waited = waited
+        self._released = False
+
+    def release(self, actual_tokens: Optional[int] = None) -> None:
+        if self._released:
+            return
+        self._released = True
+        self.governor._release(self, actual_tokens)
+
+
+class RateGovernor:
+    """
+    进程内共享的 DeepSeek 出站限流器：每分钟请求数、每分钟 token 数两个令牌桶，加上最大并发数。
+    等待者严格按到达顺序（FIFO）放行，避免大请求被持续插队的小请求饿死。
+    收到 429 / Retry-After 时 pause() 会让所有调用方一起暂停。
+    排队期间通过 report_status() 告诉用户正在等待什么。
+    """
+
+    def __init__(self, requests_per_minute: int = DEEPSEEK_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: int = DEEPSEEK_TOKENS_PER_MINUTE,
+                 max_in_flight: int = DEEPSEEK_MAX_IN_FLIGHT,
+                 report_interval: float = RATE_LIMIT_REPORT_INTERVAL):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_in_flight = max_in_flight
+        self.report_interval = report_interval
+
+        self._cond = threading.Condition()
+        self._waiters: deque = deque()
+        self._in_flight = 0
+        self._request_budget = float(requests_per_minute)
+        self._token_budget = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+
+        self.acquired = 0
+        self.throttled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    # --- 令牌桶 ---
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.requests_per_minute:
+            self._request_budget = min(float(self.requests_per_minute),
+                                       self._request_budget + elapsed * self.requests_per_minute / 60)
+        if self.tokens_per_minute:
+            self._token_budget = min(float(self.tokens_per_minute),
+                                     self._token_budget + elapsed * self.tokens_per_minute / 60)
+
+    def _blocked(self, tokens: int, now: float):
+        """返回 (需要等待的秒数, 原因)；可以立即放行时返回 (0, None)。"""
+        if now < self._paused_until:
+            return self._paused_until - now, "服务端要求暂停请求（Retry-After）"
+        if self.max_in_flight and self._in_flight >= self.max_in_flight:
+            # 并发名额只能等别的调用结束，release() 会唤醒等待者
+            return 1.0, f"并发调用已达上限 {self.max_in_flight}"
+        if self.requests_per_minute and self._request_budget < 1:
+            return (1 - self._request_budget) * 60 / self.requests_per_minute, \
+                f"已达每分钟 {self.requests_per_minute} 次请求的上限"
+        if self.tokens_per_minute:
+            # 超过整桶容量的请求只需等到桶满即可放行，差额记为欠额
+            needed = min(tokens, self.tokens_per_minute)
+            if self._token_budget < needed:
+                return (needed - self._token_budget) * 60 / self.tokens_per_minute, \
+                    f"已达每分钟 {self.tokens_per_minute} tokens 的上限"
+        return 0.0, None
+
+    # --- 放行与归还 ---
+
+    def acquire(self, estimated_tokens: int = 0) -> Permit:
+        """按到达顺序等待配额，返回 Permit。"""
+        ticket = object()
+        started = time.monotonic()
+        last_report = None
+        with self._cond:
+            self._waiters.append(ticket)
+        DEEPSEEK_QUEUE_WAITING.inc()
+        try:
+            while True:
+                message = None
+                with self._cond:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._waiters[0] is ticket:
+                        delay, reason = self._blocked(estimated_tokens, now)
+                        if delay <= 0:
+                            self._waiters.popleft()
+                            self._in_flight += 1
+                            if self.requests_per_minute:
+                                self._request_budget -= 1
+                            if self.tokens_per_minute:
+                                self._token_budget -= estimated_tokens
+                            waited = time.monotonic() - started
+                            self.acquired += 1
+                            self.total_wait += waited
+                            self.max_wait = max(self.max_wait, waited)
+                            if last_report is not None:
+                                self.throttled += 1
+                            # 队首已离开，下一个等待者可以开始检查配额
+                            self._cond.notify_all()
+                            break
+                    else:
+                        delay, reason = 1.0, "前方还有等待中的请求"
+                    if last_report is None or now - last_report >= self.report_interval:
+                        position = self._waiters.index(ticket)
+                        message = (f"DeepSeek 调用排队中：{reason}（前方 {position} 个请求，"
+                                   f"已等待 {now - started:.0f} 秒）")
+                        last_report = now
+                    else:
+                        self._cond.wait(min(max(delay, 0.01), 1.0))
+                # 状态回调会写任务数据库并推送事件，在锁外调用，避免阻塞其它调用方的放行与归还
+                if message:
+                    report_status(message)
+        except BaseException:
+            with self._cond:
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                self._cond.notify_all()
+            raise
+        finally:
+            DEEPSEEK_QUEUE_WAITING.dec()
+
+        DEEPSEEK_QUEUE_WAIT.observe(waited)
+        if last_report is not None:
+            report_status(f"已获得 DeepSeek 调用配额（排队 {waited:.1f} 秒）")
+        return Permit(self, estimated_tokens, waited)
+
+    def _release(self, permit: Permit, actual_tokens: Optional[int]) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if self.tokens_per_minute and actual_tokens is not None:
+                self._token_budget -= actual_tokens - permit.estimated_tokens
+            self._cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        """服务端返回 429 / Retry-After 时暂停所有新调用 seconds 秒。"""
+        if seconds <= 0:
+            return
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                'requests_per_minute': self.requests_per_minute,
+                'tokens_per_minute': self.tokens_per_minute,
+                'max_in_flight': self.max_in_flight,
+                'in_flight': self._in_flight,
+                'waiting': len(self._waiters),
+                'request_budget': self._request_budget,
+                'token_budget': self._token_budget,
+                'paused_seconds': max(0.0, self._paused_until - time.monotonic()),
+                'acquired': self.acquired,
+                'throttled': self.throttled,
+                'avg_wait_seconds': self.total_wait / self.acquired if self.acquired else 0.0,
+                'max_wait_seconds': self.max_wait,
+            }
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """粗略估算一次调用的 token 数：提示词按约 3 个字符一个 token，回复按与提示词等长估计。"""
+    prompt_chars = sum(len(str(message.get('content', ''))) for message in payload.get('messages') or [])
+    return 2 * (prompt_chars // 3 + 8)
+
+
+_governor: Optional[RateGovernor] = None
+_governor_lock = threading.Lock()
+
+
+def get_rate_governor() -> RateGovernor:
+    """返回进程内共享的 RateGovernor。"""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = RateGovernor()
+        return _governor
@@ -0,0 +1,433 @@
+"""
+渲染工作进程池：在独立的 Python 进程中执行绘图脚本，生成 PNG 预览和矢量图产物。
+
+每个工作进程启动时先导入 matplotlib（Agg 后端）、加载字体缓存并完整绘制一次，然后等待 JSON 任务，
+避免渲染时付出冷启动的数秒开销。每个进程只执行一个脚本，用完即销毁并在后台补充新的预热进程，
+不同上传的脚本不会共用进程状态。工作进程只继承白名单中的环境变量（不含 API 密钥等配置），
+HOME 指向该进程独有的临时目录，matplotlib 配置目录（字体缓存）则由所有工作进程共用并长期保留；另受 CPU 时间、内存和输出文件大小限制（依赖 resource 模块，
+Windows 上不可用），父进程另有墙钟超时。
+注意：这仍然不是安全沙箱，脚本以服务进程的用户身份运行，可以读取该用户能访问的文件。
+因此预览默认关闭（RENDER_PREVIEW_ENABLED），只应在容器等隔离环境中开启。
+
+本模块只依赖标准库，作为工作进程以 `python render.py --worker <limits>` 方式启动；
+matplotlib 只需在服务器上安装，未安装时 RenderPool.available() 返回 False。
+"""
+
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# --- 配置区 ---
+# 渲染会执行用户上传的代码，默认关闭
+RENDER_PREVIEW_ENABLED = os.getenv('RENDER_PREVIEW_ENABLED', '0') == '1'
+RENDER_WORKERS = int(os.getenv('RENDER_WORKERS', '2'))
+RENDER_TIMEOUT_SECONDS = float(os.getenv('RENDER_TIMEOUT_SECONDS', '30'))
+# 等待空闲工作进程（包括首次预热）的最长时间
+RENDER_QUEUE_TIMEOUT_SECONDS = float(os.getenv('RENDER_QUEUE_TIMEOUT_SECONDS', '90'))
+RENDER_CPU_SECONDS = int(os.getenv('RENDER_CPU_SECONDS', '30'))
+RENDER_MEMORY_MB = int(os.getenv('RENDER_MEMORY_MB', '2048'))
+RENDER_MAX_FILE_MB = int(os.getenv('RENDER_MAX_FILE_MB', '100'))
+RENDER_PREVIEW_DPI = int(os.getenv('RENDER_PREVIEW_DPI', '100'))
+RENDER_MAX_PREVIEWS = int(os.getenv('RENDER_MAX_PREVIEWS', '8'))
+# 所有工作进程共用的 matplotlib 配置目录：字体缓存只在首次启动时生成，默认放在缓存目录（ACADEMICPLOT_CACHE_DIR）下
+RENDER_MPLCONFIGDIR = os.getenv('RENDER_MPLCONFIGDIR', os.path.join(
+    os.getenv('ACADEMICPLOT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'uploads', 'cache')),
+    'matplotlib'))
+
+# 工作进程从服务进程继承的环境变量；其余变量（API 密钥、Flask 密钥等）不传给脚本
+RENDER_ENV_ALLOWLIST = ('PATH', 'SYSTEMROOT', 'LANG', 'LC_ALL', 'TZ')
+
+# 脚本自己保存的这些类型的文件作为产物返回
+ARTIFACT_EXTENSIONS = ('.pdf', '.svg', '.eps', '.png', '.jpg', '.jpeg', '.tif', '.tiff')
+LOG_TAIL_CHARS = 4000
+
+
+class RenderError(Exception):
+    """渲染没有得到结果：工作进程超时、崩溃或不可用（脚本自身的异常不算，见结果中的 error）。"""
+
+
+def render_cache_key(code: str, export_formats: List[str]) -> str:
+    """渲染结果只由脚本内容和渲染设置决定，用作预览缓存的键。"""
+    payload = {
+        'code': hashlib.sha256(code.encode('utf-8')).hexdigest(),
+        'formats': sorted(export_formats),
+        'dpi': RENDER_PREVIEW_DPI,
+        'max_previews': RENDER_MAX_PREVIEWS,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# --- 工作进程 ---
+
+def _warm_up() -> Dict[str, Any]:
+    """导入 matplotlib 并绘制一次，使字体缓存、后端和文本渲染都处于就绪状态。"""
+    started = time.monotonic()
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from matplotlib import font_manager
+        font_manager.fontManager.get_font_names()
+        fig, ax = plt.subplots()
+        ax.plot([0, 1], [0, 1], label='warm-up')
+        ax.set_title('warm-up')
+        ax.legend()
+        fig.savefig(io.BytesIO(), format='png')
+        plt.close(fig)
+    except Exception as e:
+        return {'ready': False, 'error': f"{type(e).__name__}: {e}"}
+    return {'ready': True, 'matplotlib': matplotlib.__version__, 'warm_seconds': time.monotonic() - started}
+
+
+def _apply_limits(limits: Dict[str, Any]) -> None:
+    try:
+        import resource
+    except ImportError:
+        return
+    for name, value in (('RLIMIT_AS', limits.get('memory_mb')), ('RLIMIT_FSIZE', limits.get('max_file_mb'))):
+        if value and hasattr(resource, name):
+            resource.setrlimit(getattr(resource, name), (value * 1024 * 1024, value * 1024 * 1024))
+
+
+def _set_cpu_budget(seconds: int) -> None:
+    """RLIMIT_CPU 按进程累计计算，每个任务开始前把软限制设为"已用时间 + seconds"。"""
+    try:
+        import resource
+    except ImportError:
+        return
+    if not seconds:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    soft = int(usage.ru_utime + usage.ru_stime) + seconds
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _run_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """在当前进程中执行一个脚本，收集其打开的图形作为预览，并列出脚本保存的产物。"""
+    import runpy
+    import traceback
+    import warnings
+
+    import matplotlib
+    import matplotlib.pyplot as plt
+    from matplotlib._pylab_helpers import Gcf
+
+    started = time.monotonic()
+    script_path = task['script']
+    workdir = os.path.dirname(script_path)
+    preview_dir = task['preview_dir']
+    export_formats = task.get('export_formats') or []
+    figures: List[Any] = []
+    previews: List[str] = []
+    exported: List[str] = []
+
+    def save_figure(figure, number):
+        name = f"preview_{number}.png"
+        figure.savefig(os.path.join(preview_dir, name), dpi=RENDER_PREVIEW_DPI)
+        previews.append(name)
+        for fmt in export_formats:
+            name = f"figure_{number}.{fmt}"
+            figure.savefig(os.path.join(preview_dir, name), bbox_inches='tight')
+            exported.append(name)
+
+    def snapshot(*args, **kwargs):
+        # plt.show() 时记录当前打开的图形；脚本随后关闭图形也不影响预览
+        for manager in Gcf.get_all_fig_managers():
+            figure = manager.canvas.figure
+            if figure not in figures and len(figures) < RENDER_MAX_PREVIEWS:
+                figures.append(figure)
+                save_figure(figure, len(figures))
+
+    log = io.StringIO()
+    saved = (os.getcwd(), sys.argv, sys.stdout, sys.stderr, plt.show)
+    error = None
+    _set_cpu_budget(task.get('cpu_seconds', 0))
+    try:
+        os.chdir(workdir)
+        sys.argv = [script_path]
+        sys.stdout = sys.stderr = log
+        plt.show = snapshot
+        with matplotlib.rc_context(), warnings.catch_warnings():
+            warnings.simplefilter('always')
+            try:
+                runpy.run_path(script_path, run_name='__main__')
+            except SystemExit as e:
+                if e.code not in (None, 0):
+                    error = f"脚本以状态码 {e.code} 退出"
+            except BaseException:
+                error = traceback.format_exc(limit=-3)
+            # 没有调用 show() 的图形在脚本结束后统一保存；出错时也保留已经画出的部分
+            try:
+                snapshot()
+            except Exception as e:
+                error = error or f"保存预览失败: {type(e).__name__}: {e}"
+    finally:
+        cwd, sys.argv, sys.stdout, sys.stderr, plt.show = saved
+        os.chdir(cwd)
+        plt.close('all')
+
+    artifacts = sorted(
+        name for name in os.listdir(workdir)
+        if name.lower().endswith(ARTIFACT_EXTENSIONS) and os.path.isfile(os.path.join(workdir, name))
+    )
+    # 脚本已经自行保存了某种格式时，不再额外导出同一格式
+    produced = {os.path.splitext(name)[1].lower().lstrip('.') for name in artifacts}
+    for name in exported:
+        if os.path.splitext(name)[1].lstrip('.') in produced:
+            os.remove(os.path.join(preview_dir, name))
+        else:
+            artifacts.append(name)
+    return {
+        'ok': error is None,
+        'error': error,
+        'previews': previews,
+        'artifacts': artifacts,
+        'log': log.getvalue()[-LOG_TAIL_CHARS:],
+        'seconds': time.monotonic() - started,
+    }
+
+
+def _worker_main(limits: Dict[str, Any]) -> None:
+    # 协议使用原始的 stdin/stdout；脚本看到的标准输入输出指向 /dev/null，不会破坏协议
+    protocol_in = os.fdopen(os.dup(0), 'r', encoding='utf-8')
+    protocol_out = os.fdopen(os.dup(1), 'w', encoding='utf-8')
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1):
+        os.dup2(devnull, fd)
+
+    def send(message):
+        protocol_out.write(json.dumps(message, ensure_ascii=False) + '\n')
+        protocol_out.flush()
+
+    ready = _warm_up()
+    send(ready)
+    if not ready['ready']:
+        return
+    _apply_limits(limits)
+    for line in protocol_in:
+        task = json.loads(line)
+        task['cpu_seconds'] = limits.get('cpu_seconds', 0)
+        try:
+            result = _run_task(task)
+        except BaseException as e:
+            result = {'ok': False, 'error': f"{type(e).__name__}: {e}", 'previews': [], 'artifacts': [],
+                      'log': '', 'seconds': 0.0}
+        send(result)
+
+
+# --- 父进程 ---
+
+def worker_env(home: str, config_dir: str = RENDER_MPLCONFIGDIR) -> Dict[str, str]:
+    """
+    工作进程的环境变量：白名单中的变量，加上 Agg 后端、独立的 HOME 和共用的 matplotlib 配置目录。
+    配置目录若也放在每个进程的临时 HOME 中，每次启动都要重新扫描系统字体、生成字体缓存。
+    """
+    env = {name: os.environ[name] for name in RENDER_ENV_ALLOWLIST if name in os.environ}
+    env.update(HOME=home, MPLCONFIGDIR=os.path.abspath(config_dir), MPLBACKEND='Agg',
+               PYTHONIOENCODING='utf-8', OPENBLAS_NUM_THREADS='1', OMP_NUM_THREADS='1', MKL_NUM_THREADS='1')
+    return env
+
+
+class _RenderWorker:
+    """一个预热的渲染子进程，只执行一个脚本；读线程把子进程输出的每一行放入队列，便于带超时地等待结果。"""
+
+    def __init__(self, limits: Dict[str, Any]):
+        self.limits = limits
+        self.home = tempfile.mkdtemp(prefix='render_home_')
+        os.makedirs(RENDER_MPLCONFIGDIR, exist_ok=True)
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(limits)],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            env=worker_env(self.home), cwd=self.home, text=True, encoding='utf-8',
+        )
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        threading.Thread(target=self._read, name='render-reader', daemon=True).start()
+
+    def _read(self) -> None:
+        for line in self.process.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def receive(self, timeout: float) -> Dict[str, Any]:
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            raise RenderError(f"渲染超时（超过 {timeout:.0f} 秒）")
+        if line is None:
+            self.process.wait()
+            raise RenderError(_describe_exit(self.process.returncode, self.limits))
+        return json.loads(line)
+
+    def send(self, task: Dict[str, Any]) -> None:
+        try:
+            self.process.stdin.write(json.dumps(task, ensure_ascii=False) + '\n')
+            self.process.stdin.flush()
+        except OSError:
+            raise RenderError("渲染进程已退出")
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+        shutil.rmtree(self.home, ignore_errors=True)
+
+
+def _describe_exit(returncode: int, limits: Dict[str, Any]) -> str:
+    if returncode == -getattr(signal, 'SIGXCPU', -1):
+        return f"脚本超出 CPU 时间限制（{limits.get('cpu_seconds')} 秒）"
+    if returncode == -getattr(signal, 'SIGXFSZ', -1):
+        return f"脚本写出的文件超过大小限制（{limits.get('max_file_mb')} MB）"
+    if returncode in (-getattr(signal, 'SIGKILL', -1), -getattr(signal, 'SIGSEGV', -1)):
+        return f"渲染进程被终止（可能超出内存限制 {limits.get('memory_mb')} MB）"
+    return f"渲染进程意外退出（退出码 {returncode}）"
+
+
+class RenderPool:
+    """
+    预热的渲染进程池。start() 在后台启动 size 个工作进程；render() 取一个空闲进程执行脚本，
+    执行后（无论成功、超时还是崩溃）该进程都被销毁，并替换为新的预热进程。
+    """
+
+    def __init__(self, size: int = RENDER_WORKERS, timeout: float = RENDER_TIMEOUT_SECONDS,
+                 limits: Optional[Dict[str, Any]] = None):
+        self.size = size
+        self.timeout = timeout
+        self.limits = limits or {
+            'cpu_seconds': RENDER_CPU_SECONDS,
+            'memory_mb': RENDER_MEMORY_MB,
+            'max_file_mb': RENDER_MAX_FILE_MB,
+        }
+        self._idle: "queue.Queue[_RenderWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers: List[_RenderWorker] = []
+        self._started = False
+        self.broken: Optional[str] = None
+        self.matplotlib_version: Optional[str] = None
+        self.renders = 0
+        self.failures = 0
+        self.restarts = 0
+        self.warm_seconds: List[float] = []
+
+    def available(self) -> bool:
+        """服务器上安装了 matplotlib 且工作进程能够正常预热。"""
+        return self.broken is None and importlib.util.find_spec('matplotlib') is not None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started or not self.available():
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._spawn_async()
+
+    def _spawn_async(self) -> None:
+        threading.Thread(target=self._spawn, name='render-spawn', daemon=True).start()
+
+    def _spawn(self) -> None:
+        worker = _RenderWorker(self.limits)
+        with self._lock:
+            self._workers.append(worker)
+        try:
+            ready = worker.receive(timeout=RENDER_QUEUE_TIMEOUT_SECONDS)
+        except RenderError as e:
+            ready = {'ready': False, 'error': str(e)}
+        if not ready.get('ready'):
+            # 预热失败通常是环境问题（例如 matplotlib 损坏），不再反复重试
+            self.broken = f"渲染进程预热失败: {ready.get('error')}"
+            print(self.broken)
+            self._discard(worker)
+            return
+        with self._lock:
+            self.matplotlib_version = ready.get('matplotlib')
+            self.warm_seconds = (self.warm_seconds + [ready.get('warm_seconds', 0.0)])[-20:]
+        self._idle.put(worker)
+
+    def _discard(self, worker: _RenderWorker) -> None:
+        worker.kill()
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    def _replace(self, worker: _RenderWorker) -> None:
+        self._discard(worker)
+        with self._lock:
+            self.restarts += 1
+        self._spawn_async()
+
+    def render(self, script_path: str, preview_dir: str, export_formats: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        在工作进程中执行 script_path（工作目录为脚本所在目录），预览图写入 preview_dir。
+        返回 {'ok', 'error', 'previews', 'artifacts', 'log', 'seconds'}；
+        artifacts 中以 figure_ 开头的文件位于 preview_dir，其余位于脚本目录。
+        """
+        self.start()
+        if self.broken:
+            raise RenderError(self.broken)
+        if not self._started:
+            raise RenderError("服务器未安装 matplotlib，无法渲染预览")
+        while True:
+            try:
+                worker = self._idle.get(timeout=RENDER_QUEUE_TIMEOUT_SECONDS)
+            except queue.Empty:
+                raise RenderError(self.broken or "暂无空闲的渲染进程，请稍后重试")
+            if worker.alive():
+                break
+            self._replace(worker)
+
+        task = {'script': os.path.abspath(script_path), 'preview_dir': os.path.abspath(preview_dir),
+                'export_formats': export_formats or []}
+        try:
+            worker.send(task)
+            result = worker.receive(timeout=self.timeout)
+        except RenderError:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            # 脚本可能改动了进程内的全局状态或 HOME 目录，不再用于其它脚本
+            with self._lock:
+                self.renders += 1
+            self._replace(worker)
+        return result
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.kill()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'available': self.available(),
+                'error': self.broken,
+                'matplotlib': self.matplotlib_version,
+                'workers': len(self._workers),
+                'idle': self._idle.qsize(),
+                'renders': self.renders,
+                'failures': self.failures,
+                'restarts': self.restarts,
+                'avg_warm_seconds': sum(self.warm_seconds) / len(self.warm_seconds) if self.warm_seconds else 0.0,
+            }
+
+
+if __name__ == '__main__' and sys.argv[1:2] == ['--worker']:
+    _worker_main(json.loads(sys.argv[2]) if len(sys.argv) > 2 else {})
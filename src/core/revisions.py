@@ -0,0 +1,186 @@
+import ast
+import contextvars
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.elision import PLACEHOLDER_RE
+from core.rewrite import apply_translations, extract_translatable_spans
+
+# --- 配置区 ---
+REVISIONS_ENABLED = os.getenv('REVISIONS_ENABLED', '1') != '0'
+
+# 记录在任务清单 meta 中的键
+REVISION_META_KEY = 'revision'
+
+# 当前任务的版本会话；翻译与重构在其中查找上一版本可沿用的结果，并登记本版本的结果
+_revision: contextvars.ContextVar[Optional['Revision']] = contextvars.ContextVar('revision', default=None)
+
+
+def block_key(code: str, options_key: str) -> str:
+    """
+    代码块重构结果的键。options_key 为该块规范化重构选项（含输出文件名）的哈希，
+    同一段代码在不同选项下或以不同文件名保存时重构结果不同，不能沿用。
+    """
+    return hashlib.sha256(f"{options_key}\0{code}".encode('utf-8')).hexdigest()
+
+
+def text_skeleton(code: str) -> Optional[Tuple[str, List[str], List[str]]]:
+    """
+    把代码中的可翻译文本（标签、标题、注释等）和大型数据占位符替换为统一的标记，
+    返回 (骨架, 按出现顺序的文本, 按出现顺序的占位符)。骨架相同的两段代码只在文本或数据上有差别。
+    代码无法解析时返回 None。
+    """
+    try:
+        spans = extract_translatable_spans(code, ast.parse(code))
+    except SyntaxError:
+        return None
+    pieces = []
+    position = 0
+    for span in spans:
+        pieces.append(code[position:span.start])
+        pieces.append('\0text\0')
+        position = span.end
+    pieces.append(code[position:])
+    skeleton = ''.join(pieces)
+    placeholders = PLACEHOLDER_RE.findall(skeleton)
+    return PLACEHOLDER_RE.sub('\0data\0', skeleton), [span.text for span in spans], placeholders
+
+
+def _retext(refactored: str, old_texts: List[str], new_texts: List[str],
+            old_placeholders: List[str], new_placeholders: List[str]) -> Optional[str]:
+    """
+    把上一版本的重构结果中的旧文本和旧占位符换成新的；
+    某处改动无法对应（同一旧文本改成了不同的新文本、在重构结果中找不到或新文本为空）时返回 None。
+    """
+    text_map: Dict[str, str] = {}
+    for old, new in zip(old_texts, new_texts):
+        if old != new and text_map.setdefault(old, new) != new:
+            return None
+    if any(not new.strip() for new in text_map.values()):
+        return None
+    for old, new in zip(old_placeholders, new_placeholders):
+        if old != new:
+            if old not in refactored:
+                return None
+            refactored = refactored.replace(old, new)
+    if not text_map:
+        return refactored
+    try:
+        spans = extract_translatable_spans(refactored, ast.parse(refactored))
+    except SyntaxError:
+        return None
+    if any(old not in {span.text for span in spans} for old in text_map):
+        return None
+    rewritten = apply_translations(refactored, spans, text_map)
+    # f-string 等无法改写的位置会被 apply_translations 跳过，改写后仍残留旧文本时放弃沿用
+    remaining = {span.text for span in extract_translatable_spans(rewritten)}
+    if any(old in remaining and old not in new_texts for old in text_map):
+        return None
+    return rewritten
+
+
+class Revision:
+    """
+    一次处理的版本记录：原文到译文的映射，以及每个代码块（按内容哈希）的重构结果。
+    给出上一版本的记录时，未改动的文本和代码块直接沿用上一版本的结果；译文与处理选项无关，
+    代码块只在重构选项相同时沿用。代码块以省略大型数据后的形式记录，占位符由数据内容哈希生成，跨版本保持稳定。
+    代码块另按文本骨架（见 text_skeleton）登记：只改了标签、注释或数据的代码块（例如只有一幅图的脚本改了一个标题）
+    也沿用上一版本的重构结果，只把其中的旧文本和旧数据换成新的，不必重新请求模型。
+    """
+
+    def __init__(self, base: Optional[Dict[str, Any]] = None, base_id: Optional[str] = None):
+        base = base or {}
+        self.base_id = base_id if base else None
+        self._base_translations: Dict[str, str] = base.get('translations', {})
+        self._base_blocks: Dict[str, str] = base.get('blocks', {})
+        self._base_skeletons: Dict[str, Dict[str, Any]] = base.get('skeletons', {})
+        self.translations: Dict[str, str] = {}
+        self.blocks: Dict[str, str] = {}
+        # 骨架键 -> {'texts': 文本, 'placeholders': 占位符, 'block': 代码块键}
+        self.skeletons: Dict[str, Dict[str, Any]] = {}
+        self.reused_translations = 0
+        self.reused_blocks = 0
+        self._lock = threading.Lock()
+
+    def reuse_translations(self, texts: Dict[str, str]) -> Dict[str, str]:
+        """返回 texts（键 -> 原文）中上一版本已翻译过的部分（键 -> 译文）。"""
+        reused = {key: self._base_translations[text] for key, text in texts.items() if text in self._base_translations}
+        if reused:
+            with self._lock:
+                self.reused_translations += len(reused)
+                self.translations.update((texts[key], value) for key, value in reused.items())
+        return reused
+
+    def record_translations(self, translations: Dict[str, str]) -> None:
+        with self._lock:
+            self.translations.update(translations)
+
+    def reuse_block(self, code: str, options_key: str) -> Optional[str]:
+        """
+        返回上一版本中同一代码块的重构结果；只改了文本或数据时返回换上新文本和新数据后的结果。
+        该块有其它改动、改动无法对应或上一版本没有记录时返回 None。
+        """
+        refactored = self._base_blocks.get(block_key(code, options_key))
+        skeleton = text_skeleton(code) if refactored is None and self._base_skeletons else None
+        if skeleton is not None:
+            entry = self._base_skeletons.get(block_key(skeleton[0], options_key))
+            base_refactored = self._base_blocks.get(entry['block']) if entry else None
+            if base_refactored is not None:
+                refactored = _retext(base_refactored, entry['texts'], skeleton[1], entry['placeholders'], skeleton[2])
+        if refactored is not None:
+            self.record_block(code, options_key, refactored)
+            with self._lock:
+                self.reused_blocks += 1
+        return refactored
+
+    def record_block(self, code: str, options_key: str, refactored: str) -> None:
+        key = block_key(code, options_key)
+        skeleton = text_skeleton(code)
+        with self._lock:
+            self.blocks[key] = refactored
+            if skeleton is not None:
+                self.skeletons[block_key(skeleton[0], options_key)] = {
+                    'texts': skeleton[1], 'placeholders': skeleton[2], 'block': key,
+                }
+
+    def to_record(self) -> Dict[str, Any]:
+        """本次登记的结果；没有登记任何结果时（例如命中结果缓存）沿用上一版本的记录，使下一版本仍可对比。"""
+        with self._lock:
+            if not (self.translations or self.blocks):
+                return {'base': self.base_id, 'translations': self._base_translations, 'blocks': self._base_blocks,
+                        'skeletons': self._base_skeletons}
+            return {
+                'base': self.base_id,
+                'translations': dict(self.translations),
+                'blocks': dict(self.blocks),
+                'skeletons': dict(self.skeletons),
+            }
+
+
+def current_revision() -> Optional[Revision]:
+    return _revision.get()
+
+
+@contextmanager
+def revision_session(revision: Revision) -> Iterator[Revision]:
+    """在 with 块内（包括经 submit_with_context 提交的工作线程）让流水线使用并登记该版本。"""
+    token = _revision.set(revision)
+    try:
+        yield revision
+    finally:
+        _revision.reset(token)
+
+
+def load_revision(store, version_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """从输出库的任务清单中读取版本记录；版本不存在、已过期或没有记录时返回 None。"""
+    if not REVISIONS_ENABLED or not version_id:
+        return None
+    try:
+        manifest = store.load_manifest(version_id)
+    except ValueError:
+        return None
+    record = ((manifest or {}).get('meta') or {}).get(REVISION_META_KEY)
+    return record if isinstance(record, dict) else None
@@ -0,0 +1,340 @@
+import ast
+import io
+import re
+import tokenize
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+_STRING_LITERAL_RE = re.compile(r"^([rRuUbBfF]*)('''|\"\"\"|'|\")")
+_HAS_LETTER_RE = re.compile('[a-zA-Z]')
+
+
+class TextSpan(NamedTuple):
+    """源码中一段待翻译文本的位置，start/end 为字符偏移（左闭右开）。"""
+    start: int
+    end: int
+    text: str
+    kind: str  # 'string': 整个字符串字面量；'fstring': f-string 的模板内容；'comment': 注释 '#' 之后的文本
+
+
+class SourceIndex:
+    """把 (行号, 列号) 转换为字符偏移。ast 的列号是 UTF-8 字节偏移，tokenize 的列号是字符偏移。"""
+
+    def __init__(self, source: str):
+        self.source = source
+        self.line_starts = [0]
+        for match in re.finditer('\n', source):
+            self.line_starts.append(match.end())
+
+    def _line(self, lineno: int) -> str:
+        start = self.line_starts[lineno - 1]
+        end = self.line_starts[lineno] if lineno < len(self.line_starts) else len(self.source)
+        return self.source[start:end]
+
+    def char_offset(self, lineno: int, col: int) -> int:
+        return self.line_starts[lineno - 1] + col
+
+    def byte_offset(self, lineno: int, col_bytes: int) -> int:
+        line = self._line(lineno)
+        if line.isascii():
+            return self.line_starts[lineno - 1] + col_bytes
+        return self.line_starts[lineno - 1] + len(line.encode('utf-8')[:col_bytes].decode('utf-8', errors='replace'))
+
+    def node_span(self, node: ast.AST) -> Tuple[int, int]:
+        return (self.byte_offset(node.lineno, node.col_offset),
+                self.byte_offset(node.end_lineno, node.end_col_offset))
+
+
+# 调用名 -> (承载文本的位置参数下标, 该调用额外的文本关键字参数)；下标为 None 表示所有位置参数
+TEXT_CALLS: Dict[str, Tuple[Optional[Tuple[int, ...]], Tuple[str, ...]]] = {
+    'title': ((0,), ()),
+    'suptitle': ((0,), ()),
+    'xlabel': ((0,), ()),
+    'ylabel': ((0,), ()),
+    'supxlabel': ((0,), ()),
+    'supylabel': ((0,), ()),
+    'set_title': ((0,), ()),
+    'set_xlabel': ((0,), ()),
+    'set_ylabel': ((0,), ()),
+    'set_zlabel': ((0,), ()),
+    'set_label': ((0,), ()),          # colorbar.set_label / artist.set_label
+    'text': ((2,), ('s',)),           # plt.text / ax.text / fig.text(x, y, s)
+    'figtext': ((2,), ('s',)),
+    'annotate': ((0,), ()),
+    'legend': (None, ()),             # legend(['a', 'b']) / legend(handles, ['a', 'b'])
+    'xticks': ((1,), ()),
+    'yticks': ((1,), ()),
+    'set_xticklabels': ((0,), ()),
+    'set_yticklabels': ((0,), ()),
+    'set_zticklabels': ((0,), ()),
+    'set_ticklabels': ((0,), ()),
+}
+
+# 绘图调用（pyplot / Axes / Figure 方法、图元构造）的这些关键字参数视为文本：plot/bar/scatter 的 label=、
+# colorbar 的 label=、pie 的 labels=、ax.set(title=...) 等。其它库的同名参数（pd.cut(labels=...)、
+# confusion_matrix(labels=...)）是数据而不是显示文本，不翻译
+TEXT_KEYWORDS = {'label', 'labels', 'title', 'xlabel', 'ylabel', 'zlabel', 'text'}
+
+# 接受 TEXT_KEYWORDS 的绘图调用名；TEXT_CALLS 中的调用（legend(title=...)、annotate(text=...)）同样接受
+PLOT_CALLS = {
+    'plot', 'scatter', 'bar', 'barh', 'bar_label', 'hist', 'hist2d', 'pie', 'errorbar', 'step', 'stem', 'stairs',
+    'fill', 'fill_between', 'fill_betweenx', 'stackplot', 'boxplot', 'violinplot', 'eventplot', 'broken_barh',
+    'axhline', 'axvline', 'axline', 'hlines', 'vlines', 'axhspan', 'axvspan', 'semilogx', 'semilogy', 'loglog',
+    'imshow', 'matshow', 'pcolor', 'pcolormesh', 'contour', 'contourf', 'tricontour', 'tricontourf', 'tripcolor',
+    'quiver', 'streamplot', 'hexbin', 'colorbar', 'set', 'add_subplot', 'add_axes', 'subplot', 'subplot_mosaic',
+    'plot_surface', 'plot_wireframe', 'plot_trisurf', 'plot3D', 'scatter3D', 'bar3d',
+    'Line2D', 'Patch', 'Rectangle', 'Circle', 'Ellipse', 'Polygon', 'FancyBboxPatch',
+    # seaborn 的 axes 级绘图函数
+    'lineplot', 'scatterplot', 'histplot', 'kdeplot', 'ecdfplot', 'barplot', 'countplot', 'regplot',
+}
+
+# 编码声明、类型注释和工具指令注释不翻译
+_CODING_RE = re.compile(r'^[ \t\f]*#.*?coding[:=]')
+_DIRECTIVE_COMMENT_RE = re.compile(r'#\s*(%%|type:|noqa\b|pragma\b|pylint:|fmt:|isort:|mypy:|pyright:|ruff:)')
+# 整个字符串只是一段 mathtext 公式（例如 '$\\alpha$'）时无需翻译
+_MATHTEXT_RE = re.compile(r'^\s*\$[^$]*\$\s*$')
+# f-string 中的占位符；'{{' 与 '}}' 是转义的花括号，不算占位符
+_PLACEHOLDER_RE = re.compile(r'\{\{|\}\}|\{[^{}]*\}')
+_NON_BRACKET_RE = re.compile(r'[^()\[\]{}]+')
+
+
+def _needs_translation(text: str) -> bool:
+    return bool(_HAS_LETTER_RE.search(text)) and not _MATHTEXT_RE.match(text)
+
+
+def _placeholders(template: str) -> List[str]:
+    return sorted(match for match in _PLACEHOLDER_RE.findall(template) if match not in ('{{', '}}'))
+
+
+def _fstring_parts(literal: str) -> Optional[Tuple[str, str, str]]:
+    """
+    把单个 f-string 字面量拆成 (前缀与开引号, 模板内容, 闭引号)。
+    隐式拼接、bytes 或内容中含有同种引号等无法安全重写的形式返回 None。
+    """
+    match = _STRING_LITERAL_RE.match(literal)
+    if not match:
+        return None
+    prefix, quote = match.groups()
+    if 'f' not in prefix.lower() or 'b' in prefix.lower():
+        return None
+    opening = prefix + quote
+    if len(literal) < len(opening) + len(quote) or not literal.endswith(quote):
+        return None
+    body = literal[len(opening):len(literal) - len(quote)]
+    if quote in body:
+        return None
+    return opening, body, quote
+
+
+def _call_name(func: ast.AST) -> Optional[str]:
+    if isinstance(func, ast.Attribute):
+        return func.attr
+    if isinstance(func, ast.Name):
+        return func.id
+    return None
+
+
+def _is_literal_leaf(node: ast.AST) -> bool:
+    """数值常量、名字以及负数（-1.5）不可能包含调用或文本，遍历时直接跳过。"""
+    if isinstance(node, ast.Constant):
+        return not isinstance(node.value, str)
+    if isinstance(node, ast.UnaryOp):
+        return isinstance(node.operand, ast.Constant) and not isinstance(node.operand.value, str)
+    return isinstance(node, ast.Name)
+
+
+class _TextVisitor:
+    """
+    一次遍历收集所有绘图文本参数：字符串、字符串列表（刻度标签、图例）以及 f-string 模板。
+    用显式栈代替 ast.NodeVisitor 的递归分派，并跳过数值叶子节点，内联的大型数据字面量几乎不增加开销。
+    """
+
+    def __init__(self, source: str, index: SourceIndex):
+        self.source = source
+        self.index = index
+        self.spans: List[TextSpan] = []
+
+    def visit(self, tree: ast.AST) -> None:
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, ast.Call):
+                self.visit_Call(node)
+            if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+                children = node.elts
+            else:
+                children = ast.iter_child_nodes(node)
+            stack.extend(child for child in children if not _is_literal_leaf(child))
+
+    def visit_Call(self, node: ast.Call) -> None:
+        name = _call_name(node.func)
+        positions, keywords = TEXT_CALLS.get(name, ((), ()))
+        if name in TEXT_CALLS or name in PLOT_CALLS:
+            keywords = TEXT_KEYWORDS.union(keywords)
+        if positions is None:
+            for arg in node.args:
+                self._add_text(arg)
+        else:
+            for position in positions:
+                if position < len(node.args):
+                    self._add_text(node.args[position])
+        for keyword in node.keywords:
+            if keyword.arg in keywords:
+                self._add_text(keyword.value)
+
+    def _add_text(self, node: ast.AST) -> None:
+        if isinstance(node, (ast.List, ast.Tuple)):
+            for element in node.elts:
+                self._add_text(element)
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            if _needs_translation(node.value):
+                start, end = self.index.node_span(node)
+                self.spans.append(TextSpan(start, end, node.value, 'string'))
+        elif isinstance(node, ast.JoinedStr):
+            start, end = self.index.node_span(node)
+            parts = _fstring_parts(self.source[start:end])
+            # 只翻译模板中的文字部分，占位符原样保留
+            if parts and _needs_translation(_PLACEHOLDER_RE.sub('', parts[1])):
+                self.spans.append(TextSpan(start, end, parts[1], 'fstring'))
+
+
+def _comment_tokens(source: str) -> Iterator[Tuple[int, int, str, str]]:
+    """
+    产出 (行号, 列号, 注释记号, 所在行)。
+    既没有 '#'、也没有引号和反斜杠的行（例如内联数据）不会改变注释的识别结果，
+    先把这些行缩减为只剩括号（保持括号配对状态），并去掉所有行首缩进，再交给 tokenize；
+    缩减后的源码无法切分时退回完整扫描。
+    """
+    lines = source.splitlines(keepends=True)
+    reduced = []
+    indents = []
+    for line in lines:
+        if '#' in line or "'" in line or '"' in line or '\\' in line:
+            stripped = line.lstrip(' \t\f')
+            indents.append(len(line) - len(stripped))
+            reduced.append(stripped)
+        else:
+            indents.append(0)
+            reduced.append(_NON_BRACKET_RE.sub('', line) + '\n')
+    try:
+        comments = [(token.start[0], token.start[1] + indents[token.start[0] - 1], token.string)
+                    for token in tokenize.generate_tokens(io.StringIO(''.join(reduced)).readline)
+                    if token.type == tokenize.COMMENT]
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        comments = None
+    if comments is None:
+        comments = [(token.start[0], token.start[1], token.string)
+                    for token in tokenize.generate_tokens(io.StringIO(source).readline)
+                    if token.type == tokenize.COMMENT]
+    for row, col, string in comments:
+        yield row, col, string, lines[row - 1]
+
+
+def _comment_spans(source: str, index: SourceIndex) -> List[TextSpan]:
+    """整行注释和行尾注释，跳过 shebang、编码声明以及 type:/noqa 等指令注释。"""
+    spans: List[TextSpan] = []
+    if '#' not in source:
+        return spans
+    try:
+        for row, col, string, line in _comment_tokens(source):
+            if row == 1 and string.startswith('#!'):
+                continue
+            if row <= 2 and _CODING_RE.match(line):
+                continue
+            if _DIRECTIVE_COMMENT_RE.search(string):
+                continue
+            comment_text = string[1:].strip()
+            if comment_text and _HAS_LETTER_RE.search(comment_text):
+                text_start = index.char_offset(row, col) + string.index(comment_text, 1)
+                spans.append(TextSpan(text_start, text_start + len(comment_text), comment_text, 'comment'))
+    except (tokenize.TokenError, IndentationError, SyntaxError) as e:
+        print(f"注释扫描失败，跳过注释翻译: {e}")
+    return spans
+
+
+def extract_translatable_spans(source: str, tree: Optional[ast.AST] = None) -> List[TextSpan]:
+    """
+    提取所有 matplotlib 文本及注释，并记录它们在源码中的精确位置。
+    字符串与 f-string 来自一次 ast 遍历（见 TEXT_CALLS / PLOT_CALLS / TEXT_KEYWORDS），注释来自一次 tokenize 扫描。
+    """
+    if tree is None:
+        tree = ast.parse(source)
+    index = SourceIndex(source)
+    visitor = _TextVisitor(source, index)
+    visitor.visit(tree)
+    spans = visitor.spans + _comment_spans(source, index)
+    spans.sort(key=lambda span: span.start)
+    return spans
+
+
+def format_string_literal(original_literal: str, value: str) -> Optional[str]:
+    """
+    生成一个值为 value 的字符串字面量，沿用原字面量的引号风格。
+    bytes / f-string 等无法安全替换的字面量返回 None。
+    """
+    match = _STRING_LITERAL_RE.match(original_literal)
+    if not match:
+        return None
+    prefix, quote = match.groups()
+    if set(prefix.lower()) & {'b', 'f'}:
+        return None
+    # 统一转义后输出普通字符串，因此不再保留 r/u 前缀
+    body = value.replace('\\', '\\\\')
+    body = body.replace(quote[0], '\\' + quote[0])
+    if len(quote) == 1:
+        body = body.replace('\n', '\\n').replace('\r', '\\r')
+    return f"{quote}{body}{quote}"
+
+
+def format_fstring_literal(original_literal: str, template: str) -> Optional[str]:
+    """
+    用译文模板重写 f-string，沿用原来的前缀和引号。
+    译文的占位符必须与原文完全一致，且结果必须仍是合法的 f-string，否则返回 None。
+    """
+    parts = _fstring_parts(original_literal)
+    if parts is None:
+        return None
+    opening, body, quote = parts
+    if _placeholders(template) != _placeholders(body) or quote in template:
+        return None
+    if len(quote) == 1 and ('\n' in template or '\r' in template):
+        return None
+    literal = f"{opening}{template}{quote}"
+    try:
+        node = ast.parse(literal, mode='eval').body
+    except SyntaxError:
+        return None
+    return literal if isinstance(node, ast.JoinedStr) else None
+
+
+def apply_edits(source: str, edits: Iterable[Tuple[int, int, str]]) -> str:
+    """按位置一次性应用所有替换 (start, end, replacement)；与前一处重叠的替换会被忽略。"""
+    pieces = []
+    cursor = 0
+    for start, end, replacement in sorted(edits, key=lambda edit: (edit[0], edit[1])):
+        if start < cursor:
+            continue
+        pieces.append(source[cursor:start])
+        pieces.append(replacement)
+        cursor = end
+    pieces.append(source[cursor:])
+    return ''.join(pieces)
+
+
+def apply_translations(source: str, spans: Iterable[TextSpan], translation_map: Dict[str, str]) -> str:
+    """把译文按 spans 记录的位置写回源码，只改动被提取出的字面量和注释。"""
+    edits = []
+    for span in spans:
+        translated = translation_map.get(span.text)
+        if not isinstance(translated, str) or not translated.strip() or translated == span.text:
+            continue
+        if span.kind == 'comment':
+            edits.append((span.start, span.end, ' '.join(translated.splitlines())))
+        elif span.kind == 'fstring':
+            literal = format_fstring_literal(source[span.start:span.end], translated)
+            if literal is not None:
+                edits.append((span.start, span.end, literal))
+        else:
+            literal = format_string_literal(source[span.start:span.end], translated)
+            if literal is not None:
+                edits.append((span.start, span.end, literal))
+    return apply_edits(source, edits)
@@ -0,0 +1,127 @@
+import ast
+import os
+from typing import List, NamedTuple, Optional, Set
+
+# --- 配置区 ---
+SEGMENT_ENABLED = os.getenv('SEGMENT_ENABLED', '1') != '0'
+# 至少包含这么多个图形块时才分段重构，否则整文件发送
+SEGMENT_MIN_BLOCKS = int(os.getenv('SEGMENT_MIN_BLOCKS', '2'))
+SEGMENT_MAX_WORKERS = int(os.getenv('SEGMENT_MAX_WORKERS', '4'))
+
+# 开始一幅新图的调用，以及结束一幅图的调用
+FIGURE_START_CALLS = {'figure', 'subplots', 'subplot_mosaic'}
+FIGURE_END_CALLS = {'show', 'savefig'}
+# 紧跟在结束调用之后、仍属于同一幅图的收尾调用
+FIGURE_TAIL_CALLS = FIGURE_END_CALLS | {'close', 'tight_layout'}
+
+
+class Segment(NamedTuple):
+    """脚本中的一段连续源码，所有段按顺序拼接后与原脚本完全一致。"""
+    kind: str  # 'preamble': 第一幅图之前的公共代码；'figure': 一个图形块；'other': 图形块之间或之后的代码
+    code: str
+
+
+def _call_names(node: ast.AST) -> Set[str]:
+    names = set()
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            func = child.func
+            if isinstance(func, ast.Attribute):
+                names.add(func.attr)
+            elif isinstance(func, ast.Name):
+                names.add(func.id)
+    return names
+
+
+def _is_tail_statement(node: ast.stmt, names: Set[str]) -> bool:
+    return isinstance(node, ast.Expr) and bool(names) and names <= FIGURE_TAIL_CALLS
+
+
+def _statement_start_line(node: ast.stmt) -> int:
+    decorators = getattr(node, 'decorator_list', None)
+    return min([node.lineno] + [decorator.lineno for decorator in decorators]) if decorators else node.lineno
+
+
+def find_figure_blocks(tree: ast.Module) -> List[range]:
+    """
+    在顶层语句中查找图形块，返回语句下标区间。
+    块从包含 plt.figure/plt.subplots 的语句开始，到包含 show/savefig 的语句（及紧随其后的收尾调用）结束；
+    尚未结束时又开始了新图，则上一块在新图之前结束。
+    """
+    statements = tree.body
+    names = [_call_names(node) for node in statements]
+    blocks: List[range] = []
+    start: Optional[int] = None
+    i = 0
+    while i < len(statements):
+        starts_figure = bool(names[i] & FIGURE_START_CALLS)
+        ends_figure = bool(names[i] & FIGURE_END_CALLS)
+        if starts_figure and start is not None and not ends_figure:
+            blocks.append(range(start, i))
+            start = None
+        if start is None and starts_figure:
+            start = i
+        if start is not None and ends_figure:
+            while i + 1 < len(statements) and _is_tail_statement(statements[i + 1], names[i + 1]):
+                i += 1
+            blocks.append(range(start, i + 1))
+            start = None
+        i += 1
+    if start is not None:
+        blocks.append(range(start, len(statements)))
+    return blocks
+
+
+def segment_script(source: str, tree: Optional[ast.Module] = None) -> List[Segment]:
+    """
+    把脚本切分为公共前置代码、各图形块和其余代码。块的边界落在整行上，
+    块上方紧邻的注释行归入该块。没有找到图形块时返回只含一个 'preamble' 段的列表。
+    """
+    if tree is None:
+        tree = ast.parse(source)
+    lines = source.splitlines(keepends=True)
+    blocks = find_figure_blocks(tree)
+    if not blocks:
+        return [Segment('preamble', source)]
+
+    statements = tree.body
+    # 每个块的 (起始行, 结束行)，行号从 0 开始、左闭右开
+    line_ranges = []
+    previous_end = 0
+    for block in blocks:
+        first = _statement_start_line(statements[block.start]) - 1
+        last = statements[block.stop - 1].end_lineno
+        # 与块外语句共用一行（例如用分号连接）时无法按整行切分
+        if (block.start > 0 and statements[block.start - 1].end_lineno > first) or \
+                (block.stop < len(statements) and _statement_start_line(statements[block.stop]) <= last):
+            return [Segment('preamble', source)]
+        while first > previous_end and lines[first - 1].lstrip().startswith('#'):
+            first -= 1
+        line_ranges.append((first, last))
+        previous_end = last
+
+    segments: List[Segment] = []
+    cursor = 0
+    for index, (first, last) in enumerate(line_ranges):
+        if first > cursor:
+            segments.append(Segment('preamble' if index == 0 else 'other', ''.join(lines[cursor:first])))
+        segments.append(Segment('figure', ''.join(lines[first:last])))
+        cursor = last
+    if cursor < len(lines):
+        segments.append(Segment('other', ''.join(lines[cursor:])))
+    return segments
+
+
+def preamble_of(segments: List[Segment]) -> str:
+    return ''.join(segment.code for segment in segments if segment.kind == 'preamble')
+
+
+def stitch_segments(segments: List[Segment], replacements: List[Optional[str]]) -> str:
+    """按原顺序拼接各段，replacements[i] 不为 None 时替换第 i 段的代码。"""
+    parts = []
+    for segment, replacement in zip(segments, replacements):
+        if replacement is None:
+            parts.append(segment.code)
+        else:
+            parts.append(replacement.strip('\n') + ('\n' if segment.code.endswith('\n') else ''))
+    return ''.join(parts)
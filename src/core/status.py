@@ -0,0 +1,83 @@
+import contextvars
+import queue
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Generator, Iterator, List, Optional, Sequence
+
+StatusSink = Callable[[str], None]
+
+# 当前任务的状态接收者；深层代码（例如 DeepSeek 限流等待）通过 report_status() 把进度推送给用户
+_status_sink: contextvars.ContextVar[Optional[StatusSink]] = contextvars.ContextVar('status_sink', default=None)
+
+
+def report_status(message: str) -> None:
+    """把状态发送给当前上下文的接收者（例如 SSE 事件）；没有接收者时打印到控制台。"""
+    sink = _status_sink.get()
+    if sink is None:
+        print(message)
+        return
+    try:
+        sink(message)
+    except Exception as e:
+        print(f"状态推送失败: {e}; {message}")
+
+
+@contextmanager
+def status_sink(sink: StatusSink) -> Iterator[None]:
+    """在 with 块内把 report_status() 的消息交给 sink。"""
+    token = _status_sink.set(sink)
+    try:
+        yield
+    finally:
+        _status_sink.reset(token)
+
+
+def submit_with_context(executor: Executor, fn, *args, **kwargs) -> Future:
+    """在线程池中执行 fn 时沿用当前上下文，使工作线程内的 report_status() 仍发送给同一个接收者。"""
+    context = contextvars.copy_context()
+    return executor.submit(context.run, fn, *args, **kwargs)
+
+
+def merge_streams(streams: Sequence[Generator[str, None, Any]],
+                  max_workers: Optional[int] = None) -> Generator[str, None, List[Any]]:
+    """
+    在线程池中同时驱动多个状态生成器（默认每个一个线程），按产生顺序转发它们的状态。
+    生成器的返回值为各输入生成器返回值组成的列表；任一生成器抛出的异常会在这里重新抛出。
+    """
+    events: queue.Queue = queue.Queue()
+
+    def drive(index: int, stream: Generator[str, None, Any]) -> None:
+        try:
+            while True:
+                try:
+                    events.put((index, 'status', next(stream)))
+                except StopIteration as stop:
+                    events.put((index, 'done', stop.value))
+                    return
+        except BaseException as e:
+            events.put((index, 'error', e))
+
+    results: List[Any] = [None] * len(streams)
+    if not streams:
+        return results
+    executor = ThreadPoolExecutor(max_workers=min(max_workers or len(streams), len(streams)))
+    futures = []
+    try:
+        for index, stream in enumerate(streams):
+            futures.append(submit_with_context(executor, drive, index, stream))
+        remaining = len(streams)
+        while remaining:
+            index, kind, value = events.get()
+            if kind == 'status':
+                yield value
+                continue
+            remaining -= 1
+            if kind == 'error':
+                raise value
+            results[index] = value
+    finally:
+        # 调用方提前关闭时不等待仍在运行的请求，它们结束后自行退出；尚未开始的生成器不再执行
+        for future in futures:
+            future.cancel()
+        executor.shutdown(wait=False)
+    return results
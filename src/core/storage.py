@@ -0,0 +1,362 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from core.metrics import STORAGE_BYTES
+
+# --- 配置区 ---
+OUTPUT_TTL_SECONDS = int(os.getenv('OUTPUT_TTL_SECONDS', str(7 * 24 * 3600)))
+UPLOAD_TTL_SECONDS = int(os.getenv('UPLOAD_TTL_SECONDS', str(24 * 3600)))
+STORAGE_MAX_BYTES = int(os.getenv('STORAGE_MAX_BYTES', str(1024 * 1024 * 1024)))
+JANITOR_INTERVAL_SECONDS = int(os.getenv('JANITOR_INTERVAL_SECONDS', '600'))
+GZIP_MIN_BYTES = int(os.getenv('GZIP_MIN_BYTES', '1024'))
+
+_MANIFEST_ID_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _atomic_write(path: str, data: bytes) -> None:
+    """先写临时文件再改名，读者永远看不到写了一半的文件。"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class OutputStore:
+    """
+    内容寻址的输出存储：文件内容按 sha256 保存在 objects/ 下（相同内容只存一份，
+    较大的文件额外保存预压缩的 .gz），每个任务一个清单 manifests/<id>.json，记录文件名到内容哈希的映射。
+    不同任务的同名输出互不覆盖，下载地址为 /download/<任务ID>/<文件名>。
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.manifests_dir = os.path.join(root, 'manifests')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        # 写清单与回收对象需要互斥，避免回收掉刚登记、尚未写入清单的对象
+        self._lock = threading.RLock()
+        self.evicted_manifests = 0
+        self.evicted_objects = 0
+        self.evicted_bytes = 0
+
+    # --- 对象 ---
+
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def put_bytes(self, data: bytes) -> str:
+        """保存内容并返回其 sha256；内容已存在时不重复写入。"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        with self._lock:
+            if os.path.exists(path):
+                os.utime(path)
+                return digest
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _atomic_write(path, data)
+            if len(data) >= GZIP_MIN_BYTES:
+                _atomic_write(path + '.gz', gzip.compress(data, compresslevel=9, mtime=0))
+        return digest
+
+    # --- 清单 ---
+
+    def _manifest_path(self, manifest_id: str) -> str:
+        if not _MANIFEST_ID_RE.match(manifest_id):
+            raise ValueError(f"非法的任务ID: {manifest_id}")
+        return os.path.join(self.manifests_dir, f"{manifest_id}.json")
+
+    def load_manifest(self, manifest_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._manifest_path(manifest_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def add_file(self, manifest_id: str, name: str, source_path: str) -> Dict[str, Any]:
+        """把 source_path 的内容存入对象库，并以 name 登记到任务清单中，返回登记信息。"""
+        with open(source_path, 'rb') as f:
+            data = f.read()
+        with self._lock:
+            digest = self.put_bytes(data)
+            manifest = self.load_manifest(manifest_id) or {'id': manifest_id, 'created_at': time.time(), 'files': {}}
+            entry = {'sha256': digest, 'size': len(data)}
+            manifest['files'][name] = entry
+            _atomic_write(self._manifest_path(manifest_id), json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+        return entry
+
+    def set_meta(self, manifest_id: str, key: str, value: Any) -> None:
+        """在任务清单中记录附加信息（例如渲染结果），清单不存在时新建。"""
+        with self._lock:
+            manifest = self.load_manifest(manifest_id) or {'id': manifest_id, 'created_at': time.time(), 'files': {}}
+            manifest.setdefault('meta', {})[key] = value
+            _atomic_write(self._manifest_path(manifest_id), json.dumps(manifest, ensure_ascii=False).encode('utf-8'))
+
+    def resolve(self, manifest_id: str, name: str) -> Optional[Dict[str, Any]]:
+        """
+        查找任务清单中的文件，返回 {'path', 'gzip_path', 'sha256', 'size'}；不存在时返回 None。
+        gzip_path 只在存在预压缩文件时给出。
+        """
+        try:
+            manifest = self.load_manifest(manifest_id)
+        except ValueError:
+            return None
+        entry = (manifest or {}).get('files', {}).get(name)
+        if not entry:
+            return None
+        path = self._object_path(entry['sha256'])
+        if not os.path.exists(path):
+            return None
+        gzip_path = path + '.gz'
+        return {
+            'path': path,
+            'gzip_path': gzip_path if os.path.exists(gzip_path) else None,
+            'sha256': entry['sha256'],
+            'size': entry['size'],
+        }
+
+    # --- 回收 ---
+
+    def _manifests_by_age(self) -> List[Dict[str, Any]]:
+        manifests = []
+        for filename in os.listdir(self.manifests_dir):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(self.manifests_dir, filename)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            manifest['_path'] = path
+            manifests.append(manifest)
+        manifests.sort(key=lambda manifest: manifest.get('created_at', 0))
+        return manifests
+
+    def _object_sizes(self) -> Dict[str, int]:
+        """{哈希: 对象及其 .gz 的总字节数}"""
+        sizes: Dict[str, int] = {}
+        for shard in os.listdir(self.objects_dir):
+            shard_dir = os.path.join(self.objects_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for filename in os.listdir(shard_dir):
+                if filename.startswith('.tmp-'):
+                    continue
+                digest = filename[:-3] if filename.endswith('.gz') else filename
+                try:
+                    sizes[digest] = sizes.get(digest, 0) + os.path.getsize(os.path.join(shard_dir, filename))
+                except OSError:
+                    pass
+        return sizes
+
+    def _remove_object(self, digest: str) -> int:
+        freed = 0
+        for path in (self._object_path(digest), self._object_path(digest) + '.gz'):
+            try:
+                freed += os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                pass
+        return freed
+
+    def evict(self, max_age: float = OUTPUT_TTL_SECONDS, max_bytes: int = STORAGE_MAX_BYTES) -> Dict[str, int]:
+        """
+        删除超过 max_age 的任务清单；总字节数仍超过 max_bytes 时继续从最旧的清单开始删除。
+        随后回收不再被任何清单引用的对象。返回本轮删除的清单数、对象数、字节数和被删除清单的 ID。
+        """
+        removed_manifests = removed_objects = freed = 0
+        removed_ids: List[str] = []
+        with self._lock:
+            now = time.time()
+            manifests = self._manifests_by_age()
+            sizes = self._object_sizes()
+
+            def referenced(live):
+                return {entry['sha256'] for manifest in live for entry in manifest.get('files', {}).values()}
+
+            live = [manifest for manifest in manifests if now - manifest.get('created_at', 0) <= max_age]
+            expired = [manifest for manifest in manifests if now - manifest.get('created_at', 0) > max_age]
+            while live and sum(sizes.get(digest, 0) for digest in referenced(live)) > max_bytes:
+                expired.append(live.pop(0))
+
+            for manifest in expired:
+                try:
+                    os.remove(manifest['_path'])
+                    removed_manifests += 1
+                    removed_ids.append(manifest.get('id'))
+                except OSError:
+                    pass
+
+            keep = referenced(live)
+            for digest in sizes:
+                if digest not in keep:
+                    freed += self._remove_object(digest)
+                    removed_objects += 1
+
+            self.evicted_manifests += removed_manifests
+            self.evicted_objects += removed_objects
+            self.evicted_bytes += freed
+        return {'manifests': removed_manifests, 'objects': removed_objects, 'bytes': freed, 'ids': removed_ids}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sizes = self._object_sizes()
+            manifest_count = sum(1 for name in os.listdir(self.manifests_dir) if name.endswith('.json'))
+            return {
+                'objects': len(sizes),
+                'object_bytes': sum(sizes.values()),
+                'manifests': manifest_count,
+                'evicted_manifests': self.evicted_manifests,
+                'evicted_objects': self.evicted_objects,
+                'evicted_bytes': self.evicted_bytes,
+            }
+
+
+class StorageJanitor:
+    """
+    后台清理线程：定期按存活时间和总字节预算回收上传目录与输出存储。
+    in_use 返回仍被排队或运行中的任务使用的上传目录，这些目录不会被回收；
+    给出 jobs（JobManager）时，同时删除已结束且输出已过期的任务记录、事件与追踪。
+    """
+
+    def __init__(self, store: OutputStore, upload_root: str, interval: float = JANITOR_INTERVAL_SECONDS,
+                 upload_ttl: float = UPLOAD_TTL_SECONDS, max_bytes: int = STORAGE_MAX_BYTES,
+                 in_use: Optional[Callable[[], Iterable[str]]] = None, jobs=None,
+                 output_ttl: float = OUTPUT_TTL_SECONDS):
+        self.store = store
+        self.upload_root = upload_root
+        self.interval = interval
+        self.upload_ttl = upload_ttl
+        self.max_bytes = max_bytes
+        self.output_ttl = output_ttl
+        self.in_use = in_use
+        self.jobs = jobs
+        self.pruned_jobs = 0
+        # 磁盘占用只在每轮清理后统计一次，/metrics 与 /storage/stats 直接读取，不在每次请求时遍历目录
+        self.sizes: Dict[str, Any] = {'objects': 0, 'object_bytes': 0, 'manifests': 0, 'upload_bytes': 0}
+        self.sizes_measured_at: Optional[float] = None
+        self.evicted_uploads = 0
+        self.evicted_upload_bytes = 0
+        self.runs = 0
+        self.last_run_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._loop, name='storage-janitor', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"存储清理失败: {e}")
+            self._stop.wait(self.interval)
+
+    def _sweep_uploads(self) -> None:
+        """
+        上传目录按最后修改时间回收：超过 upload_ttl 的直接删除，总量超出预算时从最旧的开始删除。
+        每次上传都位于独立的子目录中，因此以子目录为单位删除；仍在使用中的目录既不删除也不计入总量。
+        """
+        if not os.path.isdir(self.upload_root):
+            return
+        protected = {os.path.abspath(path) for path in self.in_use()} if self.in_use else set()
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.upload_root):
+            path = os.path.join(self.upload_root, name)
+            if os.path.abspath(path) in protected:
+                continue
+            try:
+                entries.append((os.path.getmtime(path), path, _tree_size(path) if os.path.isdir(path) else os.path.getsize(path)))
+            except OSError:
+                continue
+        entries.sort()
+        total = sum(size for _, _, size in entries)
+        for mtime, path, size in entries:
+            if now - mtime <= self.upload_ttl and total <= self.max_bytes:
+                break
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+            total -= size
+            self.evicted_uploads += 1
+            self.evicted_upload_bytes += size
+
+    def run_once(self) -> Dict[str, int]:
+        with self._lock:
+            self._sweep_uploads()
+            result = self.store.evict(max_age=self.output_ttl, max_bytes=self.max_bytes)
+            if self.jobs is not None:
+                # 任务记录与其输出一起回收：输出已被删除的任务，以及结束时间超过输出存活时间的任务
+                self.pruned_jobs += self.jobs.prune(self.output_ttl, job_ids=result['ids'])
+            self._measure()
+            self.runs += 1
+            self.last_run_at = time.time()
+        return result
+
+    def _measure(self) -> None:
+        store_stats = self.store.stats()
+        self.sizes = {
+            'objects': store_stats['objects'],
+            'object_bytes': store_stats['object_bytes'],
+            'manifests': store_stats['manifests'],
+            'upload_bytes': _tree_size(self.upload_root) if os.path.isdir(self.upload_root) else 0,
+        }
+        self.sizes_measured_at = time.time()
+        STORAGE_BYTES.set(self.sizes['object_bytes'], area='outputs')
+        STORAGE_BYTES.set(self.sizes['upload_bytes'], area='uploads')
+
+    def stats(self) -> Dict[str, Any]:
+        """上一轮清理时统计的磁盘占用与累计回收数量；不遍历目录，可以频繁调用。"""
+        stats = dict(self.sizes)
+        stats.update({
+            'sizes_measured_at': self.sizes_measured_at,
+            'evicted_manifests': self.store.evicted_manifests,
+            'evicted_objects': self.store.evicted_objects,
+            'evicted_bytes': self.store.evicted_bytes,
+            'evicted_uploads': self.evicted_uploads,
+            'evicted_upload_bytes': self.evicted_upload_bytes,
+            'pruned_jobs': self.pruned_jobs,
+            'janitor_runs': self.runs,
+            'janitor_last_run_at': self.last_run_at,
+            'max_bytes': self.max_bytes,
+        })
+        return stats
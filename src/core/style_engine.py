@@ -0,0 +1,193 @@
+import ast
+from typing import List, Optional, Set, Tuple
+
+from core.rewrite import SourceIndex, apply_edits
+
+FIGURE_FACTORIES = {'figure', 'subplots', 'subplot_mosaic'}
+STYLE_BLOCK_MARKER = '学术风格注入'
+
+
+def find_pyplot_aliases(tree: ast.AST) -> Set[str]:
+    """找出 pyplot 在代码中的名字，例如 plt、pyplot 或 matplotlib.pyplot。"""
+    aliases = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name == 'matplotlib.pyplot':
+                    aliases.add(alias.asname or 'matplotlib.pyplot')
+        elif isinstance(node, ast.ImportFrom) and node.module == 'matplotlib':
+            for alias in node.names:
+                if alias.name == 'pyplot':
+                    aliases.add(alias.asname or 'pyplot')
+    return aliases
+
+
+def _dotted_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _dotted_name(node.value)
+        return f"{base}.{node.attr}" if base else None
+    return None
+
+
+def _pyplot_call(node: ast.AST, aliases: Set[str], names: Set[str]) -> bool:
+    """node 是否为 <pyplot 别名>.<names 中的函数>(...) 调用。"""
+    return (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr in names and _dotted_name(node.func.value) in aliases)
+
+
+def _find_pyplot_import(tree: ast.Module) -> Optional[ast.stmt]:
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Import) and any(alias.name == 'matplotlib.pyplot' for alias in stmt.names):
+            return stmt
+        if isinstance(stmt, ast.ImportFrom) and stmt.module == 'matplotlib' and \
+                any(alias.name == 'pyplot' for alias in stmt.names):
+            return stmt
+    return None
+
+
+def _module_insert_offset(tree: ast.Module, index: SourceIndex) -> int:
+    """模块文档字符串和 __future__ 导入之后的位置。"""
+    offset = 0
+    for stmt in tree.body:
+        is_docstring = isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Constant) and \
+            isinstance(stmt.value.value, str)
+        is_future = isinstance(stmt, ast.ImportFrom) and stmt.module == '__future__'
+        if not (is_docstring or is_future):
+            break
+        offset = _line_end_offset(index, stmt.end_lineno)
+    return offset
+
+
+def _line_end_offset(index: SourceIndex, lineno: int) -> int:
+    """第 lineno 行之后（下一行开头）的字符偏移。"""
+    if lineno < len(index.line_starts):
+        return index.line_starts[lineno]
+    return len(index.source)
+
+
+def _statement_lists(tree: ast.AST):
+    for node in ast.walk(tree):
+        for field in ('body', 'orelse', 'finalbody'):
+            stmts = getattr(node, field, None)
+            if isinstance(stmts, list) and stmts and isinstance(stmts[0], ast.stmt):
+                yield stmts
+
+
+def _figure_variables(tree: ast.AST, aliases: Set[str]) -> Set[str]:
+    """由 plt.figure() / plt.subplots() 创建的 Figure 变量名，例如 fig。"""
+    names = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Assign) or not _pyplot_call(node.value, aliases, FIGURE_FACTORIES):
+            continue
+        for target in node.targets:
+            if node.value.func.attr == 'figure' and isinstance(target, ast.Name):
+                names.add(target.id)
+            elif isinstance(target, ast.Tuple) and target.elts and isinstance(target.elts[0], ast.Name):
+                names.add(target.elts[0].id)
+    return names
+
+
+def _is_savefig_stmt(stmt: ast.stmt) -> bool:
+    return isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) and \
+        isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == 'savefig'
+
+
+def transform_academic_style(code: str, style_block: str, figsize: Tuple[float, float],
+                             vector_format: Optional[str], output_filename_base: str,
+                             dpi: int = 300) -> Tuple[str, List[str]]:
+    """
+    基于 AST 确定性地应用学术风格，返回 (新代码, 处理说明)：
+    - 改写或补充 pyplot 的 figure/subplots/subplot_mosaic 调用中的 figsize 参数；
+    - 在 pyplot 导入语句之后注入 rcParams 样式代码块（已注入过则跳过）；
+    - 在每个 plt.show() / fig.show() 之前插入对应的 savefig，多个图依次编号。
+    代码无法解析时抛出 SyntaxError。
+    """
+    tree = ast.parse(code)
+    index = SourceIndex(code)
+    notes: List[str] = []
+    edits = []
+
+    aliases = find_pyplot_aliases(tree)
+    pyplot_name = 'plt' if 'plt' in aliases or not aliases else sorted(aliases)[0]
+    figsize_literal = f"({figsize[0]}, {figsize[1]})"
+
+    # 1. figsize
+    resized = 0
+    for node in ast.walk(tree):
+        if not _pyplot_call(node, aliases, FIGURE_FACTORIES):
+            continue
+        figsize_kw = next((kw for kw in node.keywords if kw.arg == 'figsize'), None)
+        if figsize_kw is not None:
+            start, end = index.node_span(figsize_kw.value)
+            edits.append((start, end, figsize_literal))
+        else:
+            call_end = index.node_span(node)[1]
+            arguments = list(node.args) + list(node.keywords)
+            if arguments:
+                insert_at = max(index.node_span(arg)[1] for arg in arguments)
+                edits.append((insert_at, insert_at, f", figsize={figsize_literal}"))
+            else:
+                edits.append((call_end - 1, call_end - 1, f"figsize={figsize_literal}"))
+        resized += 1
+    if resized:
+        notes.append(f"已将 {resized} 处图表创建调用的 figsize 设置为 {figsize_literal}")
+
+    # 2. rcParams 样式代码块
+    if STYLE_BLOCK_MARKER in code:
+        notes.append("代码中已包含学术风格设置，跳过注入")
+    else:
+        block = style_block.replace('plt.', f'{pyplot_name}.') if pyplot_name != 'plt' else style_block
+        block = block.strip('\n') + '\n'
+        import_stmt = _find_pyplot_import(tree)
+        if import_stmt is not None:
+            insert_at = _line_end_offset(index, import_stmt.end_lineno)
+        else:
+            insert_at = _module_insert_offset(tree, index)
+            block = "import matplotlib.pyplot as plt\n" + block
+        if insert_at == len(code) and code and not code.endswith('\n'):
+            block = '\n' + block
+        edits.append((insert_at, insert_at, block))
+        notes.append("已注入字体、字号和尺寸设置。")
+
+    # 3. savefig
+    if vector_format:
+        figure_vars = _figure_variables(tree, aliases)
+        show_sites = []
+        for stmts in _statement_lists(tree):
+            for i, stmt in enumerate(stmts):
+                if not (isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call)):
+                    continue
+                func = stmt.value.func
+                if not (isinstance(func, ast.Attribute) and func.attr == 'show'):
+                    continue
+                owner = _dotted_name(func.value)
+                if owner not in aliases and owner not in figure_vars:
+                    continue
+                if i > 0 and _is_savefig_stmt(stmts[i - 1]):
+                    continue
+                show_sites.append((stmt, owner))
+        show_sites.sort(key=lambda site: (site[0].lineno, site[0].col_offset))
+
+        for number, (stmt, owner) in enumerate(show_sites, 1):
+            suffix = f"_{number}" if len(show_sites) > 1 else ""
+            filename = f"{output_filename_base}{suffix}.{vector_format}"
+            savefig = f"{owner}.savefig('{filename}', bbox_inches='tight', dpi={dpi})"
+            line_start = index.line_starts[stmt.lineno - 1]
+            stmt_start = index.byte_offset(stmt.lineno, stmt.col_offset)
+            prefix = code[line_start:stmt_start]
+            if prefix.strip():
+                # show() 与其它语句写在同一行（用分号分隔）
+                edits.append((stmt_start, stmt_start, f"{savefig}; "))
+            else:
+                edits.append((line_start, line_start, f"{prefix}{savefig}\n"))
+        if show_sites:
+            notes.append(f"已在 {len(show_sites)} 处 show() 之前注入保存矢量图的代码")
+        elif not any(_is_savefig_stmt(stmt) for stmts in _statement_lists(tree) for stmt in stmts):
+            filename = f"{output_filename_base}.{vector_format}"
+            tail = '' if code.endswith('\n') or not code else '\n'
+            edits.append((len(code), len(code), f"{tail}{pyplot_name}.savefig('{filename}', bbox_inches='tight', dpi={dpi})\n"))
+            notes.append("未找到 show()，已在脚本末尾注入保存矢量图的代码")
+
+    return apply_edits(code, edits), notes
@@ -0,0 +1,109 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# --- 配置区 ---
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', '1') != '0'
+# /debug/trace/<job_id> 没有鉴权，任何知道任务 ID 的人都能读取，默认关闭
+DEBUG_TRACE_ENABLED = os.getenv('DEBUG_TRACE_ENABLED', '0') == '1'
+# 单个任务最多记录的事件数，避免包含大量单元格或图形块的任务占用过多内存
+TRACE_MAX_EVENTS = int(os.getenv('TRACE_MAX_EVENTS', '5000'))
+
+# 当前任务的追踪记录；流水线各阶段和每次 DeepSeek 请求在其中记录耗时区间
+_trace: contextvars.ContextVar[Optional['Trace']] = contextvars.ContextVar('trace', default=None)
+
+
+class Trace:
+    """
+    一个任务的耗时区间，导出为 Chrome trace-event 格式（可在 chrome://tracing 或 Perfetto 中打开）。
+    区间按线程分行显示；时间戳为微秒级的 Unix 时间，便于与任务的创建时间对齐。可在多个线程间共享。
+    """
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.dropped = 0
+        self._origin_wall = time.time()
+        self._origin_perf = time.perf_counter()
+        self._events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, int] = {}
+        self._metadata: List[Dict[str, Any]] = [
+            {'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': 0, 'args': {'name': f"job {trace_id}"}},
+        ]
+        self._lock = threading.Lock()
+
+    def wall_time(self, perf_time: float) -> float:
+        """把 time.perf_counter() 的读数换算为 Unix 时间。"""
+        return self._origin_wall + (perf_time - self._origin_perf)
+
+    def _thread_id(self) -> int:
+        ident = threading.get_ident()
+        tid = self._threads.get(ident)
+        if tid is None:
+            tid = self._threads[ident] = len(self._threads) + 1
+            self._metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid,
+                                   'args': {'name': threading.current_thread().name}})
+        return tid
+
+    def add_span(self, name: str, category: str, start: float, end: float,
+                 args: Optional[Dict[str, Any]] = None) -> None:
+        """记录一个区间；start 与 end 为 Unix 时间（秒），记录在当前线程的行上。"""
+        with self._lock:
+            if len(self._events) >= TRACE_MAX_EVENTS:
+                self.dropped += 1
+                return
+            self._events.append({
+                'name': name, 'cat': category, 'ph': 'X', 'pid': 1, 'tid': self._thread_id(),
+                'ts': round(start * 1e6, 1), 'dur': round(max(0.0, end - start) * 1e6, 1),
+                'args': dict(args or {}),
+            })
+
+    def to_chrome(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'traceEvents': self._metadata + sorted(self._events, key=lambda event: event['ts']),
+                'displayTimeUnit': 'ms',
+                'otherData': {'trace_id': self.trace_id, 'dropped_events': self.dropped},
+            }
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+@contextmanager
+def trace_session(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """在 with 块内（包括经 submit_with_context 提交的工作线程）把区间记录到 trace；trace 为 None 时不记录。"""
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name: str, category: str = 'pipeline', **args: Any) -> Iterator[Dict[str, Any]]:
+    """
+    把 with 块的耗时记录为当前追踪中的一个区间。产出的字典是区间的参数，可在块内补充
+    （例如 token 数）；块内抛出异常时记录异常类型。没有进行中的追踪时只产出字典，不做记录。
+    """
+    trace = _trace.get()
+    started = time.perf_counter()
+    try:
+        yield args
+    except BaseException as e:
+        args.setdefault('error', type(e).__name__)
+        raise
+    finally:
+        if trace is not None:
+            trace.add_span(name, category, trace.wall_time(started), trace.wall_time(time.perf_counter()), args)
+
+
+def record_span(name: str, category: str, seconds: float, **args: Any) -> None:
+    """记录一个刚刚结束、持续 seconds 秒的区间（例如限流排队时间）。"""
+    trace = _trace.get()
+    if trace is not None and seconds > 0:
+        end = trace.wall_time(time.perf_counter())
+        trace.add_span(name, category, end - seconds, end, args)
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+
+# --- 配置区 ---
+# live: 直接请求 API；record: 请求 API 并把成功的响应保存为录像；replay: 只从录像回放，不访问网络
+DEEPSEEK_TRANSPORT = os.getenv('DEEPSEEK_TRANSPORT', 'live').strip().lower()
+DEEPSEEK_CASSETTE_DIR = os.getenv('DEEPSEEK_CASSETTE_DIR', str(Path(__file__).parent.parent.parent / 'uploads' / 'cassettes'))
+DEEPSEEK_REPLAY_LATENCY = float(os.getenv('DEEPSEEK_REPLAY_LATENCY', '0'))
+DEEPSEEK_REPLAY_CHUNK_DELAY = float(os.getenv('DEEPSEEK_REPLAY_CHUNK_DELAY', '0'))
+
+TRANSPORT_MODES = ('live', 'record', 'replay')
+
+
+def cassette_key(payload: Dict[str, Any]) -> str:
+    """录像键：只由影响回复内容的字段（模型、消息、输出格式、是否流式）的哈希决定。"""
+    relevant = {
+        'model': payload.get('model'),
+        'messages': payload.get('messages'),
+        'response_format': payload.get('response_format'),
+        'stream': bool(payload.get('stream')),
+    }
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class RecordedResponse:
+    """
+    回放用的响应对象，提供 DeepSeekClient 用到的 requests.Response 接口子集
+    （status_code / headers / text / json() / iter_lines() / close() / with 语句）。
+    chunk_delay 用于模拟流式响应中相邻两行之间的间隔。
+    """
+
+    def __init__(self, status_code: int, body: bytes, headers: Optional[Dict[str, str]] = None,
+                 chunk_delay: float = 0.0):
+        self.status_code = status_code
+        self.content = body
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.chunk_delay = chunk_delay
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def iter_lines(self) -> Iterator[bytes]:
+        for line in self.content.splitlines():
+            if self.chunk_delay and line:
+                time.sleep(self.chunk_delay)
+            yield line
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'RecordedResponse':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class LiveTransport:
+    """通过共享的 requests.Session 直接请求 API。"""
+
+    mode = 'live'
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+
+    def post(self, url: str, payload: Dict[str, Any], timeout, stream: bool = False):
+        return self.session.post(url, json=payload, timeout=timeout, stream=stream)
+
+
+class CassetteStore:
+    """录像文件：<目录>/<键前两位>/<键>.json，保存状态码、响应头和响应体。"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, payload: Dict[str, Any], status_code: int, headers: Dict[str, str], body: bytes) -> None:
+        path = self._path(key)
+        record = {
+            'request': payload,
+            'status_code': status_code,
+            'headers': headers,
+            'body': body.decode('utf-8', errors='replace'),
+            'recorded_at': time.time(),
+        }
+        with self._lock:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, path)
+
+
+class RecordingTransport(LiveTransport):
+    """
+    请求真实 API，并把成功的响应按请求内容的哈希保存为录像。
+    流式响应会先完整读取再保存，因此录制期间客户端看不到逐段输出。
+    """
+
+    mode = 'record'
+
+    def __init__(self, session: requests.Session, cassettes: CassetteStore):
+        super().__init__(session)
+        self.cassettes = cassettes
+
+    def post(self, url: str, payload: Dict[str, Any], timeout, stream: bool = False):
+        response = super().post(url, payload, timeout, stream=stream)
+        if response.status_code >= 400:
+            return response
+        with response:
+            body = response.content
+        headers = {'Content-Type': response.headers.get('Content-Type', '')}
+        self.cassettes.save(cassette_key(payload), payload, response.status_code, headers, body)
+        return RecordedResponse(response.status_code, body, headers)
+
+
+class ReplayTransport:
+    """只从录像回放，不访问网络；latency 模拟请求的往返耗时，chunk_delay 模拟流式输出的间隔。"""
+
+    mode = 'replay'
+
+    def __init__(self, cassettes: CassetteStore, latency: float = DEEPSEEK_REPLAY_LATENCY,
+                 chunk_delay: float = DEEPSEEK_REPLAY_CHUNK_DELAY):
+        self.cassettes = cassettes
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+
+    def post(self, url: str, payload: Dict[str, Any], timeout, stream: bool = False):
+        if self.latency:
+            time.sleep(self.latency)
+        record = self.cassettes.load(cassette_key(payload))
+        if record is None:
+            body = json.dumps({'error': {'message': '回放模式下没有找到该请求的录像', 'type': 'cassette_miss'}},
+                              ensure_ascii=False).encode('utf-8')
+            return RecordedResponse(404, body, {'Content-Type': 'application/json'})
+        return RecordedResponse(record['status_code'], record['body'].encode('utf-8'), record.get('headers'),
+                                chunk_delay=self.chunk_delay if stream else 0.0)
+
+
+def create_transport(session: requests.Session, mode: str = DEEPSEEK_TRANSPORT,
+                     cassette_dir: str = DEEPSEEK_CASSETTE_DIR):
+    """按 mode 创建传输层；未知的 mode 按 live 处理。"""
+    if mode == 'record':
+        return RecordingTransport(session, CassetteStore(cassette_dir))
+    if mode == 'replay':
+        return ReplayTransport(CassetteStore(cassette_dir))
+    if mode != 'live':
+        print(f"未知的 DEEPSEEK_TRANSPORT={mode}，使用 live 模式")
+    return LiveTransport(session)
+
+
+def transport_requires_api_key(mode: str = DEEPSEEK_TRANSPORT) -> bool:
+    return mode != 'replay'
@@ -1,8 +1,14 @@
-from flask import Flask, logging, render_template, request, jsonify, send_file, Response
+from flask import Flask, logging, render_template, request, jsonify, send_file, session, Response
 import json
+import mimetypes
 import os
+import shutil
 import tempfile
 import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
@@ -23,7 +29,18 @@ def safe_cast(value, cast_type, default=None):
 
 # Add the core module to path
 sys.path.insert(0, str(Path(__file__).parent.parent / 'core'))
-from core.enhanced_agent import process_python_file, process_python_file_streaming, PAPER_FORMATS
+from core.enhanced_agent import process_python_file, process_python_file_streaming, processing_key, PAPER_FORMATS, PARTIAL_PREFIX
+from core.batch import (BATCH_MAX_FILES, BATCH_MAX_WORKERS, BatchError, build_output_zip,
+                        extract_python_files_from_zip, process_batch_streaming, unique_filename)
+from core.jobs import FINISHED_STATES, JOBS_DB_PATH, PARTIAL_KEY, SUCCEEDED, JobManager
+from core.storage import OutputStore, StorageJanitor
+from core.rate_limit import get_rate_governor
+from core.render import RENDER_PREVIEW_ENABLED, RenderError, RenderPool, render_cache_key
+from core.notebook import NotebookError, notebook_to_script
+from core.revisions import REVISION_META_KEY, Revision, load_revision, revision_session
+from core.tracing import DEBUG_TRACE_ENABLED
+from core.metrics import (HTTP_IN_FLIGHT, JOB_QUEUE_DEPTH, JOBS_IN_FLIGHT, REGISTRY, RENDER_SECONDS,
+                          UPLOAD_BYTES)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'your-secret-key-here')
@@ -31,15 +48,73 @@ app.config['UPLOAD_FOLDER'] = str(Path(__file__).parent.parent.parent / 'uploads
 app.config['OUTPUT_FOLDER'] = str(Path(__file__).parent.parent.parent / 'uploads' / 'outputs')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
-# Allowed file extensions
-ALLOWED_EXTENSIONS = {'py'}
+# Outputs are kept in a content-addressed store with one manifest per job; the janitor
+# evicts old uploads and outputs by age and total size
+output_store = OutputStore(app.config['OUTPUT_FOLDER'])
+storage_janitor = StorageJanitor(output_store, app.config['UPLOAD_FOLDER'])
+# Pre-warmed matplotlib processes that render before/after previews; started with the first upload
+render_pool = RenderPool()
+
+# Maximum lifetime of one /jobs/<id>/events response before the browser reconnects
+JOB_EVENTS_STREAM_SECONDS = float(os.getenv('JOB_EVENTS_STREAM_SECONDS', '60'))
+
+# Allowed file extensions (plotting scripts and Jupyter notebooks)
+ALLOWED_EXTENSIONS = {'py', 'ipynb'}
+# Number of filenames whose last processed version is remembered in the session cookie
+SESSION_VERSIONS_MAX = int(os.getenv('SESSION_VERSIONS_MAX', '20'))
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def parse_processing_options(form):
+    """Build the keyword arguments for the processing pipeline from the submitted form."""
+    options = {
+        'beautify': form.get('beautify') == 'true',
+        'academic_options': {
+            'enabled': form.get('academic_mode') == 'true',
+            'paper_format': form.get('paper_format', 'nature'),
+            'layout': form.get('layout', 'single'),
+            'vector_format': form.get('vector_format'),
+            'dpi': safe_cast(form.get('dpi'), int, 300),
+            'fast_mode': form.get('fast_mode') == 'true',
+            'custom_mode': form.get('custom_mode') == 'true',
+            'custom_params': {}
+        }
+    }
+    if options['academic_options']['custom_mode']:
+        custom_params = {
+            'font_size': safe_cast(form.get('font_size'), int, None),
+            'title_size': safe_cast(form.get('title_size'), int, None),
+            'fig_width': safe_cast(form.get('fig_width'), float, None),
+            'fig_height': safe_cast(form.get('fig_height'), float, None),
+            'dpi': safe_cast(form.get('custom_dpi'), int, None)
+        }
+        options['academic_options']['custom_params'] = {k: v for k, v in custom_params.items() if v is not None}
+    return options
+
+def record_upload_size(file, endpoint):
+    """Observe the size of an uploaded file without reading it into memory."""
+    stream = file.stream
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    UPLOAD_BYTES.observe(stream.tell(), endpoint=endpoint)
+    stream.seek(position)
+
+@app.before_request
+def track_request_start():
+    # SSE responses keep streaming after the view returns; the gauge covers the view itself
+    HTTP_IN_FLIGHT.inc(endpoint=request.endpoint or 'unknown')
+
+@app.teardown_request
+def track_request_end(exc):
+    HTTP_IN_FLIGHT.dec(endpoint=request.endpoint or 'unknown')
+
+def sse_event(data):
+    return f'data: {json.dumps(data, ensure_ascii=False)}\n\n'
+
 @app.route('/')
 def index():
-    return render_template('index.html', paper_formats=PAPER_FORMATS)
+    return render_template('index.html', paper_formats=PAPER_FORMATS, preview_enabled=RENDER_PREVIEW_ENABLED)
 
 # ... other routes and functions ...
 
@@ -54,74 +129,396 @@ def process_file():
         return jsonify({"error": "No file selected"}), 400
     
     if not allowed_file(file.filename):
-        return jsonify({"error": "Only Python files (.py) are allowed"}), 400
+        return jsonify({"error": "Only Python files (.py) and Jupyter notebooks (.ipynb) are allowed"}), 400
 
     # 1. Immediately save the file to a temporary path instead of passing the file stream object
     filename = secure_filename(file.filename)
-    # Ensure the upload directory exists
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    # Each upload gets its own directory so concurrent uploads with the same name don't collide
+    upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], uuid.uuid4().hex)
+    os.makedirs(upload_folder, exist_ok=True)
+    filepath = os.path.join(upload_folder, filename)
+    record_upload_size(file, 'process')
     file.save(filepath)
 
     # Extract all processing options from the form
-    options = {
-        'beautify': request.form.get('beautify') == 'true',
-        'academic_options': {
-            'enabled': request.form.get('academic_mode') == 'true',
-            'paper_format': request.form.get('paper_format', 'nature'),
-            'layout': request.form.get('layout', 'single'),
-            'vector_format': request.form.get('vector_format'),
-            'dpi': safe_cast(request.form.get('dpi'), int, 300),
-            'custom_mode': request.form.get('custom_mode') == 'true',
-            'custom_params': {}
-        }
-    }
-    if options['academic_options']['custom_mode']:
-        custom_params = {
-            'font_size': safe_cast(request.form.get('font_size'), int, None),
-            'title_size': safe_cast(request.form.get('title_size'), int, None),
-            'fig_width': safe_cast(request.form.get('fig_width'), float, None),
-            'fig_height': safe_cast(request.form.get('fig_height'), float, None),
-            'dpi': safe_cast(request.form.get('custom_dpi'), int, None)
-        }
-        options['academic_options']['custom_params'] = {k: v for k, v in custom_params.items() if v is not None}
+    options = parse_processing_options(request.form)
+    # A revised upload reuses the results of the version it was edited from: either the id
+    # the client sends back, or the last version of this filename processed in this session.
+    # Only versions produced in this session are accepted, so a guessed id cannot read another user's record
+    base_version = request.form.get('base_version') or session.get('versions', {}).get(filename)
+    if base_version not in session.get('version_ids', []):
+        base_version = None
 
-    # ------------------ Definition of output filepath and the generator ------------------
-    # Note that generate now takes filepath (string path) instead of file_storage (file object)
-    def generate(saved_filepath, opts):
-        try:
-            # 2. The generator now directly uses the saved file path for processing
-            output_folder = app.config['OUTPUT_FOLDER']
-            for status in process_python_file_streaming(saved_filepath, output_folder, **opts):
+    # Hand the pipeline to the background job pool so this request returns immediately.
+    # Identical uploads (same content, filename and options) attach to the job already in flight
+    storage_janitor.start()
+    if RENDER_PREVIEW_ENABLED:
+        render_pool.start()
+    job_id, coalesced = job_manager.submit_coalesced(
+        {'filepath': filepath, 'filename': filename, 'options': options, 'base_version': base_version},
+        upload_coalesce_key(filepath, filename, options)
+    )
+    if coalesced:
+        shutil.rmtree(upload_folder, ignore_errors=True)
+    remember_version(filename, job_id)
+    return jsonify({
+        'job_id': job_id,
+        'coalesced': coalesced,
+        'status_url': f'/jobs/{job_id}',
+        'events_url': f'/jobs/{job_id}/events'
+    }), 202
+
+def remember_version(filename, version_id):
+    """
+    Remember the latest version of each filename in the session, and every version id this session
+    produced (usable as a base_version), keeping only the most recent few of each.
+    """
+    versions = session.get('versions', {})
+    versions.pop(filename, None)
+    versions[filename] = version_id
+    session['versions'] = dict(list(versions.items())[-SESSION_VERSIONS_MAX:])
+    version_ids = [known for known in session.get('version_ids', []) if known != version_id]
+    session['version_ids'] = (version_ids + [version_id])[-SESSION_VERSIONS_MAX:]
+
+def upload_coalesce_key(filepath, filename, options):
+    """Key identifying uploads that would produce the same output; None when the file is not readable text."""
+    try:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            code = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return processing_key(code, filename, options['beautify'], options['academic_options'])
+
+def status_to_event(status, manifest_id):
+    """Convert a pipeline status line into the SSE event payload sent to the browser."""
+    if status.startswith("SUCCESS:"):
+        output_filename = status.split(":", 1)[1].strip()
+        return {"success": True, "message": "处理完成", "download_url": f"/download/{manifest_id}/{output_filename}",
+                "version_id": manifest_id}
+    if status.startswith(PARTIAL_PREFIX):
+        return {PARTIAL_KEY: status[len(PARTIAL_PREFIX):]}
+    return {"status": status}
+
+def run_processing_job(job_id, payload):
+    """Job runner: executes the streaming pipeline for one uploaded file."""
+    # The output is written next to the upload, then moved into the store under this job's manifest
+    work_folder = os.path.dirname(payload['filepath'])
+    base_version = payload.get('base_version')
+    revision = Revision(load_revision(output_store, base_version), base_version)
+    JOBS_IN_FLIGHT.inc()
+    try:
+        with revision_session(revision):
+            if revision.base_id:
+                yield {"status": "找到上一版本，只重新翻译和重构改动的部分"}
+            for status in process_python_file_streaming(payload['filepath'], work_folder, **payload['options']):
                 if status.startswith("SUCCESS:"):
                     output_filename = status.split(":", 1)[1].strip()
-                    success_data = {"success": True, "message": "处理完成", "download_url": f"/download/{output_filename}"}
-                    yield f'data: {json.dumps(success_data, ensure_ascii=False)}\n\n'
+                    # The original upload is kept next to the output so the preview can render both
+                    output_store.add_file(job_id, payload['filename'], payload['filepath'])
+                    output_store.add_file(job_id, output_filename, os.path.join(work_folder, output_filename))
+                    # Record what this version translated and refactored so the next revision can reuse it
+                    output_store.set_meta(job_id, REVISION_META_KEY, revision.to_record())
+                yield status_to_event(status, job_id)
+    finally:
+        JOBS_IN_FLIGHT.dec()
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+job_manager = JobManager(JOBS_DB_PATH, run_processing_job)
+
+# Upload folders of batches whose response is still streaming
+active_batch_folders = set()
+
+def upload_folders_in_use():
+    """Upload folders the janitor must keep: those of queued or running jobs and of running batches."""
+    folders = {os.path.dirname(payload['filepath']) for payload in job_manager.active_payloads() if 'filepath' in payload}
+    return folders | set(active_batch_folders)
+
+storage_janitor.in_use = upload_folders_in_use
+storage_janitor.jobs = job_manager
+
+@app.route('/jobs/stats')
+def job_stats():
+    stats = job_manager.stats()
+    stats['deepseek_rate_limit'] = get_rate_governor().stats()
+    stats['render'] = render_pool.stats()
+    return jsonify(stats)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    job.pop('payload', None)
+    if job['result']:
+        job['result'] = json.loads(job['result'])
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """SSE stream of a job's events; supports resuming via the Last-Event-ID header."""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    last_event_id = safe_cast(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'), int, 0)
+    if job['status'] in FINISHED_STATES and not job_manager.events_after(job_id, last_event_id):
+        # Nothing left to send; 204 tells EventSource to stop reconnecting
+        return Response(status=204)
+
+    def generate(after_seq):
+        yield 'retry: 1000\n\n'
+        # Streams are bounded in time so a watching browser never pins a server thread for long;
+        # EventSource reconnects and resumes from the last event id it received
+        deadline = time.monotonic() + JOB_EVENTS_STREAM_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            events, finished = job_manager.wait_for_events(job_id, after_seq, timeout=min(remaining, 15))
+            for seq, data in events:
+                after_seq = seq
+                yield f'id: {seq}\n{sse_event(data)}'
+            if finished and not events:
+                return
+            if not events:
+                yield ': keep-alive\n\n'
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(generate(last_event_id), mimetype='text/event-stream', headers=headers)
+
+def render_preview(code, filename, export_formats):
+    """Render one script in the worker pool; results are cached in the output store by script hash."""
+    manifest_id = f"render_{render_cache_key(code, export_formats)[:40]}"
+
+    def with_urls(result, cached):
+        return dict(result, cached=cached,
+                    previews=[f'/download/{manifest_id}/{name}' for name in result['previews']],
+                    artifacts=[f'/download/{manifest_id}/{name}' for name in result['artifacts']])
+
+    manifest = output_store.load_manifest(manifest_id)
+    if manifest and 'render' in manifest.get('meta', {}):
+        RENDER_SECONDS.observe(0.0, outcome='cached')
+        return with_urls(manifest['meta']['render'], cached=True)
+
+    work_root = tempfile.mkdtemp(prefix='render_', dir=app.config['UPLOAD_FOLDER'])
+    try:
+        script_dir = os.path.join(work_root, 'script')
+        preview_dir = os.path.join(work_root, 'previews')
+        os.makedirs(script_dir)
+        os.makedirs(preview_dir)
+        script_path = os.path.join(script_dir, filename)
+        with open(script_path, 'w', encoding='utf-8') as f:
+            f.write(code)
+        result = render_pool.render(script_path, preview_dir, export_formats)
+        RENDER_SECONDS.observe(result['seconds'], outcome='ok' if result['ok'] else 'script_error')
+        for name in result['previews'] + result['artifacts']:
+            source = os.path.join(preview_dir, name)
+            output_store.add_file(manifest_id, name, source if os.path.exists(source) else os.path.join(script_dir, name))
+        output_store.set_meta(manifest_id, 'render', result)
+        return with_urls(result, cached=False)
+    finally:
+        shutil.rmtree(work_root, ignore_errors=True)
+
+@app.route('/jobs/<job_id>/preview')
+def job_preview(job_id):
+    """Render the original and the processed script side by side and return preview/artifact URLs."""
+    # Rendering executes uploaded code, so it stays off unless the deployment isolates the server
+    if not RENDER_PREVIEW_ENABLED:
+        return jsonify({'error': 'Preview rendering is disabled on this server'}), 404
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != SUCCEEDED:
+        return jsonify({'error': 'Job has not finished successfully'}), 409
+    if not render_pool.available():
+        return jsonify({'error': render_pool.broken or 'Preview rendering requires matplotlib on the server'}), 503
+
+    output_filename = json.loads(job['result'])['download_url'].rsplit('/', 1)[1]
+    vector_format = job['payload']['options']['academic_options'].get('vector_format')
+    export_formats = [vector_format] if vector_format in ('pdf', 'svg', 'eps') else []
+
+    def render_side(name):
+        stored = output_store.resolve(job_id, name)
+        if stored is None:
+            return {'ok': False, 'error': '文件已过期或不存在', 'previews': [], 'artifacts': []}
+        try:
+            if name.lower().endswith('.ipynb'):
+                # Notebooks are previewed as one script made of their code cells
+                code = notebook_to_script(stored['path'])
+                name = os.path.splitext(name)[0] + '.py'
+            else:
+                with open(stored['path'], 'r', encoding='utf-8') as f:
+                    code = f.read()
+            return render_preview(code, name, export_formats)
+        except NotebookError as e:
+            return {'ok': False, 'error': str(e), 'previews': [], 'artifacts': []}
+        except RenderError as e:
+            RENDER_SECONDS.observe(0.0, outcome='failed')
+            return {'ok': False, 'error': str(e), 'previews': [], 'artifacts': []}
+
+    # Both scripts render concurrently in separate workers
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        original = executor.submit(render_side, job['payload']['filename'])
+        processed = executor.submit(render_side, output_filename)
+        return jsonify({'original': original.result(), 'processed': processed.result()})
+
+@app.route('/process_batch', methods=['POST'])
+def process_batch():
+    """Process a zip archive or several .py files concurrently and return one zip of all outputs."""
+    uploads = [f for f in request.files.getlist('files') + request.files.getlist('file') if f.filename]
+    if not uploads:
+        return jsonify({"error": "No file uploaded"}), 400
+
+    batch_id = f"batch_{uuid.uuid4().hex[:12]}"
+    upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], batch_id)
+    output_folder = os.path.join(upload_folder, 'outputs')
+    os.makedirs(upload_folder, exist_ok=True)
+    os.makedirs(output_folder, exist_ok=True)
+
+    filepaths = []
+    # Files with the same name (from different zips or zip subdirectories) get a numeric suffix
+    used_names = set()
+    renamed = []
+    try:
+        for upload in uploads:
+            filename = secure_filename(upload.filename)
+            record_upload_size(upload, 'process_batch')
+            if filename.lower().endswith('.zip'):
+                zip_path = os.path.join(upload_folder, f"{uuid.uuid4().hex}.zip")
+                upload.save(zip_path)
+                filepaths.extend(extract_python_files_from_zip(zip_path, upload_folder, secure_filename,
+                                                               used_names, renamed))
+                os.remove(zip_path)
+            elif allowed_file(filename):
+                unique = unique_filename(filename, used_names)
+                if unique != filename:
+                    renamed.append((upload.filename, unique))
+                filepath = os.path.join(upload_folder, unique)
+                upload.save(filepath)
+                filepaths.append(filepath)
+            else:
+                return jsonify({"error": f"Unsupported file: {upload.filename}"}), 400
+    except BatchError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not filepaths:
+        return jsonify({"error": "No Python files found in the upload"}), 400
+    if len(filepaths) > BATCH_MAX_FILES:
+        return jsonify({"error": f"Too many files (max {BATCH_MAX_FILES})"}), 400
+
+    storage_janitor.start()
+    options = parse_processing_options(request.form)
+    max_workers = min(safe_cast(request.form.get('workers'), int, BATCH_MAX_WORKERS), BATCH_MAX_WORKERS)
+
+    def generate():
+        active_batch_folders.add(upload_folder)
+        workers_done = threading.Event()
+        batch_stream = None
+        try:
+            yield sse_event({"status": f"批量处理开始，共 {len(filepaths)} 个文件", "total": len(filepaths)})
+            if renamed:
+                yield sse_event({
+                    "status": "以下文件与同批次的文件重名，已重命名：" +
+                              "，".join(f"{original} -> {name}" for original, name in renamed),
+                    "renamed": dict(renamed),
+                })
+            batch_stream = process_batch_streaming(filepaths, output_folder, max_workers=max_workers,
+                                                   finished=workers_done, **options)
+            while True:
+                try:
+                    name, status = next(batch_stream)
+                except StopIteration as stop:
+                    results = stop.value
+                    break
+                if status.startswith("SUCCESS:"):
+                    yield sse_event({"file": name, "done": True, "message": "处理完成"})
                 else:
-                    status_data = {"status": status}
-                    yield f'data: {json.dumps(status_data, ensure_ascii=False)}\n\n'
-            
+                    yield sse_event({"file": name, "status": status})
+
+            succeeded = [output for output in results.values() if output]
+            failed = [name for name, output in results.items() if not output]
+            if not succeeded:
+                yield sse_event({"error": "所有文件均处理失败", "failed": failed})
+                return
+
+            zip_filename = f"{batch_id}_zh_revision.zip"
+            zip_path = os.path.join(upload_folder, zip_filename)
+            build_output_zip(output_folder, succeeded, zip_path)
+            output_store.add_file(batch_id, zip_filename, zip_path)
+            success_data = {
+                "success": True,
+                "message": f"批量处理完成：成功 {len(succeeded)} 个，失败 {len(failed)} 个",
+                "download_url": f"/download/{batch_id}/{zip_filename}",
+                "failed": failed
+            }
+            yield sse_event(success_data)
         except Exception as e:
-            # 3. Ensure that the standard logging module is used here
-            logging.error(f"An error occurred during streaming: {e}", exc_info=True)
-            error_data = {"error": f"An unexpected error occurred in the stream: {str(e)}"}
-            yield f'data: {json.dumps(error_data)}\n\n'
+            app.logger.exception(f"An error occurred during batch streaming: {e}")
+            yield sse_event({"error": f"An unexpected error occurred in the stream: {str(e)}"})
+        finally:
+            # Closing the stream cancels files that have not started; files already running keep
+            # reading from the upload folder, so it is removed only once they have finished
+            if batch_stream is not None:
+                batch_stream.close()
+            if batch_stream is None or workers_done.is_set():
+                release_batch_folder(upload_folder)
+            else:
+                threading.Thread(target=release_batch_folder, args=(upload_folder, workers_done),
+                                 name='batch-cleanup', daemon=True).start()
+
+    return Response(generate(), mimetype='text/event-stream')
 
-    # ------------------ Start the generator and return streaming response ------------------
-    # Pass the saved file path and options as arguments to generate
-    return Response(generate(filepath, options), mimetype='text/event-stream')
+def release_batch_folder(folder, workers_done=None):
+    if workers_done is not None:
+        workers_done.wait()
+    shutil.rmtree(folder, ignore_errors=True)
+    active_batch_folders.discard(folder)
 
-@app.route('/download/<filename>')
-def download_file(filename):
+@app.route('/download/<manifest_id>/<filename>')
+def download_file(manifest_id, filename):
     try:
-        filepath = os.path.join(app.config['OUTPUT_FOLDER'], secure_filename(filename))
-        if not os.path.exists(filepath):
+        stored = output_store.resolve(manifest_id, filename)
+        if stored is None:
             return jsonify({'error': 'File not found'}), 404
-        
-        return send_file(filepath, as_attachment=True, download_name=filename)
+
+        # Serve the precompressed copy when the client accepts gzip; each encoding gets its own strong ETag
+        use_gzip = stored['gzip_path'] is not None and 'gzip' in request.accept_encodings
+        path = stored['gzip_path'] if use_gzip else stored['path']
+        etag = f"{stored['sha256']}-gzip" if use_gzip else stored['sha256']
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        # conditional=True answers If-None-Match with 304 Not Modified
+        response = send_file(path, as_attachment=True, download_name=filename, mimetype=mimetype,
+                             etag=etag, conditional=True, max_age=0)
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     except Exception as e:
         return jsonify({'error': f'Download error: {str(e)}'}), 500
 
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of all pipeline, DeepSeek and web metrics."""
+    # Queue depth is sampled at scrape time; disk usage gauges are updated by the janitor after each pass
+    JOB_QUEUE_DEPTH.set(job_manager.stats()['queue_depth'])
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/storage/stats')
+def storage_stats():
+    return jsonify(storage_janitor.stats())
+
+@app.route('/debug/trace/<job_id>')
+def debug_trace(job_id):
+    """Chrome trace-event JSON of a job's queueing, pipeline stages and DeepSeek attempts (load in Perfetto)."""
+    # Anyone who knows a job id could read its trace, so the endpoint is opt-in
+    if not DEBUG_TRACE_ENABLED:
+        return jsonify({'error': 'Trace export is disabled on this server'}), 404
+    trace = job_manager.trace(job_id)
+    if trace is None:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify(trace)
+
 @app.route('/api/paper_formats')
 def get_paper_formats():
     return jsonify(PAPER_FORMATS)
@@ -4,6 +4,7 @@
 class AcademicPlotApp {
     constructor() {
         this.currentFile = null;
+        this.currentJobId = null;
         this.isProcessing = false;
         this.sidebarExpanded = false;
         this.currentLanguage = 'zh'; // 'zh' for Chinese, 'en' for English
@@ -42,10 +43,10 @@ class AcademicPlotApp {
             const files = e.dataTransfer.files;
             if (files.length > 0) {
                 const file = files[0];
-                if (file.name.endsWith('.py')) {
+                if (/\.(py|ipynb)$/i.test(file.name)) {
                     this.handleFileSelect(file);
                 } else {
-                    this.showError('请选择Python文件 (.py)');
+                    this.showError('请选择Python文件 (.py) 或 Jupyter 笔记本 (.ipynb)');
                 }
             }
         });
@@ -65,6 +66,11 @@ class AcademicPlotApp {
             this.processFile();
         });
 
+        // Render before/after previews of the finished job
+        document.getElementById('previewBtn').addEventListener('click', () => {
+            this.loadPreview();
+        });
+
         // Toggle events
         document.getElementById('academicToggle').addEventListener('change', (e) => {
             this.toggleAcademicOptions(e.target.checked);
@@ -207,6 +213,7 @@ class AcademicPlotApp {
         
         // Hide results
         this.hideResults();
+        this.clearLiveCode();
     }
 
     resetUI() {
@@ -243,10 +250,16 @@ class AcademicPlotApp {
         this.isProcessing = true;
         this.updateProcessButton();
         this.showLoading();
+        this.clearLiveCode();
         this.updateStatus('正在处理文件...', 'warning');
 
         const formData = new FormData();
         formData.append('file', this.currentFile);
+        // A revised upload of the same file only re-processes what changed since the last version
+        const baseVersion = this.loadVersion(this.currentFile.name);
+        if (baseVersion) {
+            formData.append('base_version', baseVersion);
+        }
         
         // Get all settings
         formData.append('beautify', document.getElementById('beautifyToggle').checked);
@@ -257,6 +270,7 @@ class AcademicPlotApp {
             formData.append('layout', document.getElementById('layout').value);
             formData.append('vector_format', document.getElementById('vectorFormat').value);
             formData.append('dpi', document.getElementById('dpi').value);
+            formData.append('fast_mode', document.getElementById('fastMode').checked);
             formData.append('custom_mode', document.getElementById('customToggle').checked);
             
             if (document.getElementById('customToggle').checked) {
@@ -269,50 +283,26 @@ class AcademicPlotApp {
         }
 
         try {
-            // Use fetch with ReadableStream for Server-Sent Events
+            // Submit the file as a background job, then follow its event stream
             const response = await fetch('/process', {
                 method: 'POST',
                 body: formData
             });
 
+            const job = await response.json().catch(() => ({}));
             if (!response.ok) {
-                throw new Error(`服务器错误: ${response.status} ${response.statusText}`);
+                throw new Error(job.error || `服务器错误: ${response.status} ${response.statusText}`);
             }
 
-            const reader = response.body.getReader();
-            const decoder = new TextDecoder();
-
-            while (true) {
-                const { value, done } = await reader.read();
-                if (done) break;
-
-                const chunk = decoder.decode(value);
-                const lines = chunk.split('\n');
-
-                for (const line of lines) {
-                    if (line.startsWith('data: ')) {
-                        const data = JSON.parse(line.substring(6)); // Remove 'data: ' prefix
-                        
-                        if (data.error) {
-                            throw new Error(data.error);
-                        }
-                        
-                        if (data.status) {
-                            this.updateStatus(data.status, 'warning');
-                        }
-                        
-                        if (data.success) {
-                            this.showSuccess(data.download_url);
-                            this.updateStatus('处理完成！', 'success');
-                            // Don't reset UI completely here - keep results visible
-                            this.isProcessing = false;
-                            this.hideLoading();
-                            this.updateProcessButton();
-                            return;
-                        }
-                    }
-                }
-            }
+            this.currentJobId = job.job_id;
+            const result = await this.followJobEvents(job.events_url);
+            this.saveVersion(this.currentFile.name, result.version_id);
+            this.showSuccess(result.download_url);
+            this.updateStatus('处理完成！', 'success');
+            // Don't reset UI completely here - keep results visible
+            this.isProcessing = false;
+            this.hideLoading();
+            this.updateProcessButton();
 
         } catch (error) {
             console.error('Processing error:', error);
@@ -324,6 +314,84 @@ class AcademicPlotApp {
         }
     }
 
+    loadVersion(filename) {
+        try {
+            return JSON.parse(localStorage.getItem('academicplot.versions') || '{}')[filename] || null;
+        } catch (e) {
+            return null;
+        }
+    }
+
+    saveVersion(filename, versionId) {
+        if (!versionId) return;
+        try {
+            const versions = JSON.parse(localStorage.getItem('academicplot.versions') || '{}');
+            delete versions[filename];
+            versions[filename] = versionId;
+            // Keep only the most recently processed files
+            const recent = Object.entries(versions).slice(-20);
+            localStorage.setItem('academicplot.versions', JSON.stringify(Object.fromEntries(recent)));
+        } catch (e) {
+            // Storage may be unavailable (private mode); the server session still remembers the version
+        }
+    }
+
+    followJobEvents(eventsUrl) {
+        // EventSource reconnects on its own and resumes via Last-Event-ID,
+        // so a dropped connection does not lose progress or restart the job
+        return new Promise((resolve, reject) => {
+            const source = new EventSource(eventsUrl);
+
+            source.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+
+                if (data.error) {
+                    source.close();
+                    reject(new Error(data.error));
+                    return;
+                }
+
+                if (data.status) {
+                    this.updateStatus(data.status, 'warning');
+                }
+
+                if (data.trace_id) {
+                    // Timing breakdown for support requests: open in a trace viewer
+                    console.info(`Job trace: /debug/trace/${data.trace_id}`);
+                }
+
+                if (data.partial_code) {
+                    this.appendLiveCode(data.partial_code);
+                }
+
+                if (data.success) {
+                    source.close();
+                    resolve(data);
+                }
+            };
+
+            source.onerror = () => {
+                if (source.readyState === EventSource.CLOSED) {
+                    reject(new Error('与服务器的连接已断开'));
+                }
+            };
+        });
+    }
+
+    appendLiveCode(text) {
+        // Show the refactored code as the model writes it
+        const liveCode = document.getElementById('liveCode');
+        liveCode.style.display = 'block';
+        liveCode.textContent += text;
+        liveCode.scrollTop = liveCode.scrollHeight;
+    }
+
+    clearLiveCode() {
+        const liveCode = document.getElementById('liveCode');
+        liveCode.textContent = '';
+        liveCode.style.display = 'none';
+    }
+
     toggleAcademicOptions(enabled) {
         const academicOptions = document.getElementById('academicOptions');
         academicOptions.style.display = enabled ? 'block' : 'none';
@@ -376,6 +444,10 @@ class AcademicPlotApp {
     showSuccess(downloadUrl) {
         const downloadLink = document.getElementById('downloadLink');
         downloadLink.href = downloadUrl;
+
+        const previewPanel = document.getElementById('previewPanel');
+        previewPanel.innerHTML = '';
+        previewPanel.style.display = 'none';
         
         document.querySelector('.results-success').style.display = 'block';
         document.querySelector('.results-placeholder').style.display = 'none';
@@ -387,6 +459,72 @@ class AcademicPlotApp {
         });
     }
 
+    async loadPreview() {
+        if (!this.currentJobId) return;
+
+        const previewBtn = document.getElementById('previewBtn');
+        previewBtn.disabled = true;
+        this.updateStatus('正在渲染原始脚本与处理后脚本...', 'warning');
+
+        try {
+            const response = await fetch(`/jobs/${this.currentJobId}/preview`);
+            const data = await response.json().catch(() => ({}));
+            if (!response.ok) {
+                throw new Error(data.error || `服务器错误: ${response.status} ${response.statusText}`);
+            }
+            this.renderPreview(data);
+            this.updateStatus('预览渲染完成', 'success');
+        } catch (error) {
+            console.error('Preview error:', error);
+            this.showError('预览失败: ' + error.message);
+            this.updateStatus('预览失败', 'error');
+        } finally {
+            previewBtn.disabled = false;
+        }
+    }
+
+    renderPreview(data) {
+        const panel = document.getElementById('previewPanel');
+        panel.innerHTML = '';
+
+        [['original', '原始脚本'], ['processed', '处理后脚本']].forEach(([key, title]) => {
+            const side = data[key];
+            const column = document.createElement('div');
+            column.className = 'preview-column';
+
+            const heading = document.createElement('h4');
+            heading.textContent = title;
+            column.appendChild(heading);
+
+            // Script errors are shown as text so users see why a figure is missing
+            if (side.error) {
+                const error = document.createElement('pre');
+                error.className = 'preview-error';
+                error.textContent = side.error;
+                column.appendChild(error);
+            }
+
+            side.previews.forEach(url => {
+                const image = document.createElement('img');
+                image.src = url;
+                image.alt = title;
+                column.appendChild(image);
+            });
+
+            side.artifacts.forEach(url => {
+                const link = document.createElement('a');
+                link.href = url;
+                link.className = 'preview-artifact';
+                link.textContent = decodeURIComponent(url.split('/').pop());
+                column.appendChild(link);
+            });
+
+            panel.appendChild(column);
+        });
+
+        panel.style.display = 'grid';
+    }
+
     hideResults() {
         document.querySelector('.results-success').style.display = 'none';
         document.querySelector('.results-placeholder').style.display = 'block';
@@ -517,8 +655,8 @@ class AcademicPlotApp {
                 // Upload card
                 'uploadTitle': '上传Python图表文件',
                 'uploadDragDrop': '拖放文件到此处',
-                'uploadClick': '或点击选择Python文件 (.py)',
-                'uploadFileTypes': '支持 .py 格式文件',
+                'uploadClick': '或点击选择Python文件 (.py) 或 Jupyter 笔记本 (.ipynb)',
+                'uploadFileTypes': '支持 .py 和 .ipynb 格式文件',
                 
                 // Action card
                 'actionTitle': '开始处理',
@@ -532,6 +670,7 @@ class AcademicPlotApp {
                 'resultsSuccess': '处理成功！',
                 'resultsDownload': '文件已处理完成，可以下载结果',
                 'downloadButton': '下载处理结果',
+                'previewButton': '预览渲染效果',
                 
                 // Sidebar
                 'sidebarTitle': '设置',
@@ -552,6 +691,7 @@ class AcademicPlotApp {
                 'layout': '图表布局',
                 'vectorFormat': '导出格式',
                 'dpi': '分辨率 (DPI)',
+                'fastMode': '快速模式（本地规则，无需AI）',
                 'noSave': '不保存',
                 'singleColumn': '单栏',
                 'doubleColumn': '双栏',
@@ -572,7 +712,7 @@ class AcademicPlotApp {
                 // User Guide Modal
                 'modalTitle': '使用指南',
                 'step1Title': '步骤 1: 上传文件',
-                'step1Desc': '将您的Python绘图脚本文件 (.py) 拖放到上传区域，或点击选择文件。',
+                'step1Desc': '将您的Python绘图脚本文件 (.py) 或 Jupyter 笔记本 (.ipynb) 拖放到上传区域，或点击选择文件。',
                 'step2Title': '步骤 2: 配置设置',
                 'step2Desc': '打开左侧的设置面板（基本设置、学术风格、自定义）来定制美化选项。',
                 'step3Title': '步骤 3: 开始处理',
@@ -589,8 +729,8 @@ class AcademicPlotApp {
                 // Upload card
                 'uploadTitle': 'Upload Python Chart File',
                 'uploadDragDrop': 'Drag and drop file here',
-                'uploadClick': 'or click to select Python file (.py)',
-                'uploadFileTypes': 'Supports .py format files',
+                'uploadClick': 'or click to select a Python file (.py) or Jupyter notebook (.ipynb)',
+                'uploadFileTypes': 'Supports .py and .ipynb files',
                 
                 // Action card
                 'actionTitle': 'Start Processing',
@@ -604,6 +744,7 @@ class AcademicPlotApp {
                 'resultsSuccess': 'Processing Successful!',
                 'resultsDownload': 'File processed successfully, ready for download',
                 'downloadButton': 'Download Result',
+                'previewButton': 'Preview Rendering',
                 
                 // Sidebar
                 'sidebarTitle': 'Settings',
@@ -624,6 +765,7 @@ class AcademicPlotApp {
                 'layout': 'Chart Layout',
                 'vectorFormat': 'Export Format',
                 'dpi': 'Resolution (DPI)',
+                'fastMode': 'Fast Mode (local rules, no AI)',
                 'noSave': 'Don\'t save',
                 'singleColumn': 'Single Column',
                 'doubleColumn': 'Double Column',
@@ -644,7 +786,7 @@ class AcademicPlotApp {
                 // User Guide Modal
                 'modalTitle': 'User Guide',
                 'step1Title': 'Step 1: Upload File',
-                'step1Desc': 'Drag and drop your Python plotting script file (.py) to the upload area, or click to select a file.',
+                'step1Desc': 'Drag and drop your Python plotting script (.py) or Jupyter notebook (.ipynb) to the upload area, or click to select a file.',
                 'step2Title': 'Step 2: Configure Settings',
                 'step2Desc': 'Open the settings panel on the left (Basic, Academic Style, Custom) to customize beautification options.',
                 'step3Title': 'Step 3: Start Processing',
@@ -678,6 +820,7 @@ class AcademicPlotApp {
         document.querySelector('.results-success h3').textContent = lang.resultsSuccess;
         document.querySelector('.results-success p').textContent = lang.resultsDownload;
         document.querySelector('.btn-download-result').textContent = lang.downloadButton;
+        document.querySelector('#previewBtn span').textContent = lang.previewButton;
         
         // Sidebar
         document.querySelector('.sidebar-header h3').textContent = lang.sidebarTitle;
@@ -702,6 +845,7 @@ class AcademicPlotApp {
         document.querySelector('#academicOptions label[for="layout"]').textContent = lang.layout;
         document.querySelector('#academicOptions label[for="vectorFormat"]').textContent = lang.vectorFormat;
         document.querySelector('#academicOptions label[for="dpi"]').textContent = lang.dpi;
+        document.querySelector('#academicOptions label[for="fastMode"]').textContent = lang.fastMode;
         
         // Update select options
         document.querySelector('#vectorFormat option[value=""]').textContent = lang.noSave;
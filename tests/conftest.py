@@ -0,0 +1,24 @@
+import os
+import tempfile
+
+import pytest
+
+# 任务数据库与缓存在模块导入时确定位置，测试时指向临时目录，避免写入 uploads/
+_STATE_DIR = tempfile.mkdtemp(prefix='academicplot_tests_')
+os.environ.setdefault('JOBS_DB_PATH', os.path.join(_STATE_DIR, 'jobs.sqlite3'))
+os.environ.setdefault('ACADEMICPLOT_CACHE_DIR', os.path.join(_STATE_DIR, 'cache'))
+
+
+@pytest.fixture
+def web_app(tmp_path, monkeypatch):
+    """Flask 应用，上传与输出目录指向 tmp_path，不启动后台清理线程。"""
+    from core.storage import OutputStore
+    from web import app as app_module
+
+    upload_folder = tmp_path / 'temp'
+    upload_folder.mkdir()
+    monkeypatch.setitem(app_module.app.config, 'UPLOAD_FOLDER', str(upload_folder))
+    monkeypatch.setattr(app_module, 'output_store', OutputStore(str(tmp_path / 'outputs')))
+    monkeypatch.setattr(app_module.storage_janitor, 'start', lambda: None)
+    app_module.app.config['TESTING'] = True
+    return app_module
@@ -0,0 +1,104 @@
+import io
+import json
+
+from core.batch import extract_python_files_from_zip
+
+
+def _events(response):
+    return [json.loads(line[len('data: '):]) for line in response.get_data(as_text=True).splitlines()
+            if line.startswith('data: ')]
+
+
+def test_batch_stream_error_reaches_client(web_app, monkeypatch):
+    def broken(*args, **kwargs):
+        raise RuntimeError('boom')
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(web_app, 'process_batch_streaming', broken)
+    client = web_app.app.test_client()
+    response = client.post('/process_batch', data={'files': (io.BytesIO(b'x = 1\n'), 'a.py')})
+    events = _events(response)
+    assert events[-1]['error'].endswith('boom')
+
+
+def test_zip_extraction_keeps_scripts_and_notebooks(tmp_path):
+    import zipfile
+
+    zip_path = tmp_path / 'in.zip'
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        archive.writestr('fig1/plot.py', 'x = 1\n')
+        archive.writestr('nb.ipynb', '{}')
+        archive.writestr('README.md', 'skip')
+        archive.writestr('__MACOSX/fig1/._plot.py', '')
+    dest = tmp_path / 'out'
+    dest.mkdir()
+    names = sorted(p.split('/')[-1] for p in extract_python_files_from_zip(str(zip_path), str(dest), lambda n: n))
+    assert names == ['fig1_plot.py', 'nb.ipynb']
+
+
+def test_duplicate_basenames_are_renamed_and_reported(web_app, monkeypatch):
+    import zipfile
+
+    seen = []
+
+    def fake_stream(filepaths, output_folder, finished=None, **kwargs):
+        seen.extend(open(path).read() for path in filepaths)
+        seen.extend(path.replace('\\', '/').split('/')[-1] for path in filepaths)
+        finished.set()
+        return {}
+        yield  # pragma: no cover
+
+    monkeypatch.setattr(web_app, 'process_batch_streaming', fake_stream)
+    archive_bytes = io.BytesIO()
+    with zipfile.ZipFile(archive_bytes, 'w') as archive:
+        archive.writestr('plot.py', 'y = 2\n')
+    archive_bytes.seek(0)
+    client = web_app.app.test_client()
+    response = client.post('/process_batch', data={'files': [
+        (io.BytesIO(b'x = 1\n'), 'plot.py'),
+        (archive_bytes, 'figs.zip'),
+    ]})
+    events = _events(response)
+    assert seen == ['x = 1\n', 'y = 2\n', 'plot.py', 'plot_2.py']
+    assert any(event.get('renamed') == {'plot.py': 'plot_2.py'} for event in events)
+
+
+def test_finished_waits_for_running_files(tmp_path, monkeypatch):
+    import threading
+
+    from core import batch
+
+    started = threading.Event()
+    release = threading.Event()
+
+    def slow(path, *args, **kwargs):
+        started.set()
+        yield 'working'
+        release.wait(5)
+        yield 'SUCCESS: out.py'
+
+    monkeypatch.setattr(batch, 'process_python_file_streaming', slow)
+    finished = threading.Event()
+    stream = batch.process_batch_streaming([str(tmp_path / 'a.py'), str(tmp_path / 'b.py')], str(tmp_path),
+                                           max_workers=1, finished=finished)
+    assert next(stream) == ('a.py', 'working')
+    stream.close()
+    # a.py is still running; b.py never started and is cancelled
+    assert not finished.wait(0.2)
+    release.set()
+    assert finished.wait(5)
+
+
+def test_zip_extraction_renames_conflicts(tmp_path):
+    import zipfile
+
+    zip_path = tmp_path / 'in.zip'
+    with zipfile.ZipFile(zip_path, 'w') as archive:
+        archive.writestr('fig1_plot.py', 'x = 1\n')
+        archive.writestr('fig1/plot.py', 'x = 2\n')
+    dest = tmp_path / 'out'
+    dest.mkdir()
+    renamed = []
+    paths = extract_python_files_from_zip(str(zip_path), str(dest), lambda n: n, {'fig1_plot.py'}, renamed)
+    assert sorted(p.replace('\\', '/').split('/')[-1] for p in paths) == ['fig1_plot_2.py', 'fig1_plot_3.py']
+    assert renamed == [('fig1_plot.py', 'fig1_plot_2.py'), ('fig1/plot.py', 'fig1_plot_3.py')]
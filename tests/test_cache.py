@@ -0,0 +1,80 @@
+from core import cache
+from core.cache import ResultCache, TranslationCache, result_cache_key
+
+
+class _Clock:
+    """可手动推进的 time.time() 替身。"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_translations_are_keyed_by_normalized_source(tmp_path):
+    store = TranslationCache(str(tmp_path / 'translations.sqlite3'))
+    store.put_many({'  Time   axis ': '时间轴', 'Empty': '  '}, 'zh')
+    assert store.get_many(['Time axis', 'Time  axis', 'Empty'], 'zh') == {'Time axis': '时间轴', 'Time  axis': '时间轴'}
+    assert store.get_many(['Time axis'], 'ja') == {}
+    stats = store.stats()
+    assert (stats['entries'], stats['hits'], stats['misses']) == (1, 2, 2)
+
+
+def test_least_recently_used_translations_are_evicted(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    store = TranslationCache(str(tmp_path / 'translations.sqlite3'), max_entries=2)
+    store.put_many({'a': '甲'}, 'zh')
+    clock.now += 1
+    store.put_many({'b': '乙'}, 'zh')
+    clock.now += 1
+    # 读取 a 使其成为最近使用的条目，写入 c 时淘汰 b
+    assert store.get_many(['a'], 'zh') == {'a': '甲'}
+    clock.now += 1
+    store.put_many({'c': '丙'}, 'zh')
+    assert store.get_many(['a', 'b', 'c'], 'zh') == {'a': '甲', 'c': '丙'}
+    assert store.stats()['evictions'] == 1
+
+
+def test_expired_results_are_dropped(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    store = ResultCache(str(tmp_path / 'results.sqlite3'), ttl_seconds=60)
+    store.put('k', 'value')
+    clock.now += 30
+    assert store.get('k') == 'value'
+    clock.now += 31
+    assert store.get('k') is None
+    assert store.stats()['evictions'] == 1
+
+
+def test_results_are_evicted_to_stay_within_the_byte_budget(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, 'time', clock)
+    store = ResultCache(str(tmp_path / 'results.sqlite3'), max_bytes=10)
+    store.put('a', 'xxxx')
+    clock.now += 1
+    store.put('b', 'yyyy')
+    clock.now += 1
+    assert store.get('a') == 'xxxx'
+    clock.now += 1
+    store.put('c', 'zzzz')
+    assert (store.get('a'), store.get('b'), store.get('c')) == ('xxxx', None, 'zzzz')
+    # 单个超出预算的结果不写入
+    store.put('huge', 'w' * 11)
+    assert store.get('huge') is None
+    assert store.stats()['bytes'] == 8
+
+
+def test_equivalent_options_share_a_result_key():
+    base = {'enabled': True, 'paper_format': 'nature', 'layout': 'single', 'dpi': 300,
+            'custom_mode': False, 'custom_params': {'width': 3}, 'output_filename_base': 'figure'}
+    sparse = {'enabled': 1, 'custom_params': {'width': 5}, 'unrelated': 'ignored'}
+    assert result_cache_key('x = 1\n', base) == result_cache_key('x = 1\n', sparse)
+    assert result_cache_key('x = 1\n', base) != result_cache_key('x = 2\n', base)
+    assert result_cache_key('x = 1\n', base) != result_cache_key('x = 1\n', dict(base, layout='double'))
+    custom = dict(base, custom_mode=True)
+    assert result_cache_key('x', custom) != result_cache_key('x', dict(custom, custom_params={'width': 5}))
+    assert result_cache_key('x', dict(custom, custom_params={'a': 1, 'b': 2})) == \
+        result_cache_key('x', dict(custom, custom_params={'b': 2, 'a': 1}))
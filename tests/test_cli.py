@@ -0,0 +1,58 @@
+import json
+import os
+
+from core import cli
+
+
+def _touch(path, mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text('x = 1\n')
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_find_sources_skips_outputs_and_hidden_directories(tmp_path):
+    for name in ('b.py', 'a.ipynb', 'a_zh_revision.py', 'notes.txt', 'sub/c.py', '.git/d.py',
+                 '__pycache__/e.py', '.hidden/f.py'):
+        _touch(tmp_path / name)
+    found = [os.path.relpath(path, tmp_path) for path in cli.find_sources(str(tmp_path))]
+    assert found == ['a.ipynb', 'b.py', os.path.join('sub', 'c.py')]
+
+
+def test_is_up_to_date_compares_modification_times(tmp_path):
+    source = _touch(tmp_path / 'a.py', mtime=1000)
+    output = tmp_path / 'a_zh_revision.py'
+    assert not cli.is_up_to_date(str(source), str(output))
+    _touch(output, mtime=2000)
+    assert cli.is_up_to_date(str(source), str(output))
+    os.utime(source, (3000, 3000))
+    assert not cli.is_up_to_date(str(source), str(output))
+
+
+def test_output_folder_mirrors_the_tree(tmp_path):
+    source = str(tmp_path / 'src' / 'sub' / 'a.py')
+    assert cli.output_folder_for(source, str(tmp_path / 'src'), None) == str(tmp_path / 'src' / 'sub')
+    assert cli.output_folder_for(source, str(tmp_path / 'src'), str(tmp_path / 'out')) == \
+        os.path.normpath(str(tmp_path / 'out' / 'sub'))
+
+
+def test_main_skips_up_to_date_files_and_writes_a_summary(tmp_path, monkeypatch):
+    _touch(tmp_path / 'done.py', mtime=1000)
+    _touch(tmp_path / 'done_zh_revision.py', mtime=2000)
+    _touch(tmp_path / 'new.py')
+    _touch(tmp_path / 'bad.py')
+    converted = []
+
+    def convert(source, folder, beautify, options, on_status=None):
+        converted.append((os.path.basename(source), beautify, options))
+        ok = not source.endswith('bad.py')
+        return {'status': cli.SUCCEEDED if ok else cli.FAILED, 'output': source if ok else None,
+                'seconds': 0.0, 'error': None if ok else 'boom'}
+
+    monkeypatch.setattr(cli, 'convert_file', convert)
+    assert cli.main([str(tmp_path), '--translate-only', '-j', '2']) == 1
+    assert sorted(name for name, _, _ in converted) == ['bad.py', 'new.py']
+    assert all(beautify is False and options == {'enabled': False} for _, beautify, options in converted)
+    summary = json.loads((tmp_path / cli.SUMMARY_FILENAME).read_text(encoding='utf-8'))
+    assert summary['counts'] == {cli.SUCCEEDED: 1, cli.FAILED: 1, cli.SKIPPED: 1, cli.CANCELLED: 0}
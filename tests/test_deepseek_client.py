@@ -0,0 +1,56 @@
+import pytest
+import requests
+
+from core import enhanced_agent
+from core.deepseek_client import DeepSeekAPIError, DeepSeekClient
+from core.rate_limit import RateGovernor
+
+
+class FailingTransport:
+    """每次请求都抛出给定异常的传输层。"""
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def post(self, url, payload, timeout, stream=False):
+        self.calls += 1
+        raise self.error
+
+
+def make_client(transport, max_in_flight=2):
+    governor = RateGovernor(requests_per_minute=0, tokens_per_minute=0, max_in_flight=max_in_flight)
+    return DeepSeekClient('http://deepseek.invalid/chat/completions', 'key', transport=transport,
+                          governor=governor, backoff_base=0, backoff_max=0)
+
+
+@pytest.mark.parametrize('error', [
+    requests.exceptions.InvalidURL('bad url'),
+    requests.exceptions.MissingSchema('no schema'),
+    requests.exceptions.TooManyRedirects('loop'),
+])
+def test_non_retryable_request_errors_become_api_errors(error):
+    transport = FailingTransport(error)
+    client = make_client(transport)
+    with pytest.raises(DeepSeekAPIError) as info:
+        client.chat({'messages': []})
+    assert info.value.retryable is False
+    assert transport.calls == 1
+
+
+def test_call_deepseek_api_returns_none_on_request_error(monkeypatch):
+    client = make_client(FailingTransport(requests.exceptions.InvalidURL('bad url')))
+    monkeypatch.setattr(enhanced_agent, 'DEEPSEEK_API_KEY', 'sk-test')
+    monkeypatch.setattr(enhanced_agent, 'get_deepseek_client', lambda url, key: client)
+    assert enhanced_agent.call_deepseek_api('hello') is None
+
+
+def test_unexpected_transport_errors_release_the_permit():
+    transport = FailingTransport(OSError('socket closed'))
+    client = make_client(transport, max_in_flight=1)
+    with pytest.raises(OSError):
+        client.chat({'messages': []})
+    assert client.governor.stats()['in_flight'] == 0
+    with pytest.raises(OSError):
+        client.chat({'messages': []})
+    assert transport.calls == 2
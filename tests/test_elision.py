@@ -0,0 +1,31 @@
+from core.elision import elide_literals, restore_literals
+
+
+def test_large_data_literals_round_trip_through_placeholders():
+    data = ', '.join(str(i * 0.5) for i in range(100))
+    code = f"import numpy as np\nx = [{data}]\nlabels = {{'a': 1}}\nplt.plot(x)\n"
+    elided, placeholders = elide_literals(code)
+    assert len(placeholders) == 1
+    placeholder = next(iter(placeholders))
+    assert f"x = {placeholder}\n" in elided
+    assert "labels = {'a': 1}" in elided
+    assert restore_literals(elided, placeholders) == code
+
+
+def test_placeholders_are_stable_for_identical_data():
+    data = '[' + ', '.join(['1'] * 60) + ']'
+    first, first_map = elide_literals(f"a = {data}\n")
+    second, second_map = elide_literals(f"b = {data}\nplt.show()\n")
+    assert list(first_map) == list(second_map)
+
+
+def test_literals_with_expressions_are_kept():
+    code = "x = [" + ', '.join(f"f({i})" for i in range(80)) + "]\n"
+    assert elide_literals(code) == (code, {})
+
+
+def test_missing_placeholder_makes_the_result_untrusted():
+    code = "x = [" + ', '.join(['2'] * 60) + "]\n"
+    elided, placeholders = elide_literals(code)
+    assert restore_literals("x = []\n", placeholders) is None
+    assert elide_literals("def broken(:\n") == ("def broken(:\n", {})
@@ -0,0 +1,34 @@
+import json
+
+from core.glossary import Glossary, load_glossary
+
+
+def test_lookup_normalizes_case_whitespace_and_trailing_punctuation():
+    glossary = Glossary({'Time': '时间', 'Sample rate': '采样率'})
+    assert glossary.lookup('time') == '时间'
+    assert glossary.lookup('  Sample   RATE:') == '采样率:'
+    assert glossary.lookup('Time of day') is None
+    assert glossary.lookup(' : ') is None
+
+
+def test_unit_suffixes_are_kept_or_translated():
+    glossary = Glossary({'Time': '时间', 'Temperature': '温度', 'seconds': '秒'})
+    assert glossary.lookup('Time (s)') == '时间 (s)'
+    assert glossary.lookup('Temperature [°C]') == '温度 [°C]'
+    assert glossary.lookup('Time (seconds)') == '时间 (秒)'
+    assert glossary.lookup('Time (elapsed since start)') is None
+
+
+def test_translate_many_returns_only_hits():
+    glossary = Glossary({'Voltage': '电压'})
+    assert glossary.translate_many(['Voltage (V)', 'Unknown label', 'Voltage (V)']) == {'Voltage (V)': '电压 (V)'}
+
+
+def test_user_glossaries_override_builtin_terms_and_bad_files_are_skipped(tmp_path):
+    user = tmp_path / 'terms.json'
+    user.write_text(json.dumps({'terms': {'Time': '时刻'}}), encoding='utf-8')
+    broken = tmp_path / 'broken.json'
+    broken.write_text('[1, 2]', encoding='utf-8')
+    glossary = load_glossary([str(user), str(broken), str(tmp_path / 'missing.json')])
+    assert glossary.lookup('Time') == '时刻'
+    assert glossary.lookup('Frequency') == '频率'
@@ -0,0 +1,72 @@
+import threading
+
+from core.jobs import FAILED, SUCCEEDED, JobManager
+
+
+def _wait_finished(jobs, job_id, timeout=5):
+    finished = False
+    while not finished:
+        _, finished = jobs.wait_for_events(job_id, 0, timeout)
+    return jobs.get(job_id)
+
+
+def test_identical_requests_are_coalesced_until_the_job_finishes(tmp_path):
+    release = threading.Event()
+
+    def runner(job_id, payload):
+        release.wait(5)
+        yield {'success': True, 'file': payload['name']}
+
+    jobs = JobManager(str(tmp_path / 'jobs.sqlite3'), runner, num_workers=1)
+    first, attached = jobs.submit_coalesced({'name': 'a'}, 'key')
+    second, attached_again = jobs.submit_coalesced({'name': 'a'}, 'key')
+    assert (attached, attached_again) == (False, True)
+    assert second == first
+    assert jobs.stats()['coalesced'] == 1
+
+    release.set()
+    assert _wait_finished(jobs, first)['status'] == SUCCEEDED
+    seqs = [seq for seq, _ in jobs.events_after(first)]
+    assert seqs == sorted(set(seqs))
+    assert any('加入了此任务' in event.get('status', '') for _, event in jobs.events_after(first))
+
+    third, attached = jobs.submit_coalesced({'name': 'a'}, 'key')
+    assert third != first and attached is False
+
+
+def test_events_after_finish_continue_the_sequence(tmp_path):
+    jobs = JobManager(str(tmp_path / 'jobs.sqlite3'), lambda job_id, payload: iter(()))
+    jobs.start = lambda: None
+    job_id = jobs.submit({'name': 'a'})
+    jobs.append_event(job_id, {'status': 'working'})
+    jobs._finish(job_id, FAILED, error='boom')
+    # 任务结束后才到达的状态（例如线程池中仍在运行的 report_status）不应与已有事件的序号冲突
+    late = jobs.append_event(job_id, {'status': 'late'})
+    assert [seq for seq, _ in jobs.events_after(job_id)] == [1, 2, late]
+    assert late == 3
+
+
+def test_partial_code_is_kept_in_one_row_and_replayed_once(tmp_path):
+    jobs = JobManager(str(tmp_path / 'jobs.sqlite3'), lambda job_id, payload: iter(()))
+    jobs.start = lambda: None
+    job_id = jobs.submit({'name': 'a'})
+    first = jobs.append_event(job_id, {'partial_code': 'import '})
+    jobs.append_event(job_id, {'status': 'working'})
+    second = jobs.append_event(job_id, {'partial_code': 'numpy'})
+    third = jobs.append_event(job_id, {'partial_code': '\n'})
+
+    rows = jobs._conn.execute("SELECT COUNT(*) FROM job_partials WHERE job_id = ?", (job_id,)).fetchone()[0]
+    assert rows == 1
+    assert jobs._conn.execute("SELECT COUNT(*) FROM job_events WHERE data LIKE '%partial_code%'").fetchone()[0] == 0
+
+    # 新的订阅者收到一个合并后的增量事件，断线重连的订阅者只收到缺失的部分
+    assert jobs.events_after(job_id)[1:] == [(first + 1, {'status': 'working'}),
+                                             (third, {'partial_code': 'import numpy\n'})]
+    assert jobs.events_after(job_id, first) == [(first + 1, {'status': 'working'}),
+                                                (third, {'partial_code': 'numpy\n'})]
+    assert jobs.events_after(job_id, second) == [(third, {'partial_code': '\n'})]
+    assert jobs.events_after(job_id, third) == []
+
+    jobs._finish(job_id, FAILED, error='boom')
+    late = jobs.append_event(job_id, {'status': 'late'})
+    assert late == third + 1
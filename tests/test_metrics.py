@@ -0,0 +1,45 @@
+from core.metrics import Registry
+from core.storage import OutputStore, StorageJanitor
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter('demo_requests_total', 'Requests', ['outcome'])
+    latency = registry.histogram('demo_seconds', 'Latency', buckets=(0.1, 1.0))
+    requests.inc(outcome='ok')
+    requests.inc(2, outcome='ok')
+    latency.observe(0.5)
+    text = registry.render()
+    assert '# TYPE demo_requests_total counter' in text
+    assert 'demo_requests_total{outcome="ok"} 3' in text
+    assert 'demo_seconds_bucket{le="0.1"} 0' in text
+    assert 'demo_seconds_bucket{le="1"} 1' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 1' in text
+    assert 'demo_seconds_count 1' in text
+
+
+def test_registry_escapes_label_values():
+    registry = Registry()
+    registry.gauge('demo_gauge', 'Gauge', ['name']).set(1, name='a"b\\c')
+    assert 'demo_gauge{name="a\\"b\\\\c"} 1' in registry.render()
+
+
+def test_metrics_scrape_reads_storage_sizes_from_last_janitor_pass(web_app, tmp_path, monkeypatch):
+    uploads = tmp_path / 'janitor_uploads'
+    (uploads / 'job').mkdir(parents=True)
+    (uploads / 'job' / 'a.py').write_bytes(b'x' * 123)
+    janitor = StorageJanitor(OutputStore(str(tmp_path / 'janitor_outputs')), str(uploads))
+    janitor.run_once()
+    assert janitor.stats()['upload_bytes'] == 123
+
+    def fail(*args, **kwargs):
+        raise AssertionError('/metrics must not walk the storage tree')
+
+    monkeypatch.setattr(janitor, '_measure', fail)
+    monkeypatch.setattr(janitor.store, 'stats', fail)
+    monkeypatch.setattr(web_app, 'storage_janitor', janitor)
+    client = web_app.app.test_client()
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert 'academicplot_storage_bytes{area="uploads"} 123' in response.get_data(as_text=True)
+    assert client.get('/storage/stats').get_json()['upload_bytes'] == 123
@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+from core import enhanced_agent, notebook
+from core.notebook import mask_magics, read_notebook, unmask_magics, write_notebook
+
+
+def _notebook(cells):
+    return {'nbformat': 4, 'nbformat_minor': 5, 'metadata': {}, 'cells': cells}
+
+
+def _code_cell(source):
+    return {'cell_type': 'code', 'source': source.splitlines(keepends=True), 'metadata': {},
+            'outputs': [{'output_type': 'stream', 'text': ['noise\n']}], 'execution_count': 3}
+
+
+def _write(path, cells):
+    path.write_text(json.dumps(_notebook(cells)), encoding='utf-8')
+    return str(path)
+
+
+def test_read_strips_outputs_and_write_round_trips(tmp_path):
+    path = _write(tmp_path / 'a.ipynb', [_code_cell("print(1)\n"), {'cell_type': 'markdown', 'source': ['# Hi'],
+                                                                     'metadata': {}}])
+    header, cells = read_notebook(path)
+    assert cells[0]['outputs'] == [] and cells[0]['execution_count'] is None
+    write_notebook(str(tmp_path / 'b.ipynb'), header, cells)
+    assert json.loads((tmp_path / 'b.ipynb').read_text(encoding='utf-8')) == dict(header, cells=cells)
+
+
+@pytest.mark.skipif(notebook.ijson is None, reason='需要 ijson')
+def test_streaming_reader_matches_the_plain_reader(tmp_path, monkeypatch):
+    path = _write(tmp_path / 'a.ipynb', [_code_cell("x = 1.5\n"), _code_cell("plt.plot([1, 2])\n")])
+    expected = read_notebook(path)
+    monkeypatch.setattr(notebook, 'NOTEBOOK_STREAM_MIN_BYTES', 0)
+    assert read_notebook(path) == expected
+
+
+def test_magics_are_masked_and_restored():
+    code = "%matplotlib inline\nif True:\n    !ls\nplt.plot(x)"
+    masked, magics = mask_magics(code)
+    assert magics == ['%matplotlib inline', '!ls']
+    assert unmask_magics(masked, magics) == code
+    assert unmask_magics(masked.replace('__APLOT_MAGIC_1__', ''), magics) is None
+    assert mask_magics("%%bash\necho hi") is None
+
+
+def test_translation_only_cells_are_cached(tmp_path, monkeypatch):
+    requests = []
+
+    def translate(chunk):
+        requests.append(chunk)
+        return {key: f"译文{len(requests)}" for key in chunk}
+
+    monkeypatch.setattr(enhanced_agent, '_translate_chunk', translate)
+    monkeypatch.setattr(enhanced_agent, 'get_translation_cache', lambda: None)
+    path = _write(tmp_path / 'cached.ipynb', [
+        _code_cell("import matplotlib.pyplot as plt\n"),
+        _code_cell("plt.title('Unusual notebook caching title')\nplt.show()\n"),
+    ])
+
+    def run():
+        return list(notebook.process_notebook_streaming(path, str(tmp_path), academic_options={'enabled': False}))
+
+    first = run()
+    assert first[-1] == 'SUCCESS:cached_zh_revision.ipynb'
+    assert len(requests) == 1
+    second = run()
+    assert len(requests) == 1
+    assert any('1 个单元格命中结果缓存' in status for status in second)
+    _, cells = read_notebook(str(tmp_path / 'cached_zh_revision.ipynb'))
+    assert "plt.title('译文1')" in ''.join(cells[1]['source'])
+
+
+def test_cell_cache_survives_inserting_a_cell(tmp_path, monkeypatch):
+    requests = []
+
+    def translate(chunk):
+        requests.append(chunk)
+        return {key: f"插入测试{len(requests)}" for key in chunk}
+
+    monkeypatch.setattr(enhanced_agent, '_translate_chunk', translate)
+    monkeypatch.setattr(enhanced_agent, 'get_translation_cache', lambda: None)
+    options = {'enabled': True, 'fast_mode': True, 'vector_format': 'pdf'}
+    plot_cell = _code_cell("plt.plot([1, 2])\nplt.title('Cell moved by insertion')\nplt.show()\n")
+    path = _write(tmp_path / 'moved.ipynb', [_code_cell("import matplotlib.pyplot as plt\n"), plot_cell])
+
+    def run():
+        return list(notebook.process_notebook_streaming(path, str(tmp_path), academic_options=dict(options)))
+
+    assert run()[-1] == 'SUCCESS:moved_zh_revision.ipynb'
+    assert len(requests) == 1
+    _, cells = read_notebook(str(tmp_path / 'moved_zh_revision.ipynb'))
+    assert 'moved_cell2_figure.pdf' in ''.join(cells[1]['source'])
+
+    # 在前面插入一个新的绘图单元格：原单元格的位置变了，但内容未变，仍命中缓存
+    new_cell = _code_cell("plt.plot([3])\nplt.title('Freshly inserted cell')\nplt.show()\n")
+    _write(tmp_path / 'moved.ipynb', [_code_cell("import matplotlib.pyplot as plt\n"), new_cell, plot_cell])
+    statuses = run()
+    assert len(requests) == 2
+    assert any('1 个单元格命中结果缓存，1 个单元格需要处理' in status for status in statuses)
+    _, cells = read_notebook(str(tmp_path / 'moved_zh_revision.ipynb'))
+    assert 'moved_cell2_figure.pdf' in ''.join(cells[1]['source'])
+    assert 'moved_cell3_figure.pdf' in ''.join(cells[2]['source'])
+    assert "plt.title('插入测试1')" in ''.join(cells[2]['source'])
@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+
+from core import enhanced_agent
+from core.enhanced_agent import PARTIAL_PREFIX
+from core.status import merge_streams
+
+SCRIPT = (
+    "import matplotlib.pyplot as plt\n"
+    "plt.plot([1, 2])\n"
+    "plt.title('Growth rate')\n"
+    "plt.show()\n"
+)
+
+
+def _run(stream):
+    statuses = []
+    while True:
+        try:
+            statuses.append(next(stream))
+        except StopIteration as stop:
+            return statuses, stop.value
+
+
+def _code_in_prompt(prompt):
+    return prompt.split('```python\n')[-1].rsplit('\n```', 1)[0]
+
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """翻译与重构都不访问网络：翻译返回固定译文，重构依次返回 refactors 中的结果（函数接收 prompt）。"""
+    calls = {'translate': [], 'refactor': []}
+    refactors = []
+
+    def translate(chunk):
+        calls['translate'].append(chunk)
+        return {key: '增长率' for key in chunk}
+
+    def refactor(prompt):
+        calls['refactor'].append(prompt)
+        code = refactors[len(calls['refactor']) - 1](prompt)
+        yield code
+        return code
+
+    monkeypatch.setattr(enhanced_agent, '_translate_chunk', translate)
+    monkeypatch.setattr(enhanced_agent, 'call_deepseek_api_streaming', refactor)
+    monkeypatch.setattr(enhanced_agent, 'get_translation_cache', lambda: None)
+    monkeypatch.setattr(enhanced_agent, 'get_result_cache', lambda: None)
+    monkeypatch.setattr(enhanced_agent, 'get_glossary', lambda: None)
+    monkeypatch.setattr(enhanced_agent, 'PARALLEL_TRANSLATE_REFACTOR', True)
+    return calls, refactors
+
+
+def test_merge_streams_forwards_statuses_in_arrival_order():
+    first_sent = threading.Event()
+    second_sent = threading.Event()
+
+    def first():
+        yield 'a1'
+        first_sent.set()
+        second_sent.wait(5)
+        yield 'a2'
+        return 'A'
+
+    def second():
+        first_sent.wait(5)
+        yield 'b1'
+        second_sent.set()
+        return 'B'
+
+    statuses, results = _run(merge_streams([first(), second()]))
+    assert statuses == ['a1', 'b1', 'a2']
+    # 返回值按输入顺序排列，与结束的先后无关
+    assert results == ['A', 'B']
+
+
+def test_merge_streams_reraises_stream_errors():
+    def broken():
+        yield 'working'
+        raise ValueError('boom')
+
+    def fine():
+        yield 'ok'
+        return 1
+
+    with pytest.raises(ValueError, match='boom'):
+        _run(merge_streams([broken(), fine()]))
+
+
+def test_parallel_translation_is_written_back_into_the_refactored_code(stub_llm):
+    calls, refactors = stub_llm
+    refactors.append(lambda prompt: _code_in_prompt(prompt).replace("plt.plot", "plt.figure(figsize=(3, 2))\nplt.plot"))
+
+    statuses, code = _run(enhanced_agent.process_code_streaming(SCRIPT, 'plot.py', beautify=True))
+    assert any('开始并发执行翻译与AI代码重构' in status for status in statuses)
+    assert any(status.startswith(PARTIAL_PREFIX) for status in statuses)
+    assert any('翻译分块 1/1 完成' in status for status in statuses)
+    assert len(calls['refactor']) == 1 and len(calls['translate']) == 1
+    # 重构请求发送的是原文，译文在重构结果上写回
+    assert 'Growth rate' in calls['refactor'][0]
+    assert "plt.figure(figsize=(3, 2))" in code and "plt.title('增长率')" in code
+
+
+def test_unlocatable_text_falls_back_to_the_serial_path(stub_llm):
+    calls, refactors = stub_llm
+    # 并发阶段的重构改写了标题，译文无法定位；串行阶段的重构原样保留已翻译的代码
+    refactors.append(lambda prompt: _code_in_prompt(prompt).replace('Growth rate', 'Rate of growth'))
+    refactors.append(lambda prompt: _code_in_prompt(prompt))
+
+    statuses, code = _run(enhanced_agent.process_code_streaming(SCRIPT, 'plot.py', beautify=True))
+    assert any('无法定位' in status for status in statuses)
+    assert len(calls['refactor']) == 2
+    assert "plt.title('增长率')" in _code_in_prompt(calls['refactor'][1])
+    assert "plt.title('增长率')" in code and 'Rate of growth' not in code
+    assert statuses[-1] == "AI 代码重构与风格美化成功。"
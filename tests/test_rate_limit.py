@@ -0,0 +1,57 @@
+import threading
+
+from core.rate_limit import RateGovernor, estimate_tokens
+from core.status import status_sink
+
+
+def test_in_flight_limit_is_released_with_the_permit():
+    governor = RateGovernor(requests_per_minute=0, tokens_per_minute=0, max_in_flight=1)
+    first = governor.acquire()
+    assert governor.stats()['in_flight'] == 1
+    acquired = threading.Event()
+
+    def second():
+        governor.acquire().release()
+        acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not acquired.wait(0.1)
+    first.release()
+    first.release()
+    thread.join(5)
+    assert acquired.is_set()
+    assert governor.stats()['in_flight'] == 0
+
+
+def test_actual_token_usage_corrects_the_estimate():
+    governor = RateGovernor(requests_per_minute=0, tokens_per_minute=1000, max_in_flight=0)
+    governor.acquire(100).release(300)
+    assert governor.stats()['token_budget'] < 1000 - 250
+
+
+def test_waiting_status_is_reported_without_holding_the_lock():
+    governor = RateGovernor(requests_per_minute=0, tokens_per_minute=0, max_in_flight=1, report_interval=60)
+    holder = governor.acquire()
+    messages = []
+
+    def sink(message):
+        # 另一个线程在回调期间必须能拿到限流器的锁
+        probe = threading.Thread(target=governor.stats)
+        probe.start()
+        probe.join(2)
+        messages.append((message, probe.is_alive()))
+        if len(messages) == 1:
+            holder.release()
+
+    with status_sink(sink):
+        governor.acquire().release()
+    assert messages and not any(blocked for _, blocked in messages)
+    assert messages[0][0].startswith("DeepSeek 调用排队中")
+    assert governor.stats()['throttled'] == 1
+
+
+def test_estimate_tokens_scales_with_prompt_length():
+    short = estimate_tokens({'messages': [{'content': 'a' * 30}]})
+    long = estimate_tokens({'messages': [{'content': 'a' * 3000}]})
+    assert 0 < short < long
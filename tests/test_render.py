@@ -0,0 +1,61 @@
+import importlib.util
+import os
+
+import pytest
+
+from core.render import RENDER_MPLCONFIGDIR, RenderPool, worker_env
+
+
+def test_worker_env_only_passes_allowlisted_variables(tmp_path, monkeypatch):
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'sk-secret')
+    monkeypatch.setenv('FLASK_SECRET_KEY', 'flask-secret')
+    monkeypatch.setenv('PATH', '/usr/bin')
+    env = worker_env(str(tmp_path))
+    assert 'DEEPSEEK_API_KEY' not in env and 'FLASK_SECRET_KEY' not in env
+    assert env['PATH'] == '/usr/bin'
+    assert env['HOME'] == str(tmp_path)
+    assert env['MPLBACKEND'] == 'Agg'
+
+
+def test_workers_share_a_persistent_matplotlib_config_dir(tmp_path):
+    first = worker_env(str(tmp_path / 'a'), str(tmp_path / 'mpl'))
+    second = worker_env(str(tmp_path / 'b'), str(tmp_path / 'mpl'))
+    assert first['HOME'] != second['HOME']
+    assert first['MPLCONFIGDIR'] == second['MPLCONFIGDIR'] == str(tmp_path / 'mpl')
+    # 默认放在缓存目录下，不随工作进程的临时 HOME 一起删除
+    assert worker_env(str(tmp_path / 'a'))['MPLCONFIGDIR'] == os.path.abspath(RENDER_MPLCONFIGDIR)
+    assert RENDER_MPLCONFIGDIR.startswith(os.environ['ACADEMICPLOT_CACHE_DIR'])
+
+
+def test_preview_is_disabled_by_default(web_app):
+    client = web_app.app.test_client()
+    response = client.get('/jobs/unknown/preview')
+    assert response.status_code == 404
+    assert 'disabled' in response.get_json()['error']
+
+
+@pytest.mark.skipif(importlib.util.find_spec('matplotlib') is None, reason='需要 matplotlib')
+def test_each_script_runs_in_a_fresh_worker_without_secrets(tmp_path, monkeypatch):
+    monkeypatch.setenv('DEEPSEEK_API_KEY', 'sk-secret')
+    pool = RenderPool(size=1, timeout=60)
+    try:
+        results = []
+        for name in ('first', 'second'):
+            folder = tmp_path / name
+            (folder / 'previews').mkdir(parents=True)
+            script = folder / 'plot.py'
+            script.write_text(
+                "import os, sys\n"
+                "print('key', os.environ.get('DEEPSEEK_API_KEY'))\n"
+                "print('leftover', getattr(sys, '_render_marker', None))\n"
+                "print('config', os.environ.get('MPLCONFIGDIR'))\n"
+                "sys._render_marker = 'set'\n"
+            )
+            results.append(pool.render(str(script), str(folder / 'previews')))
+    finally:
+        pool.shutdown()
+    for result in results:
+        assert result['ok'], result['error']
+        assert 'key None' in result['log']
+        assert 'leftover None' in result['log']
+        assert f"config {os.path.abspath(RENDER_MPLCONFIGDIR)}" in result['log']
@@ -0,0 +1,155 @@
+import io
+
+from core import enhanced_agent
+from core.revisions import REVISION_META_KEY, Revision, load_revision, revision_session
+from core.storage import OutputStore
+
+
+def _drain(stream):
+    statuses = []
+    while True:
+        try:
+            statuses.append(next(stream))
+        except StopIteration as stop:
+            return statuses, stop.value
+
+
+def test_unchanged_texts_and_blocks_are_reused_from_the_base():
+    base = {'translations': {'Time': '时间'}, 'blocks': {}}
+    first = Revision()
+    first.record_block('plt.plot(x)\n', 'opts', 'plt.plot(x, lw=1)\n')
+    base['blocks'] = first.to_record()['blocks']
+
+    revision = Revision(base, base_id='v1')
+    assert revision.reuse_translations({'a': 'Time', 'b': 'Speed'}) == {'a': '时间'}
+    assert revision.reuse_block('plt.plot(x)\n', 'opts') == 'plt.plot(x, lw=1)\n'
+    assert revision.reuse_block('plt.plot(x)\n', 'other opts') is None
+    assert revision.reuse_block('plt.plot(y)\n', 'opts') is None
+    record = revision.to_record()
+    assert record['base'] == 'v1'
+    assert record['translations'] == {'Time': '时间'}
+    assert (revision.reused_translations, revision.reused_blocks) == (1, 1)
+
+
+def test_empty_revision_keeps_the_base_record():
+    base = {'translations': {'Time': '时间'}, 'blocks': {'k': 'v'}}
+    assert Revision(base, 'v1').to_record() == {'base': 'v1', 'translations': base['translations'],
+                                                'blocks': base['blocks'], 'skeletons': {}}
+    assert Revision().to_record()['base'] is None
+
+
+def test_load_revision_reads_the_manifest_meta(tmp_path):
+    store = OutputStore(str(tmp_path / 'outputs'))
+    store.set_meta('job1', REVISION_META_KEY, {'translations': {'a': 'b'}, 'blocks': {}})
+    assert load_revision(store, 'job1')['translations'] == {'a': 'b'}
+    assert load_revision(store, 'missing') is None
+    assert load_revision(store, '../etc') is None
+    assert load_revision(store, None) is None
+
+
+def test_translation_only_requests_new_texts(monkeypatch):
+    requests = []
+
+    def translate(chunk):
+        requests.append(sorted(chunk.values()))
+        return {key: '速度' for key in chunk}
+
+    monkeypatch.setattr(enhanced_agent, '_translate_chunk', translate)
+    monkeypatch.setattr(enhanced_agent, 'get_translation_cache', lambda: None)
+    monkeypatch.setattr(enhanced_agent, 'get_glossary', lambda: None)
+    revision = Revision({'translations': {'Unusual revision title': '少见的版本标题'}}, 'v1')
+    with revision_session(revision):
+        statuses, translations = _drain(enhanced_agent.translate_texts_streaming(
+            {'Unusual revision title': 'Unusual revision title', 'Speed': 'Speed'}))
+    assert translations == {'Unusual revision title': '少见的版本标题', 'Speed': '速度'}
+    assert requests == [['Speed']]
+    assert any('沿用上一版本的译文 1 条' in status for status in statuses)
+    assert revision.to_record()['translations'] == translations
+
+
+SINGLE_FIGURE = (
+    "import matplotlib.pyplot as plt\n"
+    "plt.figure()\n"
+    "plt.plot(__APLOT_DATA_000000000001__)\n"
+    "plt.xlabel('Time')  # horizontal axis\n"
+    "plt.title('Old title')\n"
+    "plt.show()\n"
+)
+SINGLE_FIGURE_REFACTORED = (
+    "import matplotlib.pyplot as plt\n"
+    "fig, ax = plt.subplots(figsize=(3.5, 2.6))\n"
+    "ax.plot(__APLOT_DATA_000000000001__, lw=1)\n"
+    "ax.set_xlabel('Time')  # horizontal axis\n"
+    "ax.set_title('Old title')\n"
+    "plt.show()\n"
+)
+
+
+def _base_with(code, refactored):
+    first = Revision()
+    first.record_block(code, 'opts', refactored)
+    return first.to_record()
+
+
+def test_text_and_data_edits_reuse_the_refactored_block():
+    revision = Revision(_base_with(SINGLE_FIGURE, SINGLE_FIGURE_REFACTORED), 'v1')
+    edited = SINGLE_FIGURE.replace('Old title', 'New title').replace('000000000001', '0000000000ff')
+    reused = revision.reuse_block(edited, 'opts')
+    assert reused == SINGLE_FIGURE_REFACTORED.replace('Old title', 'New title').replace('000000000001', '0000000000ff')
+    assert revision.reused_blocks == 1
+    # 沿用的结果也登记在本版本中，下一版本可以继续对比
+    assert Revision(revision.to_record(), 'v2').reuse_block(edited.replace('Time', 'Seconds'), 'opts') == \
+        reused.replace("'Time'", "'Seconds'")
+
+
+def test_structural_or_unmatched_edits_are_not_reused():
+    revision = Revision(_base_with(SINGLE_FIGURE, SINGLE_FIGURE_REFACTORED), 'v1')
+    assert revision.reuse_block(SINGLE_FIGURE.replace('plt.figure()', 'plt.figure(dpi=200)'), 'opts') is None
+    assert revision.reuse_block(SINGLE_FIGURE.replace('Old title', 'New title'), 'other opts') is None
+    # 模型改写了原文时无法对应新文本
+    rewritten = Revision(_base_with(SINGLE_FIGURE, SINGLE_FIGURE_REFACTORED.replace("'Old title'", "'Title'")), 'v1')
+    assert rewritten.reuse_block(SINGLE_FIGURE.replace('Old title', 'New title'), 'opts') is None
+    assert rewritten.reused_blocks == 0
+
+
+def test_single_figure_label_edit_skips_the_refactor_request(monkeypatch):
+    prompts = []
+
+    def fake_api(prompt, is_json_mode=False):
+        prompts.append(prompt)
+        return prompt.split('```python\n')[-1].rsplit('\n```', 1)[0].replace('plt.plot', 'plt.grid()\nplt.plot')
+
+    monkeypatch.setattr(enhanced_agent, 'call_deepseek_api', fake_api)
+    options = {'enabled': True, 'paper_format': 'nature', 'layout': 'single', 'output_filename_base': 'plot_figure'}
+    code = "import matplotlib.pyplot as plt\nplt.plot([1, 2])\nplt.title('Unedited label')\nplt.show()\n"
+    first = Revision()
+    with revision_session(first):
+        enhanced_agent.refactor_and_style_code(code, options)
+    assert len(prompts) == 1
+
+    second = Revision(first.to_record(), 'v1')
+    with revision_session(second):
+        result = enhanced_agent.refactor_and_style_code(code.replace('Unedited label', 'Edited label'), options)
+    assert len(prompts) == 1
+    assert "plt.grid()" in result and "plt.title('Edited label')" in result
+
+
+def test_base_version_must_belong_to_the_session(web_app, monkeypatch):
+    submitted = []
+
+    def submit(payload, key):
+        submitted.append(payload)
+        return f"job{len(submitted)}", False
+
+    monkeypatch.setattr(web_app.job_manager, 'submit_coalesced', submit)
+    client = web_app.app.test_client()
+
+    def upload(**form):
+        data = dict(form, file=(io.BytesIO(b"import matplotlib.pyplot as plt\n"), 'plot.py'))
+        assert client.post('/process', data=data).status_code == 202
+        return submitted[-1]['base_version']
+
+    assert upload(base_version='someone-elses-job') is None
+    assert upload() == 'job1'
+    assert upload(base_version='job1') == 'job1'
+    assert upload(base_version='someone-elses-job') is None
@@ -0,0 +1,61 @@
+import ast
+
+from core.rewrite import apply_translations, extract_translatable_spans, format_fstring_literal
+
+
+def _texts(source):
+    return [span.text for span in extract_translatable_spans(source)]
+
+
+def test_plot_text_arguments_and_comments_are_extracted():
+    source = (
+        "# Load data\n"
+        "ax.plot(x, y, label='Velocity')  # trailing note\n"
+        "ax.set(title='Overview', xlabel='Time')\n"
+        "ax.legend(['a line'], title='Groups')\n"
+        "ax.set_xticklabels(['Low', 'High'])\n"
+        "plt.text(0, 1, 'Peak')\n"
+    )
+    assert _texts(source) == ['Load data', 'Velocity', 'trailing note', 'Overview', 'Time',
+                              'a line', 'Groups', 'Low', 'High', 'Peak']
+
+
+def test_label_keywords_of_non_plotting_calls_are_left_untouched():
+    source = (
+        "bins = pd.cut(df['age'], bins=3, labels=['young', 'middle', 'old'])\n"
+        "cm = confusion_matrix(y_true, y_pred, labels=['cat', 'dog'])\n"
+        "ax.bar(names, values, label='Counts')\n"
+    )
+    assert _texts(source) == ['Counts']
+    translated = apply_translations(source, extract_translatable_spans(source),
+                                    {'young': '年轻', 'cat': '猫', 'Counts': '数量'})
+    assert "labels=['young', 'middle', 'old']" in translated
+    assert "labels=['cat', 'dog']" in translated
+    assert "label='数量'" in translated
+
+
+def test_directives_mathtext_and_numbers_are_skipped():
+    source = (
+        "#!/usr/bin/env python\n"
+        "# -*- coding: utf-8 -*-\n"
+        "import numpy as np  # noqa: F401\n"
+        "plt.xlabel('$\\\\alpha$')\n"
+        "plt.ylabel('42')\n"
+    )
+    assert _texts(source) == []
+
+
+def test_fstring_templates_keep_their_placeholders():
+    source = "ax.set_title(f'Run {i}: loss={loss:.2f}')\n"
+    spans = extract_translatable_spans(source)
+    assert [(span.kind, span.text) for span in spans] == [('fstring', 'Run {i}: loss={loss:.2f}')]
+    translated = apply_translations(source, spans, {'Run {i}: loss={loss:.2f}': '第 {i} 次运行：损失={loss:.2f}'})
+    assert translated == "ax.set_title(f'第 {i} 次运行：损失={loss:.2f}')\n"
+    assert format_fstring_literal("f'{a} b'", '{c} 乙') is None
+
+
+def test_translations_are_written_back_as_valid_literals():
+    source = "ax.set_title(\"It's done\")\nplt.legend(['x'])\n"
+    translated = apply_translations(source, extract_translatable_spans(source), {"It's done": '完成了"吧"', 'x': '横'})
+    tree = ast.parse(translated)
+    assert [node.value for node in ast.walk(tree) if isinstance(node, ast.Constant)] == ['完成了"吧"', '横']
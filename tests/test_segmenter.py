@@ -0,0 +1,115 @@
+import ast
+import threading
+import time
+
+from core import enhanced_agent
+from core.segmenter import Segment, preamble_of, segment_script, stitch_segments
+
+SCRIPT = (
+    "import matplotlib.pyplot as plt\n"
+    "x = [1, 2, 3]\n"
+    "\n"
+    "# First figure\n"
+    "fig, ax = plt.subplots()\n"
+    "ax.plot(x)\n"
+    "plt.savefig('a.png')\n"
+    "plt.close()\n"
+    "print('between')\n"
+    "plt.figure()\n"
+    "plt.bar(x, x)\n"
+    "plt.show()\n"
+)
+
+
+def test_script_is_split_into_preamble_and_figure_blocks():
+    segments = segment_script(SCRIPT)
+    assert [segment.kind for segment in segments] == ['preamble', 'figure', 'other', 'figure']
+    assert ''.join(segment.code for segment in segments) == SCRIPT
+    assert segments[1].code.startswith('# First figure\n')
+    assert segments[1].code.endswith("plt.close()\n")
+    assert preamble_of(segments) == "import matplotlib.pyplot as plt\nx = [1, 2, 3]\n\n"
+
+
+def test_a_new_figure_ends_an_unfinished_block():
+    source = "plt.figure()\nplt.plot([1])\nplt.figure()\nplt.plot([2])\nplt.show()\n"
+    segments = segment_script(source)
+    assert [segment.code for segment in segments] == ["plt.figure()\nplt.plot([1])\n",
+                                                     "plt.figure()\nplt.plot([2])\nplt.show()\n"]
+
+
+def test_scripts_without_figures_or_sharing_lines_are_not_split():
+    assert segment_script("x = 1\n") == [Segment('preamble', "x = 1\n")]
+    source = "import matplotlib.pyplot as plt; plt.figure()\nplt.show()\n"
+    assert segment_script(source) == [Segment('preamble', source)]
+
+
+def test_stitch_replaces_only_given_segments():
+    segments = segment_script(SCRIPT)
+    replacements = [None, "fig, ax = plt.subplots(figsize=(3, 2))\nax.plot(x)\n\n", None, None]
+    stitched = stitch_segments(segments, replacements)
+    assert stitched.startswith(segments[0].code + "fig, ax = plt.subplots(figsize=(3, 2))\nax.plot(x)\nprint")
+    assert stitched.endswith(segments[3].code)
+
+
+STYLE_OPTIONS = {'enabled': True, 'paper_format': 'nature', 'layout': 'single', 'output_filename_base': 'plot_figure'}
+CONTEXT_MARKER = '公共前置代码（仅供参考'
+
+
+def _code_in_prompt(prompt):
+    return prompt.split('```python\n')[-1].rsplit('\n```', 1)[0]
+
+
+def test_blocks_are_refactored_in_parallel_with_the_preamble_as_context(monkeypatch):
+    both_started = threading.Barrier(2, timeout=5)
+    prompts = []
+
+    def fake_api(prompt, is_json_mode=False):
+        prompts.append(prompt)
+        both_started.wait()  # 两个块的请求必须同时在进行中，串行执行会在这里超时
+        return "# styled\n" + _code_in_prompt(prompt)
+
+    monkeypatch.setattr(enhanced_agent, 'call_deepseek_api', fake_api)
+    stitched = enhanced_agent.refactor_segments(SCRIPT, STYLE_OPTIONS, has_placeholders=False)
+
+    assert len(prompts) == 2
+    assert all(CONTEXT_MARKER in prompt and "x = [1, 2, 3]" in prompt for prompt in prompts)
+    ast.parse(stitched)
+    assert stitched.startswith("import matplotlib.pyplot as plt\nx = [1, 2, 3]\n")
+    assert stitched.count("# styled\n") == 2
+    assert "print('between')" in stitched
+
+
+def test_failed_block_falls_back_without_waiting_for_the_others(monkeypatch):
+    release = threading.Event()
+
+    def fake_api(prompt, is_json_mode=False):
+        if 'plt.bar' in _code_in_prompt(prompt):
+            return "这不是代码"
+        release.wait(5)
+        return _code_in_prompt(prompt)
+
+    monkeypatch.setattr(enhanced_agent, 'call_deepseek_api', fake_api)
+    try:
+        started = time.monotonic()
+        assert enhanced_agent.refactor_segments(SCRIPT, STYLE_OPTIONS, has_placeholders=False) is None
+        assert time.monotonic() - started < 2
+    finally:
+        release.set()
+
+
+def test_unparsable_block_falls_back_to_the_whole_file(monkeypatch):
+    calls = []
+
+    def fake_api(prompt, is_json_mode=False):
+        calls.append(CONTEXT_MARKER in prompt)
+        code = _code_in_prompt(prompt)
+        if CONTEXT_MARKER in prompt and 'plt.bar' in code:
+            return "plt.bar(x, x"
+        return code
+
+    monkeypatch.setattr(enhanced_agent, 'call_deepseek_api', fake_api)
+    result = enhanced_agent.refactor_and_style_code(SCRIPT, STYLE_OPTIONS)
+    # 两个块请求之后是一次整文件请求
+    assert sorted(calls) == [False, True, True]
+    assert "plt.bar(x, x)" in result
+    ast.parse(result)
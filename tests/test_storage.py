@@ -0,0 +1,67 @@
+import os
+
+from core.jobs import SUCCEEDED, JobManager
+from core.storage import OutputStore, StorageJanitor
+
+
+def _write(path, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def _jobs(tmp_path):
+    jobs = JobManager(str(tmp_path / 'jobs.sqlite3'), lambda job_id, payload: iter(()))
+    # 不启动工作线程，排队的任务保持排队状态
+    jobs.start = lambda: None
+    return jobs
+
+
+def test_outputs_are_deduplicated_by_content(tmp_path):
+    store = OutputStore(str(tmp_path / 'outputs'))
+    source = tmp_path / 'a.py'
+    source.write_text('print(1)\n')
+    first = store.add_file('job1', 'a.py', str(source))
+    second = store.add_file('job2', 'b.py', str(source))
+    assert first['sha256'] == second['sha256']
+    assert store.stats()['objects'] == 1
+    assert store.resolve('job2', 'b.py')['size'] == len('print(1)\n')
+    assert store.resolve('job2', 'missing.py') is None
+
+
+def test_janitor_keeps_upload_folders_in_use_when_over_budget(tmp_path):
+    uploads = tmp_path / 'temp'
+    _write(str(uploads / 'queued' / 'a.py'), 200)
+    _write(str(uploads / 'stale' / 'b.py'), 200)
+    janitor = StorageJanitor(OutputStore(str(tmp_path / 'outputs')), str(uploads), max_bytes=100,
+                             in_use=lambda: [str(uploads / 'queued')])
+    janitor.run_once()
+    assert (uploads / 'queued' / 'a.py').exists()
+    assert not (uploads / 'stale').exists()
+
+
+def test_janitor_prunes_finished_jobs_with_their_outputs(tmp_path):
+    jobs = _jobs(tmp_path)
+    finished = jobs.submit({'filepath': 'x'})
+    jobs.append_event(finished, {'status': 'working'})
+    jobs._finish(finished, SUCCEEDED, result={'success': True})
+    queued = jobs.submit({'filepath': 'y'})
+
+    store = OutputStore(str(tmp_path / 'outputs'))
+    source = tmp_path / 'a.py'
+    source.write_text('print(1)\n')
+    store.add_file(finished, 'a.py', str(source))
+
+    janitor = StorageJanitor(store, str(tmp_path / 'temp'), output_ttl=-1, jobs=jobs)
+    janitor.run_once()
+    assert jobs.get(finished) is None
+    assert jobs.events_after(finished) == []
+    assert jobs.get(queued) is not None
+    assert store.load_manifest(finished) is None
+    assert janitor.stats()['pruned_jobs'] == 1
+
+
+def test_active_payloads_lists_queued_jobs(tmp_path):
+    jobs = _jobs(tmp_path)
+    jobs.submit({'filepath': '/uploads/abc/a.py'})
+    assert jobs.active_payloads() == [{'filepath': '/uploads/abc/a.py'}]
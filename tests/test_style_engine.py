@@ -0,0 +1,61 @@
+import ast
+
+import pytest
+
+from core.style_engine import STYLE_BLOCK_MARKER, transform_academic_style
+
+STYLE_BLOCK = f"# {STYLE_BLOCK_MARKER}\nplt.rcParams.update({{'font.size': 8}})\n"
+
+
+def _transform(code, vector_format='pdf'):
+    return transform_academic_style(code, STYLE_BLOCK, (3.5, 2.6), vector_format, 'demo_figure', dpi=600)
+
+
+def test_figsize_style_block_and_savefig_are_applied():
+    code = (
+        "import matplotlib.pyplot as plt\n"
+        "fig, ax = plt.subplots(figsize=(10, 4))\n"
+        "ax.plot([1, 2])\n"
+        "plt.show()\n"
+    )
+    result, notes = _transform(code)
+    ast.parse(result)
+    assert "plt.subplots(figsize=(3.5, 2.6))" in result
+    assert result.index(STYLE_BLOCK_MARKER) < result.index('plt.subplots')
+    assert "plt.savefig('demo_figure.pdf', bbox_inches='tight', dpi=600)\nplt.show()" in result
+    assert len(notes) == 3
+
+
+def test_each_show_gets_a_numbered_savefig_and_aliases_are_respected():
+    code = (
+        "from matplotlib import pyplot as mpl\n"
+        "mpl.figure()\n"
+        "mpl.show()\n"
+        "fig = mpl.figure(dpi=100)\n"
+        "fig.show()\n"
+    )
+    result, _ = _transform(code, vector_format='svg')
+    assert "mpl.figure(figsize=(3.5, 2.6))" in result
+    assert "mpl.figure(dpi=100, figsize=(3.5, 2.6))" in result
+    assert "mpl.savefig('demo_figure_1.svg'" in result
+    assert "fig.savefig('demo_figure_2.svg'" in result
+    assert "mpl.rcParams.update" in result
+
+
+def test_style_is_not_injected_twice_and_existing_savefig_is_kept():
+    code = (
+        "import matplotlib.pyplot as plt\n"
+        f"# {STYLE_BLOCK_MARKER}\n"
+        "plt.plot([1])\n"
+        "plt.savefig('mine.png')\n"
+        "plt.show()\n"
+    )
+    result, notes = _transform(code)
+    assert result.count(STYLE_BLOCK_MARKER) == 1
+    assert 'demo_figure' not in result
+    assert "代码中已包含学术风格设置，跳过注入" in notes
+
+
+def test_unparsable_code_raises_syntax_error():
+    with pytest.raises(SyntaxError):
+        _transform("plt.plot(\n")
@@ -0,0 +1,43 @@
+import pytest
+
+from core import tracing
+from core.tracing import Trace, record_span, span, trace_session
+
+
+def test_spans_are_recorded_per_thread_in_chrome_format():
+    trace = Trace('job1')
+    with trace_session(trace):
+        with span('outer', 'stage') as args:
+            args['tokens'] = 3
+        with pytest.raises(ValueError):
+            with span('broken'):
+                raise ValueError('boom')
+        record_span('waited', 'deepseek', 0.5)
+    with span('untraced'):
+        pass
+    data = trace.to_chrome()
+    events = [event for event in data['traceEvents'] if event['ph'] == 'X']
+    assert [event['name'] for event in events] == ['waited', 'outer', 'broken']
+    assert events[1]['args'] == {'tokens': 3}
+    assert events[2]['args'] == {'error': 'ValueError'}
+    assert events[0]['dur'] == pytest.approx(500000, rel=0.01)
+    assert data['otherData'] == {'trace_id': 'job1', 'dropped_events': 0}
+
+
+def test_events_beyond_the_limit_are_dropped(monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACE_MAX_EVENTS', 2)
+    trace = Trace('job2')
+    for i in range(5):
+        trace.add_span(f"s{i}", 'stage', 1.0, 2.0)
+    assert trace.dropped == 3
+    assert len([event for event in trace.to_chrome()['traceEvents'] if event['ph'] == 'X']) == 2
+
+
+def test_trace_endpoint_is_disabled_by_default(web_app, monkeypatch):
+    monkeypatch.setattr(web_app.job_manager, 'trace', lambda job_id: {'traceEvents': []})
+    client = web_app.app.test_client()
+    assert client.get('/debug/trace/abc').status_code == 404
+    monkeypatch.setattr(web_app, 'DEBUG_TRACE_ENABLED', True)
+    response = client.get('/debug/trace/abc')
+    assert response.status_code == 200
+    assert response.get_json() == {'traceEvents': []}
@@ -0,0 +1,110 @@
+import json
+
+import pytest
+import requests
+
+from core.deepseek_client import DeepSeekAPIError, DeepSeekClient
+from core.rate_limit import RateGovernor
+from core.transport import CassetteStore, RecordingTransport, ReplayTransport, cassette_key, create_transport
+
+STREAM_BODY = (
+    'data: {"choices": [{"delta": {"content": "plt.title(\\"温度\\")"}}]}\n\n'
+    'data: {"choices": [{"delta": {"content": "\\nplt.show()"}}], "usage": {"total_tokens": 7}}\n\n'
+    'data: [DONE]\n\n'
+).encode('utf-8')
+
+
+class FakeResponse:
+    def __init__(self, status_code, body, content_type='text/event-stream'):
+        self.status_code = status_code
+        self.content = body
+        self.headers = requests.structures.CaseInsensitiveDict({'Content-Type': content_type})
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8')
+
+    def iter_lines(self):
+        return iter(self.content.splitlines())
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeSession:
+    """代替 requests.Session 的线上 API：返回固定的响应并记录请求次数。"""
+
+    def __init__(self, response):
+        self.response = response
+        self.calls = 0
+
+    def post(self, url, json=None, timeout=None, stream=False):
+        self.calls += 1
+        return self.response
+
+
+def make_client(transport):
+    governor = RateGovernor(requests_per_minute=0, tokens_per_minute=0, max_in_flight=2)
+    return DeepSeekClient('http://deepseek.invalid/chat/completions', 'key', transport=transport,
+                          governor=governor, backoff_base=0, backoff_max=0)
+
+
+def payload(text='翻译这段代码'):
+    return {'model': 'deepseek-chat', 'messages': [{'role': 'user', 'content': text}]}
+
+
+def test_recorded_stream_replays_byte_for_byte(tmp_path):
+    session = FakeSession(FakeResponse(200, STREAM_BODY))
+    live = list(make_client(create_transport(session, 'live', str(tmp_path))).chat_stream(payload()))
+    recorded = list(make_client(create_transport(session, 'record', str(tmp_path))).chat_stream(payload()))
+    assert session.calls == 2
+
+    replay = create_transport(None, 'replay', str(tmp_path))
+    replayed = list(make_client(replay).chat_stream(payload()))
+    assert session.calls == 2
+    assert live == recorded == replayed == ['plt.title("温度")', '\nplt.show()']
+
+    stream_payload = dict(payload(), stream=True, stream_options={'include_usage': True})
+    response = replay.post('http://deepseek.invalid', stream_payload, timeout=1, stream=True)
+    assert response.content == STREAM_BODY
+    assert list(response.iter_lines()) == STREAM_BODY.splitlines()
+    assert response.headers['content-type'] == 'text/event-stream'
+
+
+def test_json_response_round_trip(tmp_path):
+    body = json.dumps({'choices': [{'message': {'content': '图例'}}]}, ensure_ascii=False).encode('utf-8')
+    session = FakeSession(FakeResponse(200, body, 'application/json'))
+    cassettes = CassetteStore(str(tmp_path))
+    recorded = make_client(RecordingTransport(session, cassettes)).chat(payload())
+    response = ReplayTransport(cassettes).post('http://deepseek.invalid', payload(), timeout=1)
+    assert response.content == body
+    assert make_client(ReplayTransport(cassettes)).chat(payload()) == recorded
+
+
+def test_errors_are_not_recorded(tmp_path):
+    cassettes = CassetteStore(str(tmp_path))
+    transport = RecordingTransport(FakeSession(FakeResponse(500, b'oops', 'text/plain')), cassettes)
+    assert transport.post('http://deepseek.invalid', payload(), timeout=1).status_code == 500
+    assert cassettes.load(cassette_key(payload())) is None
+
+
+def test_replay_without_recording_fails_without_retrying(tmp_path):
+    cassettes = CassetteStore(str(tmp_path))
+    RecordingTransport(FakeSession(FakeResponse(200, STREAM_BODY)), cassettes).post(
+        'http://deepseek.invalid', payload(), timeout=1)
+
+    # 消息内容不同即为不同的请求，回放模式下不会退回到其它录像或网络
+    response = ReplayTransport(cassettes).post('http://deepseek.invalid', payload('另一段代码'), timeout=1)
+    assert response.status_code == 404
+    assert response.json()['error']['type'] == 'cassette_miss'
+
+    with pytest.raises(DeepSeekAPIError) as info:
+        make_client(ReplayTransport(cassettes)).chat(payload('另一段代码'))
+    assert info.value.status_code == 404
+    assert info.value.retryable is False